@@ -0,0 +1,155 @@
+import logging
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+from src.ai.nlp.prompt_creator import SystemPromptParts, estimate_destination_tokens
+from src.ai.nlp.token_counter import estimate_tokens
+
+logger = logging.getLogger("ContextBudget")
+
+DEFAULT_CONTEXT_BUDGET_CONFIG: Dict[str, Any] = {
+    "max_history_messages": 20,
+    "min_history_messages": 2,
+    "min_destinations": 5,
+    "safety_margin_tokens": 256,
+    "message_overhead_tokens": 4,
+    "adaptive_num_ctx": False,
+    "num_ctx_buckets": [2048, 4096, 8192],
+}
+
+
+class ContextPlan(NamedTuple):
+    """Contexto de un turno ajustado al presupuesto de tokens."""
+    prompt_parts: SystemPromptParts
+    history: List[dict]
+    destinations: List[dict]
+    prompt_tokens: int
+    num_ctx: int
+
+
+class ContextBudgeter:
+    """
+    Ajusta el historial y los destinos candidatos de cada turno a la ventana de contexto.
+
+    Estima los tokens del system prompt, el historial, los destinos y el mensaje del usuario
+    frente a `num_ctx` menos los tokens reservados para la respuesta (`max_tokens`). Si no cabe,
+    descarta primero los mensajes más antiguos del historial y después los destinos peor
+    clasificados. Con `adaptive_num_ctx` pide a Ollama la ventana más pequeña de `num_ctx_buckets`
+    en la que cabe el turno, para que reserve menos memoria de caché KV.
+    """
+
+    def __init__(self, model_config: Dict[str, Any], config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            model_config (Dict[str, Any]): Sección `model` (`num_ctx`, `max_tokens`).
+            config (Optional[Dict[str, Any]]): Sección `context_budget` de la configuración.
+        """
+        config = {**DEFAULT_CONTEXT_BUDGET_CONFIG, **(config or {})}
+        self.num_ctx: int = int(model_config.get("num_ctx", 8192))
+        self._max_tokens: int = int(model_config.get("max_tokens", 1024))
+        self.max_history_messages: int = int(config["max_history_messages"])
+        self._min_history: int = int(config["min_history_messages"])
+        self._min_destinations: int = int(config["min_destinations"])
+        self._margin: int = int(config["safety_margin_tokens"])
+        self._overhead: int = int(config["message_overhead_tokens"])
+        self._adaptive: bool = bool(config["adaptive_num_ctx"])
+        self._buckets: List[int] = sorted(int(b) for b in config["num_ctx_buckets"] if int(b) <= self.num_ctx)
+        self._stats: Dict[str, Any] = {
+            "turns": 0,
+            "history_trimmed": 0,
+            "destinations_trimmed": 0,
+            "over_budget": 0,
+            "num_ctx": {},
+        }
+
+    @property
+    def prompt_budget(self) -> int:
+        """Tokens disponibles para la entrada: `num_ctx` menos la respuesta y el margen."""
+        return self.num_ctx - self._max_tokens - self._margin
+
+    def fit(
+        self,
+        render_prompt: Callable[[List[dict]], SystemPromptParts],
+        history: List[dict],
+        destinations: List[dict],
+        user_prompt: str,
+        summary: Optional[str] = None,
+    ) -> ContextPlan:
+        """
+        Recorta el historial y los destinos hasta que el turno quepa en el presupuesto.
+
+        Args:
+            render_prompt (Callable[[List[dict]], SystemPromptParts]): Renderiza el system prompt
+                con la lista de destinos indicada.
+            history (List[dict]): Historial en orden cronológico (se recorta desde el principio).
+            destinations (List[dict]): Destinos ordenados por relevancia (se recortan desde el final).
+            user_prompt (str): Mensaje actual del usuario.
+            summary (Optional[str]): Mensaje con el resumen de la conversación antigua, que
+                siempre se envía y ocupa parte del presupuesto.
+
+        Returns:
+            ContextPlan: System prompt, historial y destinos finales, tokens estimados y `num_ctx`.
+        """
+        budget = self.prompt_budget
+        prompt_parts = render_prompt(destinations)
+        pinned_tokens = estimate_tokens(user_prompt) + self._overhead
+        if summary:
+            pinned_tokens += estimate_tokens(summary) + self._overhead
+        fixed_tokens = self._prompt_tokens(prompt_parts) + pinned_tokens
+        history_tokens = [estimate_tokens(m.get("content", "")) + self._overhead for m in history]
+        total = fixed_tokens + sum(history_tokens)
+
+        history_start = 0
+        while total > budget and len(history) - history_start > self._min_history:
+            total -= history_tokens[history_start]
+            history_start += 1
+
+        kept_destinations = len(destinations)
+        if total > budget and kept_destinations > self._min_destinations:
+            while total > budget and kept_destinations > self._min_destinations:
+                kept_destinations -= 1
+                total -= estimate_destination_tokens(destinations[kept_destinations])
+            prompt_parts = render_prompt(destinations[:kept_destinations])
+            fixed_tokens = self._prompt_tokens(prompt_parts) + pinned_tokens
+            total = fixed_tokens + sum(history_tokens[history_start:])
+
+        while total > budget and history_start < len(history):
+            total -= history_tokens[history_start]
+            history_start += 1
+
+        self._stats["turns"] += 1
+        if history_start:
+            self._stats["history_trimmed"] += 1
+        if kept_destinations < len(destinations):
+            self._stats["destinations_trimmed"] += 1
+        if total > budget:
+            self._stats["over_budget"] += 1
+            logger.warning(f"El turno sigue superando el presupuesto de contexto: {total} > {budget} tokens estimados.")
+        if history_start or kept_destinations < len(destinations):
+            logger.info(
+                f"Contexto recortado a {total}/{budget} tokens: {len(history) - history_start}/{len(history)} mensajes "
+                f"de historial, {kept_destinations}/{len(destinations)} destinos."
+            )
+
+        num_ctx = self._select_num_ctx(total)
+        self._stats["num_ctx"][num_ctx] = self._stats["num_ctx"].get(num_ctx, 0) + 1
+        return ContextPlan(prompt_parts, history[history_start:], destinations[:kept_destinations], total, num_ctx)
+
+    def _prompt_tokens(self, prompt_parts: SystemPromptParts) -> int:
+        """Tokens del system prompt (uno o dos mensajes de sistema)."""
+        messages = [part for part in (prompt_parts.cacheable, prompt_parts.volatile_context) if part]
+        return sum(estimate_tokens(part) + self._overhead for part in messages)
+
+    def _select_num_ctx(self, prompt_tokens: int) -> int:
+        """Ventana más pequeña en la que caben la entrada, la respuesta y el margen."""
+        if not self._adaptive:
+            return self.num_ctx
+        needed = prompt_tokens + self._max_tokens + self._margin
+        return next((bucket for bucket in self._buckets if bucket >= needed), self.num_ctx)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve cuántos turnos se recortaron y la distribución de `num_ctx` usada."""
+        return {
+            **self._stats,
+            "num_ctx": dict(self._stats["num_ctx"]),
+            "prompt_budget": self.prompt_budget,
+            "adaptive_num_ctx": self._adaptive,
+        }
@@ -0,0 +1,216 @@
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Optional
+from src.ai.nlp.history_store import HistoryStore
+from src.ai.nlp.llm_scheduler import LLMScheduler, LLMSchedulerOverloaded, LANE_BATCH
+
+logger = logging.getLogger("ConversationSummarizer")
+
+DEFAULT_SUMMARY_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    "min_new_messages": 8,
+    "max_fold_messages": 40,
+    "max_message_chars": 1000,
+    "max_summary_tokens": 256,
+    "temperature": 0.2,
+}
+
+_SUMMARY_INSTRUCTIONS = (
+    "Eres un asistente que resume conversaciones entre un usuario y un asistente de viajes. "
+    "Actualiza el resumen previo con los mensajes nuevos. Conserva los datos útiles para continuar "
+    "la conversación: destinos mencionados o recomendados, preferencias, presupuesto, fechas, "
+    "decisiones tomadas y preguntas pendientes. Omite saludos y cortesías. Escribe en español, "
+    "en tercera persona y en un solo párrafo breve. Responde solo con el resumen."
+)
+_ROLE_LABELS = {"user": "Usuario", "assistant": "Asistente"}
+
+
+class ConversationSummarizer:
+    """
+    Resume en segundo plano los mensajes antiguos de cada conversación.
+
+    Tras cada turno, si hay suficientes mensajes que ya no entran en la ventana de historial
+    (los más recientes `keep_recent`), se pliegan en un resumen acumulado que se guarda en el
+    HistoryStore. Mientras se acumulan, el turno amplía su historial hasta donde llega el
+    resumen (`history_limits`), de modo que ningún mensaje queda fuera de ambos; si el
+    presupuesto de contexto recorta el historial, el siguiente resumen pliega lo recortado
+    (`note_trimmed`). Nunca se ejecuta dentro de un turno: la generación usa el carril `batch`
+    del planificador, así que cede los slots a las solicitudes interactivas.
+    """
+
+    def __init__(
+        self,
+        config: Optional[Dict[str, Any]],
+        history_store: HistoryStore,
+        ollama_manager,
+        scheduler: LLMScheduler,
+        model_config: Dict[str, Any],
+        keep_recent: int,
+    ):
+        """
+        Args:
+            config (Optional[Dict[str, Any]]): Sección `summaries` de la configuración.
+            history_store (HistoryStore): Almacén del historial y de los resúmenes.
+            ollama_manager (OllamaManager): Gestor de Ollama para generar los resúmenes.
+            scheduler (LLMScheduler): Planificador compartido de generaciones.
+            model_config (Dict[str, Any]): Sección `model` (nombre del modelo y `keep_alive`).
+            keep_recent (int): Mensajes recientes que se envían tal cual y no se resumen.
+        """
+        config = {**DEFAULT_SUMMARY_CONFIG, **(config or {})}
+        self.enabled: bool = bool(config["enabled"])
+        self._min_new: int = int(config["min_new_messages"])
+        self._max_fold: int = int(config["max_fold_messages"])
+        self._max_message_chars: int = int(config["max_message_chars"])
+        self._max_summary_tokens: int = int(config["max_summary_tokens"])
+        self._temperature: float = float(config["temperature"])
+        self._history_store = history_store
+        self._ollama_manager = ollama_manager
+        self._scheduler = scheduler
+        self._model_config = model_config
+        self._keep_recent = keep_recent
+
+        self._tasks: Dict[str, asyncio.Task] = {}
+        # Mensajes de historial que cupieron en el último turno de cada usuario cuyo contexto se recortó.
+        self._trimmed: Dict[str, int] = {}
+        self._stats: Dict[str, Any] = {
+            "scheduled": 0,
+            "summaries": 0,
+            "messages_folded": 0,
+            "skipped_overloaded": 0,
+            "errors": 0,
+            "summary_ms_total": 0.0,
+        }
+
+    async def get_summary(self, user_id: str) -> Optional[dict]:
+        """
+        Devuelve el resumen de la conversación antigua del usuario, si existe.
+
+        Returns:
+            Optional[dict]: {"content", "covered_until"} o None.
+        """
+        if not self.enabled:
+            return None
+        return await self._history_store.get_summary(user_id)
+
+    def history_limits(self, summary: Optional[dict]) -> Optional[tuple]:
+        """
+        Mensajes de historial que debe cargar el turno para enlazar con el resumen.
+
+        Returns:
+            Optional[tuple]: (desde, mínimo, máximo) para `HistoryStore.get_since`, o None si no
+                hay resúmenes y basta la ventana reciente.
+        """
+        if not self.enabled:
+            return None
+        covered = summary["covered_until"] if summary else 0
+        # Si el resumen se queda atrás (planificador saturado), el exceso se recorta por el principio.
+        return covered, self._keep_recent, self._keep_recent + self._max_fold
+
+    def note_trimmed(self, user_id: str, kept: int) -> None:
+        """
+        Anota que el presupuesto de contexto solo dejó `kept` mensajes del historial: el siguiente
+        resumen pliega todo lo anterior, aunque no llegue a `min_new_messages`.
+        """
+        if self.enabled:
+            self._trimmed[str(user_id)] = kept
+
+    def schedule(self, user_id: str) -> None:
+        """
+        Lanza en segundo plano la actualización del resumen del usuario, si no hay otra en curso.
+        Se llama después de guardar el turno; no espera a que termine.
+        """
+        if not self.enabled:
+            return
+        user_key = str(user_id)
+        task = self._tasks.get(user_key)
+        if task is not None and not task.done():
+            return
+        self._stats["scheduled"] += 1
+        task = asyncio.create_task(self._summarize(user_key))
+        self._tasks[user_key] = task
+        task.add_done_callback(lambda done: self._forget(user_key, done))
+
+    def _forget(self, user_key: str, task: asyncio.Task) -> None:
+        """Retira la tarea terminada del registro de resúmenes en curso."""
+        if self._tasks.get(user_key) is task:
+            del self._tasks[user_key]
+
+    async def _summarize(self, user_key: str) -> None:
+        """Pliega en el resumen los mensajes que han salido de la ventana reciente, por tandas."""
+        kept = self._trimmed.pop(user_key, None)
+        try:
+            summary = await self._history_store.get_summary(user_key)
+            covered = summary["covered_until"] if summary else 0
+            text = summary["content"] if summary else ""
+            keep_recent = self._keep_recent if kept is None else min(kept, self._keep_recent)
+            min_new = self._min_new if kept is None else 1
+            fold_until = await self._history_store.count_messages(user_key) - keep_recent
+
+            while fold_until - covered >= min_new:
+                messages = await self._history_store.get_range(user_key, covered, min(self._max_fold, fold_until - covered))
+                if not messages:
+                    break
+                start = time.perf_counter()
+                text = await self._generate_summary(user_key, text, messages)
+                covered += len(messages)
+                await self._history_store.set_summary(user_key, text, covered)
+
+                elapsed_ms = (time.perf_counter() - start) * 1000
+                self._stats["summaries"] += 1
+                self._stats["messages_folded"] += len(messages)
+                self._stats["summary_ms_total"] += elapsed_ms
+                logger.info(f"Resumen de {user_key} actualizado: {covered} mensajes resumidos en {elapsed_ms:.0f} ms.")
+        except LLMSchedulerOverloaded:
+            # Se reintentará tras el próximo turno del usuario.
+            if kept is not None:
+                self._trimmed.setdefault(user_key, kept)
+            self._stats["skipped_overloaded"] += 1
+            logger.info(f"Resumen de {user_key} aplazado: planificador del LLM saturado.")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self._stats["errors"] += 1
+            logger.error(f"Error al resumir la conversación de {user_key}: {e}")
+
+    async def _generate_summary(self, user_key: str, previous_summary: str, messages: List[dict]) -> str:
+        """Pide al modelo el resumen actualizado con los mensajes nuevos."""
+        transcript = "\n".join(
+            f"{_ROLE_LABELS.get(m['role'], m['role'])}: {m['content'][:self._max_message_chars]}"
+            for m in messages
+            if m.get("role") in _ROLE_LABELS
+        )
+        content = f"Resumen previo:\n{previous_summary or '(sin resumen)'}\n\nMensajes nuevos:\n{transcript}"
+        options = {"temperature": self._temperature, "num_predict": self._max_summary_tokens}
+        if "num_ctx" in self._model_config:
+            # Con el mismo num_ctx que los turnos Ollama no tiene que recargar el modelo.
+            options["num_ctx"] = self._model_config["num_ctx"]
+        async with self._scheduler.slot(LANE_BATCH), self._ollama_manager.acquire(user_key) as client:
+            response = await client.chat(
+                model=self._model_config["name"],
+                messages=[
+                    {"role": "system", "content": _SUMMARY_INSTRUCTIONS},
+                    {"role": "user", "content": content},
+                ],
+                options=options,
+                keep_alive=self._model_config.get("keep_alive"),
+            )
+        return response["message"]["content"].strip()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores de resúmenes y su duración media."""
+        summaries = self._stats["summaries"]
+        return {
+            **{key: value for key, value in self._stats.items() if key != "summary_ms_total"},
+            "enabled": self.enabled,
+            "in_progress": sum(1 for task in self._tasks.values() if not task.done()),
+            "summary_ms_avg": round(self._stats["summary_ms_total"] / summaries, 1) if summaries else 0.0,
+        }
+
+    async def aclose(self) -> None:
+        """Cancela los resúmenes en curso; se retomarán tras el próximo turno de cada usuario."""
+        tasks = [task for task in self._tasks.values() if not task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._tasks.clear()
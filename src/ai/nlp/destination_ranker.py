@@ -0,0 +1,233 @@
+import logging
+import re
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional
+import numpy as np
+
+logger = logging.getLogger("DestinationRanker")
+
+DEFAULT_RANKING_CONFIG: Dict[str, Any] = {
+    "top_k": 20,
+    "weights": {
+        "category": 3.0,
+        "location": 2.0,
+        "interests": 1.0,
+        "dislikes": -3.0,
+        "budget_fit": 0.5,
+        "query": 4.0,
+    },
+}
+
+_TOKEN_REGEX = re.compile(r"\w+")
+# Palabras demasiado cortas para distinguir destinos ("de", "la", "en"...).
+_MIN_TOKEN_LENGTH = 3
+
+
+def _fold(text: Any) -> str:
+    """Minúsculas y sin tildes, para comparar textos del catálogo con las preferencias."""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def _tokens(value: Any) -> List[str]:
+    """Extrae las palabras significativas de una preferencia (texto, lista o diccionario)."""
+    if value is None:
+        return []
+    if isinstance(value, dict):
+        value = list(value.values())
+    if isinstance(value, (list, tuple, set)):
+        return [token for item in value for token in _tokens(item)]
+    return [token for token in _TOKEN_REGEX.findall(_fold(value)) if len(token) >= _MIN_TOKEN_LENGTH]
+
+
+class RankingFeatures:
+    """
+    Características del catálogo para el ranking: precios, categorías, ubicaciones y un índice de
+    palabras de nombre, descripción, categoría y ubicación, como arrays de NumPy.
+
+    Se construyen una sola vez por versión del catálogo, junto a su snapshot y en el mismo hilo
+    (ver `DestinationCatalog.register_features`), y no se modifican después: un turno en curso
+    puede seguir usando las anteriores mientras se publica una versión nueva.
+    """
+
+    def __init__(self, destinations: List[dict]):
+        """
+        Args:
+            destinations (List[dict]): Catálogo completo, ordenado por precio.
+        """
+        start = time.perf_counter()
+        self.destinations: List[dict] = list(destinations)
+        self.index_by_id: Dict[str, int] = {d["id"]: i for i, d in enumerate(destinations) if d.get("id")}
+        self.prices = np.array([float(d.get("precio") or 0.0) for d in destinations], dtype=np.float64)
+
+        self.category_index: Dict[str, int] = {}
+        self.category_codes = np.array(
+            [self.category_index.setdefault(_fold(d.get("category") or "").strip(), len(self.category_index)) for d in destinations],
+            dtype=np.int32,
+        )
+
+        location_postings: Dict[str, List[int]] = {}
+        postings: Dict[str, List[int]] = {}
+        for i, d in enumerate(destinations):
+            for token in set(_tokens(d.get("location"))):
+                location_postings.setdefault(token, []).append(i)
+            for token in set(_tokens([d.get("name"), d.get("description"), d.get("category"), d.get("location")])):
+                postings.setdefault(token, []).append(i)
+        self.location_postings: Dict[str, np.ndarray] = {
+            token: np.array(indices, dtype=np.int32) for token, indices in location_postings.items()
+        }
+        self.postings: Dict[str, np.ndarray] = {token: np.array(indices, dtype=np.int32) for token, indices in postings.items()}
+
+        self.build_ms: float = round((time.perf_counter() - start) * 1000, 2)
+        logger.info(
+            f"Características del ranking construidas: {len(destinations)} destinos, "
+            f"{len(self.postings)} palabras en {self.build_ms:.1f} ms."
+        )
+
+    def __len__(self) -> int:
+        return len(self.destinations)
+
+
+class DestinationRanker:
+    """
+    Ordena el catálogo de destinos según las preferencias del usuario.
+
+    Trabaja sobre las `RankingFeatures` de la versión actual del catálogo, que se construyen
+    fuera del bucle de eventos con cada refresco. Cada consulta solo suma puntuaciones
+    vectorizadas y elige los `top_k` mejores, sin recorrer los destinos en Python.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            config (Optional[Dict[str, Any]]): Sección `ranking` de la configuración
+                (`top_k` y los pesos `weights` de cada criterio).
+        """
+        config = config or {}
+        self.top_k: int = int(config.get("top_k", DEFAULT_RANKING_CONFIG["top_k"]))
+        self._weights: Dict[str, float] = {**DEFAULT_RANKING_CONFIG["weights"], **config.get("weights", {})}
+        self._features: Optional[RankingFeatures] = None
+        self._stats: Dict[str, Any] = {"rankings": 0, "feature_sets": 0, "rank_ms_total": 0.0, "rank_ms_max": 0.0}
+
+    def rank(
+        self,
+        features: RankingFeatures,
+        preferences: Optional[dict],
+        top_k: Optional[int] = None,
+        query_scores: Optional[Dict[str, float]] = None,
+    ) -> List[dict]:
+        """
+        Devuelve los destinos más afines al usuario, de mayor a menor puntuación.
+
+        Args:
+            features (RankingFeatures): Características de la versión actual del catálogo
+                (`DestinationCatalog.get_features`).
+            preferences (Optional[dict]): `preferences_dict` del usuario.
+            top_k (Optional[int]): Número de destinos a devolver (por defecto, `top_k` de la configuración).
+            query_scores (Optional[Dict[str, float]]): Relevancia de cada destino (por ID) para el
+                mensaje del usuario, por ejemplo BM25 de `DestinationCatalog.score_query`. Se normaliza
+                y se suma con el peso `query`, de modo que lo que pide el usuario prima sobre su perfil.
+
+        Returns:
+            List[dict]: Como mucho `top_k` destinos dentro del presupuesto del usuario, si lo tiene.
+                A igualdad de puntuación se conserva el orden del catálogo (por precio).
+        """
+        if features is not self._features:
+            self._features = features
+            self._stats["feature_sets"] += 1
+
+        start = time.perf_counter()
+        preferences = preferences or {}
+        k = self.top_k if top_k is None else top_k
+        scores = self._score(features, preferences)
+        if query_scores:
+            self._add_query_scores(features, scores, query_scores)
+
+        if scores.size and k > 0:
+            candidates = np.flatnonzero(np.isfinite(scores))
+            if candidates.size > k:
+                # argpartition sobre -puntuación elige los k mejores; luego se ordenan de forma estable.
+                best = np.argpartition(-scores[candidates], k - 1)[:k]
+                candidates = np.sort(candidates[best])
+            order = candidates[np.argsort(-scores[candidates], kind="stable")]
+            ranked = [features.destinations[i] for i in order]
+        else:
+            ranked = []
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._stats["rankings"] += 1
+        self._stats["rank_ms_total"] += elapsed_ms
+        self._stats["rank_ms_max"] = max(self._stats["rank_ms_max"], elapsed_ms)
+        return ranked
+
+    def _score(self, features: RankingFeatures, preferences: dict) -> np.ndarray:
+        """Puntuación de cada destino; -inf para los que quedan fuera del presupuesto."""
+        weights = self._weights
+        scores = np.zeros(len(features), dtype=np.float64)
+
+        budget = preferences.get("preferencia_precio")
+        if budget is not None:
+            try:
+                budget = float(budget)
+            except (TypeError, ValueError):
+                budget = None
+        if budget is not None and budget > 0:
+            within_budget = features.prices <= budget
+            # Cuanto más se aprovecha el presupuesto, más se ajusta al nivel de viaje que busca el usuario.
+            scores += weights["budget_fit"] * np.clip(features.prices / budget, 0.0, 1.0)
+            scores[~within_budget] = -np.inf
+
+        category = preferences.get("categoria_favorita")
+        if category is not None:
+            code = features.category_index.get(_fold(category).strip())
+            if code is not None:
+                scores += weights["category"] * (features.category_codes == code)
+
+        location_tokens = set(_tokens(preferences.get("ubicacion_favorita")))
+        if location_tokens:
+            # Coincide la ubicación que contiene todas las palabras de la preferida ("Cartagena, Colombia").
+            matches = np.zeros(len(features), dtype=np.int32)
+            for token in location_tokens:
+                postings = features.location_postings.get(token)
+                if postings is not None:
+                    matches[postings] += 1
+            scores += weights["location"] * (matches == len(location_tokens))
+
+        interests = set(_tokens(preferences.get("activities"))) | set(_tokens(preferences.get("placeTypes")))
+        self._add_token_scores(features, scores, interests, weights["interests"])
+        self._add_token_scores(features, scores, set(_tokens(preferences.get("no_le_gusta"))), weights["dislikes"])
+        return scores
+
+    def _add_query_scores(self, features: RankingFeatures, scores: np.ndarray, query_scores: Dict[str, float]) -> None:
+        """Suma la relevancia para la consulta, normalizada a [0, 1], con el peso `query`."""
+        positions = [(features.index_by_id[i], score) for i, score in query_scores.items() if i in features.index_by_id]
+        if not positions:
+            return
+        indices = np.fromiter((position for position, _ in positions), dtype=np.int64, count=len(positions))
+        values = np.fromiter((score for _, score in positions), dtype=np.float64, count=len(positions))
+        scores[indices] += self._weights["query"] * values / values.max()
+
+    @staticmethod
+    def _add_token_scores(features: RankingFeatures, scores: np.ndarray, tokens: Iterable[str], weight: float) -> None:
+        """Suma `weight` a los destinos que contienen cada palabra."""
+        for token in tokens:
+            postings = features.postings.get(token)
+            if postings is not None:
+                scores[postings] += weight
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores del ranking y su tiempo medio por consulta."""
+        rankings = self._stats["rankings"]
+        features = self._features
+        return {
+            "destinations": len(features) if features is not None else 0,
+            "top_k": self.top_k,
+            "rankings": rankings,
+            "feature_sets": self._stats["feature_sets"],
+            "build_ms": features.build_ms if features is not None else 0.0,
+            "rank_ms": {
+                "avg": round(self._stats["rank_ms_total"] / rankings, 3) if rankings else 0.0,
+                "max": round(self._stats["rank_ms_max"], 3),
+            },
+        }
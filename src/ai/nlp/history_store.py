@@ -0,0 +1,393 @@
+import asyncio
+import json
+import logging
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Deque, Dict, List, Optional, Set, Tuple
+
+logger = logging.getLogger("HistoryStore")
+
+DEFAULT_HISTORY_CONFIG: Dict[str, Any] = {
+    "path": "data/history.sqlite3",
+    "legacy_dir": "data",
+    "hot_users": 256,
+    "hot_messages": 50,
+    "flush_interval_ms": 200,
+    "batch_size": 64,
+    "synchronous": "NORMAL",
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    user_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_user ON messages (user_id, id);
+CREATE TABLE IF NOT EXISTS summaries (
+    user_id TEXT PRIMARY KEY,
+    content TEXT NOT NULL,
+    covered_until INTEGER NOT NULL,
+    updated_at REAL NOT NULL
+);
+"""
+
+_history_store: Optional["HistoryStore"] = None
+
+
+class HistoryStore:
+    """
+    Historial de conversación en SQLite (modo WAL), solo de añadido.
+
+    Cada turno añade sus mensajes sin reescribir el historial. Las escrituras se acumulan
+    y se confirman por lotes en un hilo dedicado, de modo que el event loop nunca hace
+    I/O de disco. Los últimos mensajes de las sesiones activas se mantienen en una LRU
+    en memoria y las lecturas de la base de datos solo traen los últimos N mensajes.
+
+    Junto al historial se guarda un resumen por usuario de los mensajes antiguos
+    (`covered_until` indica cuántos mensajes, desde el primero, resume).
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            config (Optional[Dict[str, Any]]): Sección `history` de la configuración
+                (`path`, `legacy_dir`, `hot_users`, `hot_messages`, `flush_interval_ms`,
+                `batch_size`, `synchronous`).
+        """
+        config = {**DEFAULT_HISTORY_CONFIG, **(config or {})}
+        self._path = Path(config["path"])
+        self._legacy_dir = Path(config["legacy_dir"]) if config.get("legacy_dir") else None
+        self._hot_users: int = int(config["hot_users"])
+        self._hot_messages: int = int(config["hot_messages"])
+        self._flush_interval: float = float(config["flush_interval_ms"]) / 1000
+        self._batch_size: int = int(config["batch_size"])
+        self._synchronous: str = str(config["synchronous"]).upper()
+
+        # Un único hilo posee la conexión: serializa el acceso a SQLite fuera del event loop.
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="history-store")
+        self._connection: Optional[sqlite3.Connection] = None
+        self._open_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._flush_task: Optional[asyncio.Task] = None
+        self._batch_flush_tasks: Set[asyncio.Task] = set()
+
+        self._hot: "OrderedDict[str, Deque[dict]]" = OrderedDict()
+        # Total de mensajes de cada usuario de la LRU, para no contarlos en SQLite en cada turno.
+        self._counts: Dict[str, int] = {}
+        self._pending: List[Tuple[str, str, str, float]] = []
+        self._summaries: "OrderedDict[str, Optional[dict]]" = OrderedDict()
+        self._stats: Dict[str, int] = {
+            "appends": 0,
+            "flushes": 0,
+            "rows_written": 0,
+            "flush_errors": 0,
+            "cache_hits": 0,
+            "cache_misses": 0,
+            "migrated_files": 0,
+        }
+
+    async def get_recent(self, user_id: str, limit: int) -> List[dict]:
+        """
+        Devuelve los últimos `limit` mensajes del usuario en orden cronológico.
+
+        Args:
+            user_id (str): ID del usuario.
+            limit (int): Número máximo de mensajes.
+
+        Returns:
+            List[dict]: Mensajes {"role", "content"} (copias, pueden modificarse).
+        """
+        user_key = str(user_id)
+        hot = self._hot.get(user_key)
+        if hot is not None and limit <= self._hot_messages:
+            self._stats["cache_hits"] += 1
+            self._hot.move_to_end(user_key)
+            return [dict(message) for message in list(hot)[-limit:]] if limit > 0 else []
+
+        self._stats["cache_misses"] += 1
+        await self._ensure_open()
+        async with self._flush_lock:
+            # Con el lock tomado no hay escrituras en curso: lo pendiente anterior se escribe
+            # antes de leer y lo añadido durante la lectura sigue en _pending y se agrega al final.
+            await self._flush_pending()
+            window = max(limit, self._hot_messages)
+            rows = await self._run(self._select_recent, user_key, window)
+            count = await self._run(self._count_messages, user_key)
+            pending = [
+                {"role": role, "content": content}
+                for pending_user, role, content, _ in self._pending
+                if pending_user == user_key
+            ]
+            rows += pending
+            self._cache_messages(user_key, rows, count + len(pending))
+        return [dict(message) for message in rows[-limit:]] if limit > 0 else []
+
+    async def get_since(self, user_id: str, offset: int, limit: int, max_limit: int) -> List[dict]:
+        """
+        Devuelve los mensajes del usuario posteriores al mensaje número `offset` (por ejemplo,
+        los que aún no recoge el resumen), en orden cronológico.
+
+        Args:
+            user_id (str): ID del usuario.
+            offset (int): Mensajes, desde el primero, que se omiten.
+            limit (int): Mínimo de mensajes recientes que se devuelven aunque sean anteriores a `offset`.
+            max_limit (int): Máximo de mensajes que se devuelven.
+
+        Returns:
+            List[dict]: Mensajes {"role", "content"} (copias, pueden modificarse).
+        """
+        total = await self.count_messages(user_id)
+        return await self.get_recent(user_id, min(max(limit, total - offset), max_limit))
+
+    async def count_messages(self, user_id: str) -> int:
+        """Número total de mensajes del usuario, incluidos los pendientes de escribir."""
+        user_key = str(user_id)
+        if user_key in self._counts:
+            return self._counts[user_key]
+        await self._ensure_open()
+        async with self._flush_lock:
+            await self._flush_pending()
+            return await self._run(self._count_messages, user_key)
+
+    async def get_range(self, user_id: str, offset: int, limit: int) -> List[dict]:
+        """
+        Devuelve `limit` mensajes del usuario a partir del mensaje número `offset`
+        (contando desde el primero), en orden cronológico.
+        """
+        await self._ensure_open()
+        async with self._flush_lock:
+            await self._flush_pending()
+            return await self._run(self._select_range, str(user_id), offset, limit)
+
+    async def get_summary(self, user_id: str) -> Optional[dict]:
+        """
+        Devuelve el resumen de la conversación antigua del usuario, si existe.
+
+        Returns:
+            Optional[dict]: {"content", "covered_until"} o None.
+        """
+        user_key = str(user_id)
+        if user_key in self._summaries:
+            self._summaries.move_to_end(user_key)
+            summary = self._summaries[user_key]
+            return dict(summary) if summary else None
+        await self._ensure_open()
+        summary = await self._run(self._select_summary, user_key)
+        self._cache_summary(user_key, summary)
+        return dict(summary) if summary else None
+
+    async def set_summary(self, user_id: str, content: str, covered_until: int) -> None:
+        """Guarda el resumen de los primeros `covered_until` mensajes del usuario."""
+        user_key = str(user_id)
+        await self._ensure_open()
+        await self._run(self._upsert_summary, user_key, content, covered_until)
+        self._cache_summary(user_key, {"content": content, "covered_until": covered_until})
+
+    async def append(self, user_id: str, messages: List[dict]) -> None:
+        """
+        Añade mensajes al historial del usuario. La escritura en disco se hace por lotes
+        en segundo plano; las lecturas posteriores ya ven los mensajes.
+        """
+        if not messages:
+            return
+        user_key = str(user_id)
+        now = time.time()
+        hot = self._hot.get(user_key)
+        for message in messages:
+            entry = {"role": message["role"], "content": message["content"]}
+            if hot is not None:
+                hot.append(entry)
+            self._pending.append((user_key, entry["role"], entry["content"], now))
+        if hot is not None:
+            self._counts[user_key] += len(messages)
+            self._hot.move_to_end(user_key)
+        self._stats["appends"] += len(messages)
+        self._schedule_flush()
+
+    async def flush(self) -> None:
+        """Escribe en una sola transacción todos los mensajes pendientes."""
+        async with self._flush_lock:
+            await self._flush_pending()
+
+    async def _flush_pending(self) -> None:
+        """Escribe los mensajes pendientes. Debe llamarse con `_flush_lock` tomado."""
+        if not self._pending:
+            return
+        await self._ensure_open()
+        batch, self._pending = self._pending, []
+        try:
+            await self._run(self._insert_batch, batch)
+            self._stats["flushes"] += 1
+            self._stats["rows_written"] += len(batch)
+        except sqlite3.Error as e:
+            self._stats["flush_errors"] += 1
+            self._pending = batch + self._pending
+            logger.error(f"Error al escribir {len(batch)} mensajes del historial: {e}")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores del almacén de historial."""
+        return {
+            **self._stats,
+            "pending": len(self._pending),
+            "hot_users": len(self._hot),
+            "cached_summaries": len(self._summaries),
+        }
+
+    async def aclose(self) -> None:
+        """Escribe los mensajes pendientes y cierra la base de datos."""
+        for task in [self._flush_task, *self._batch_flush_tasks]:
+            if task and not task.done():
+                task.cancel()
+        await self.flush()
+        if self._connection is not None:
+            await self._run(self._connection.close)
+            self._connection = None
+        self._executor.shutdown(wait=True)
+        logger.info("HistoryStore cerrado.")
+
+    def _schedule_flush(self) -> None:
+        """
+        Programa la escritura de lo pendiente: de inmediato si ya hay un lote completo,
+        o tras `flush_interval_ms` para agrupar los mensajes de varios turnos.
+        """
+        if len(self._pending) >= self._batch_size:
+            task = asyncio.create_task(self.flush())
+            self._batch_flush_tasks.add(task)
+            task.add_done_callback(self._batch_flush_tasks.discard)
+        elif self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        await asyncio.sleep(self._flush_interval)
+        await self.flush()
+
+    def _cache_messages(self, user_key: str, messages: List[dict], count: int) -> None:
+        """Guarda los últimos mensajes del usuario y su total en la LRU de sesiones activas."""
+        self._hot[user_key] = deque(messages[-self._hot_messages:], maxlen=self._hot_messages)
+        self._counts[user_key] = count
+        self._hot.move_to_end(user_key)
+        while len(self._hot) > self._hot_users:
+            evicted, _ = self._hot.popitem(last=False)
+            self._counts.pop(evicted, None)
+
+    def _cache_summary(self, user_key: str, summary: Optional[dict]) -> None:
+        """Guarda el resumen (o su ausencia) en memoria con el mismo límite que la LRU de sesiones."""
+        self._summaries[user_key] = summary
+        self._summaries.move_to_end(user_key)
+        while len(self._summaries) > self._hot_users:
+            self._summaries.popitem(last=False)
+
+    async def _run(self, func, *args):
+        """Ejecuta una operación de SQLite en el hilo del almacén."""
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    async def _ensure_open(self) -> None:
+        """Abre la base de datos (y migra los historiales JSON antiguos) la primera vez."""
+        if self._connection is not None:
+            return
+        async with self._open_lock:
+            if self._connection is None:
+                self._connection = await self._run(self._open)
+
+    def _open(self) -> sqlite3.Connection:
+        self._path.parent.mkdir(parents=True, exist_ok=True)
+        connection = sqlite3.connect(self._path, check_same_thread=False)
+        connection.execute("PRAGMA journal_mode=WAL")
+        connection.execute(f"PRAGMA synchronous={self._synchronous}")
+        connection.executescript(_SCHEMA)
+        connection.commit()
+        logger.info(f"HistoryStore abierto en {self._path} (WAL, synchronous={self._synchronous}).")
+        self._migrate_legacy_files(connection)
+        return connection
+
+    def _migrate_legacy_files(self, connection: sqlite3.Connection) -> None:
+        """Importa los archivos {user_id}_history.json antiguos y los renombra a .migrated."""
+        if self._legacy_dir is None or not self._legacy_dir.is_dir():
+            return
+        for history_file in sorted(self._legacy_dir.glob("*_history.json")):
+            user_key = history_file.name[: -len("_history.json")]
+            try:
+                with open(history_file, "r", encoding="utf-8") as f:
+                    history = json.load(f)
+                created_at = history_file.stat().st_mtime
+                connection.executemany(
+                    "INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                    [
+                        (user_key, message.get("role", ""), message.get("content", ""), created_at)
+                        for message in history
+                        if isinstance(message, dict)
+                    ],
+                )
+                connection.commit()
+                history_file.rename(history_file.with_suffix(".json.migrated"))
+                self._stats["migrated_files"] += 1
+                logger.info(f"Historial de {user_key} migrado a SQLite ({len(history)} mensajes).")
+            except (OSError, ValueError, sqlite3.Error) as e:
+                connection.rollback()
+                logger.warning(f"No se pudo migrar el historial {history_file}: {e}")
+
+    def _select_recent(self, user_key: str, limit: int) -> List[dict]:
+        rows = self._connection.execute(
+            "SELECT role, content FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?",
+            (user_key, limit),
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in reversed(rows)]
+
+    def _count_messages(self, user_key: str) -> int:
+        return self._connection.execute("SELECT COUNT(*) FROM messages WHERE user_id = ?", (user_key,)).fetchone()[0]
+
+    def _select_range(self, user_key: str, offset: int, limit: int) -> List[dict]:
+        rows = self._connection.execute(
+            "SELECT role, content FROM messages WHERE user_id = ? ORDER BY id LIMIT ? OFFSET ?",
+            (user_key, limit, offset),
+        ).fetchall()
+        return [{"role": role, "content": content} for role, content in rows]
+
+    def _select_summary(self, user_key: str) -> Optional[dict]:
+        row = self._connection.execute(
+            "SELECT content, covered_until FROM summaries WHERE user_id = ?", (user_key,)
+        ).fetchone()
+        return {"content": row[0], "covered_until": row[1]} if row else None
+
+    def _upsert_summary(self, user_key: str, content: str, covered_until: int) -> None:
+        with self._connection:
+            self._connection.execute(
+                "INSERT INTO summaries (user_id, content, covered_until, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(user_id) DO UPDATE SET content = excluded.content, "
+                "covered_until = excluded.covered_until, updated_at = excluded.updated_at",
+                (user_key, content, covered_until, time.time()),
+            )
+
+    def _insert_batch(self, batch: List[Tuple[str, str, str, float]]) -> None:
+        with self._connection:
+            self._connection.executemany(
+                "INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                batch,
+            )
+
+
+def init_history_store(config: Optional[Dict[str, Any]] = None) -> HistoryStore:
+    """Crea el almacén de historial compartido de la aplicación, si aún no existe."""
+    global _history_store
+    if _history_store is None:
+        _history_store = HistoryStore(config)
+    return _history_store
+
+
+def get_history_store() -> HistoryStore:
+    """Devuelve el almacén de historial compartido, creándolo con la configuración por defecto si es necesario."""
+    return init_history_store()
+
+
+async def close_history_store() -> None:
+    """Escribe los mensajes pendientes y cierra el almacén compartido, si existe."""
+    global _history_store
+    if _history_store is not None:
+        await _history_store.aclose()
+        _history_store = None
@@ -0,0 +1,148 @@
+import logging
+import re
+import unicodedata
+from typing import Any, Dict, Optional
+from src.utils.datetime_utils import get_current_datetime, format_date_human_readable, format_time_only
+
+logger = logging.getLogger("IntentRouter")
+
+INTENT_GREETING = "greeting"
+INTENT_TIME = "time"
+INTENT_DATE = "date"
+INTENT_THANKS = "thanks"
+INTENT_GOODBYE = "goodbye"
+INTENT_SHOW_PREFERENCES = "show_preferences"
+
+# Frases completas (ya normalizadas: minúsculas, sin tildes ni puntuación) que se responden sin LLM.
+# Solo coinciden si el mensaje entero es la intención, con cortesías opcionales alrededor:
+# "hola" sí, "hola, quiero ir a la playa" no.
+_INTENT_PATTERNS = {
+    INTENT_GREETING: r"hola( que tal)?|buenas( tardes| noches)?|buenos dias|hey|saludos|que tal( estas)?|hola como estas",
+    INTENT_TIME: r"(que hora es|que horas son|dime la hora|me dices la hora|tienes la hora)( ahora)?",
+    INTENT_DATE: r"(que (fecha|dia) es( hoy)?|a que (fecha|dia) estamos( hoy)?|cual es la fecha( de hoy)?|fecha de hoy)",
+    INTENT_THANKS: r"(muchas |mil )?gracias( por (todo|tu ayuda|la ayuda|la informacion))?|te lo agradezco",
+    INTENT_GOODBYE: r"adios|chao|chau|hasta luego|hasta pronto|hasta manana|nos vemos|bye",
+    INTENT_SHOW_PREFERENCES: (
+        r"((muestrame|dime|ver|mostrar|cuales son|que son) )?(mis preferencias)( guardadas)?"
+        r"|que preferencias tengo( guardadas)?"
+    ),
+}
+_POLITE_PREFIX = r"(?:(?:oye|hola|{name}) )*"
+_POLITE_SUFFIX = r"(?: (?:por favor|porfa|{name}))*"
+
+_NON_WORD_REGEX = re.compile(r"[^\w\s]")
+_WHITESPACE_REGEX = re.compile(r"\s+")
+
+# Etiquetas legibles de las preferencias del usuario.
+_PREFERENCE_LABELS = {
+    "destino_favorito": "Destino favorito",
+    "ubicacion_favorita": "Ubicación favorita",
+    "categoria_favorita": "Categoría favorita",
+    "preferencia_precio": "Presupuesto",
+    "no_le_gusta": "No le gusta",
+    "travelerTypes": "Tipo de viajero",
+    "travelingWith": "Viaja con",
+    "travelDuration": "Duración del viaje",
+    "activities": "Actividades",
+    "placeTypes": "Tipos de lugar",
+    "budget": "Nivel de presupuesto",
+    "transport": "Transporte",
+    "tipo_interes": "Tipo de interés",
+    "duracion_preferida": "Duración preferida",
+    "enfoque_geografico": "Enfoque geográfico",
+}
+
+
+def _normalize(text: str) -> str:
+    """Minúsculas, sin tildes, sin puntuación (¿?¡!) y con espacios simples."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = _NON_WORD_REGEX.sub(" ", text)
+    return _WHITESPACE_REGEX.sub(" ", text).strip()
+
+
+def _format_preference_value(value: Any) -> str:
+    if isinstance(value, (list, tuple, set)):
+        return ", ".join(str(item) for item in value)
+    if isinstance(value, dict):
+        return ", ".join(f"{key}: {item}" for key, item in value.items())
+    return str(value)
+
+
+class IntentRouter:
+    """
+    Responde sin LLM a los mensajes triviales: saludos, la hora, la fecha, agradecimientos,
+    despedidas y "muéstrame mis preferencias".
+
+    Todas las frases se compilan en una sola expresión regular con un grupo por intención,
+    que se evalúa sobre el mensaje normalizado antes de construir el prompt. Las respuestas
+    salen de plantillas y de `datetime_utils`.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, assistant_name: str = "", timezone: str = "UTC"):
+        """
+        Args:
+            config (Optional[Dict[str, Any]]): Sección `intent_router` de la configuración (`enabled`).
+            assistant_name (str): Nombre del asistente, aceptado como vocativo ("hola KODI").
+            timezone (str): Zona horaria para las respuestas de hora y fecha.
+        """
+        config = config or {}
+        self.enabled: bool = bool(config.get("enabled", True))
+        self._assistant_name = assistant_name
+        self._timezone = timezone
+
+        name = re.escape(_normalize(assistant_name)) if assistant_name else "asistente"
+        prefix = _POLITE_PREFIX.format(name=name)
+        suffix = _POLITE_SUFFIX.format(name=name)
+        alternatives = "|".join(f"(?P<{intent}>{pattern})" for intent, pattern in _INTENT_PATTERNS.items())
+        self._regex = re.compile(f"^{prefix}(?:{alternatives}){suffix}$")
+
+        self._stats: Dict[str, Any] = {"checked": 0, "misses": 0, "hits": {intent: 0 for intent in _INTENT_PATTERNS}}
+
+    def match(self, prompt: str) -> Optional[str]:
+        """Devuelve la intención trivial del mensaje, o None si necesita el LLM."""
+        if not self.enabled:
+            return None
+        self._stats["checked"] += 1
+        match = self._regex.match(_normalize(prompt))
+        if match is None:
+            self._stats["misses"] += 1
+            return None
+        intent = match.lastgroup
+        self._stats["hits"][intent] += 1
+        return intent
+
+    def respond(self, intent: str, user_name: Optional[str], preferences: Optional[dict]) -> str:
+        """Genera la respuesta de plantilla para una intención reconocida por `match`."""
+        name = f", {user_name}" if user_name else ""
+        if intent == INTENT_GREETING:
+            return f"¡Hola{name}! Soy {self._assistant_name}. ¿A dónde te gustaría viajar? Puedo recomendarte destinos según tus preferencias."
+        if intent == INTENT_TIME:
+            return f"Son las {format_time_only(get_current_datetime(self._timezone))}."
+        if intent == INTENT_DATE:
+            return f"{format_date_human_readable(get_current_datetime(self._timezone))}."
+        if intent == INTENT_THANKS:
+            return f"¡De nada{name}! Si necesitas algo más para tu viaje, aquí estoy."
+        if intent == INTENT_GOODBYE:
+            return f"¡Hasta pronto{name}! Que tengas un buen viaje."
+        if intent == INTENT_SHOW_PREFERENCES:
+            lines = [
+                f"- {_PREFERENCE_LABELS.get(key, key)}: {_format_preference_value(value)}"
+                for key, value in (preferences or {}).items()
+                if value not in (None, "", [], {})
+            ]
+            if not lines:
+                return "Todavía no tienes preferencias guardadas. ¿Quieres contarme qué tipo de viaje te gusta?"
+            return "Estas son tus preferencias guardadas:\n" + "\n".join(lines)
+        raise ValueError(f"Intención desconocida: '{intent}'")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve cuántos mensajes se evaluaron y los aciertos por intención."""
+        hits = sum(self._stats["hits"].values())
+        return {
+            "enabled": self.enabled,
+            "checked": self._stats["checked"],
+            "misses": self._stats["misses"],
+            "hits": dict(self._stats["hits"]),
+            "hit_rate": round(hits / self._stats["checked"], 3) if self._stats["checked"] else 0.0,
+        }
@@ -0,0 +1,215 @@
+import asyncio
+import logging
+import math
+import os
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional
+
+logger = logging.getLogger("LLMScheduler")
+
+LANE_INTERACTIVE = "interactive"
+LANE_BATCH = "batch"
+
+DEFAULT_SCHEDULER_CONFIG: Dict[str, Any] = {
+    "slots": None,
+    "max_queue": 32,
+    "queue_timeout_seconds": 30.0,
+    "lanes": [LANE_INTERACTIVE, LANE_BATCH],
+}
+
+# Estimación de la duración de una generación mientras aún no hay medidas, para Retry-After.
+_DEFAULT_GENERATION_SECONDS = 10.0
+
+
+class LLMSchedulerOverloaded(Exception):
+    """
+    El planificador no admite la solicitud: la cola está llena (429) o se agotó
+    el tiempo de espera en cola (503).
+    """
+
+    def __init__(self, message: str, status_code: int, retry_after: int):
+        super().__init__(message)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class LLMScheduler:
+    """
+    Control de admisión para las generaciones de Ollama.
+
+    Limita las generaciones simultáneas a `slots` (el paralelismo de Ollama, OLLAMA_NUM_PARALLEL)
+    y mantiene una cola de espera acotada con carriles de prioridad: al liberarse un slot se
+    atiende primero al carril con más prioridad (el primero de `lanes`). Si la cola está llena
+    la solicitud se rechaza de inmediato en lugar de ralentizar a todas las demás.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            config (Optional[Dict[str, Any]]): Sección `scheduler` de la configuración
+                (`slots`, `max_queue`, `queue_timeout_seconds`, `lanes`). Si `slots` es None
+                se usa la variable de entorno OLLAMA_NUM_PARALLEL o 1.
+        """
+        config = {**DEFAULT_SCHEDULER_CONFIG, **(config or {})}
+        slots = config["slots"] or os.getenv("OLLAMA_NUM_PARALLEL") or 1
+        self._slots: int = max(1, int(slots))
+        self._max_queue: int = int(config["max_queue"])
+        self._queue_timeout: float = float(config["queue_timeout_seconds"])
+        self._lanes: List[str] = list(config["lanes"])
+
+        self._active = 0
+        self._waiters: Dict[str, Deque[asyncio.Future]] = {lane: deque() for lane in self._lanes}
+        self._stats: Dict[str, Any] = {
+            "admitted": 0,
+            "rejected_queue_full": 0,
+            "rejected_timeout": 0,
+            "lanes": {
+                lane: {"admitted": 0, "queue_wait_ms_total": 0.0, "queue_wait_ms_max": 0.0}
+                for lane in self._lanes
+            },
+            "generations": 0,
+            "generation_ms_total": 0.0,
+            "generation_ms_max": 0.0,
+        }
+        logger.info(f"LLMScheduler: {self._slots} slots, cola máxima {self._max_queue}, carriles {self._lanes}.")
+
+    @property
+    def queued(self) -> int:
+        """Número de solicitudes esperando un slot."""
+        return sum(len(waiters) for waiters in self._waiters.values())
+
+    def ensure_capacity(self, lane: str = LANE_INTERACTIVE) -> None:
+        """
+        Comprueba sin esperar que la solicitud podría admitirse ahora mismo.
+
+        Raises:
+            LLMSchedulerOverloaded: Si todos los slots están ocupados y la cola está llena.
+        """
+        self._check_lane(lane)
+        if self._active >= self._slots and self.queued >= self._max_queue:
+            self._stats["rejected_queue_full"] += 1
+            raise self._overloaded("Cola de generación llena", 429)
+
+    @asynccontextmanager
+    async def slot(self, lane: str = LANE_INTERACTIVE, timings: Optional[Dict[str, float]] = None) -> AsyncIterator[None]:
+        """
+        Reserva un slot de generación durante el bloque `async with`.
+
+        Args:
+            lane (str): Carril de prioridad.
+            timings (Optional[Dict[str, float]]): Si se indica, recibe `queue_wait_ms` y
+                `generation_ms` de esta solicitud.
+
+        Raises:
+            LLMSchedulerOverloaded: Si la cola está llena o se agota el tiempo de espera.
+        """
+        self._check_lane(lane)
+        wait_start = time.perf_counter()
+        await self._acquire(lane)
+        queue_wait_ms = (time.perf_counter() - wait_start) * 1000
+        self._record_admission(lane, queue_wait_ms)
+
+        generation_start = time.perf_counter()
+        try:
+            yield
+        finally:
+            generation_ms = (time.perf_counter() - generation_start) * 1000
+            self._record_generation(generation_ms)
+            self._release()
+            if timings is not None:
+                timings["queue_wait_ms"] = round(queue_wait_ms, 1)
+                timings["generation_ms"] = round(generation_ms, 1)
+
+    async def _acquire(self, lane: str) -> None:
+        """Toma un slot libre o espera en la cola de su carril hasta que se le ceda uno."""
+        if self._active < self._slots and self.queued == 0:
+            self._active += 1
+            return
+        if self.queued >= self._max_queue:
+            self._stats["rejected_queue_full"] += 1
+            raise self._overloaded("Cola de generación llena", 429)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters[lane].append(waiter)
+        try:
+            await asyncio.wait_for(waiter, self._queue_timeout)
+        except asyncio.TimeoutError:
+            self._discard_waiter(lane, waiter)
+            self._stats["rejected_timeout"] += 1
+            raise self._overloaded("Tiempo de espera en cola agotado", 503) from None
+        except asyncio.CancelledError:
+            self._discard_waiter(lane, waiter)
+            raise
+
+    def _discard_waiter(self, lane: str, waiter: asyncio.Future) -> None:
+        """Saca de la cola a un solicitante que deja de esperar; si ya se le cedió el slot, lo libera."""
+        if waiter.done() and not waiter.cancelled():
+            self._release()
+            return
+        try:
+            self._waiters[lane].remove(waiter)
+        except ValueError:
+            pass
+
+    def _release(self) -> None:
+        """Cede el slot al siguiente en espera por orden de prioridad, o lo deja libre."""
+        for lane in self._lanes:
+            waiters = self._waiters[lane]
+            while waiters:
+                waiter = waiters.popleft()
+                if not waiter.done():
+                    waiter.set_result(None)
+                    return
+        self._active -= 1
+
+    def _check_lane(self, lane: str) -> None:
+        if lane not in self._waiters:
+            raise ValueError(f"Carril de prioridad desconocido: '{lane}'. Carriles: {self._lanes}")
+
+    def _overloaded(self, message: str, status_code: int) -> LLMSchedulerOverloaded:
+        """Crea el error de sobrecarga con un Retry-After estimado a partir de la duración media."""
+        generations = self._stats["generations"]
+        avg_seconds = (
+            self._stats["generation_ms_total"] / generations / 1000 if generations else _DEFAULT_GENERATION_SECONDS
+        )
+        retry_after = max(1, math.ceil(avg_seconds * (self.queued + 1) / self._slots))
+        logger.warning(f"{message}: {self._active} activas, {self.queued} en cola. Retry-After {retry_after}s.")
+        return LLMSchedulerOverloaded(message, status_code, retry_after)
+
+    def _record_admission(self, lane: str, queue_wait_ms: float) -> None:
+        self._stats["admitted"] += 1
+        lane_stats = self._stats["lanes"][lane]
+        lane_stats["admitted"] += 1
+        lane_stats["queue_wait_ms_total"] += queue_wait_ms
+        lane_stats["queue_wait_ms_max"] = max(lane_stats["queue_wait_ms_max"], queue_wait_ms)
+
+    def _record_generation(self, generation_ms: float) -> None:
+        self._stats["generations"] += 1
+        self._stats["generation_ms_total"] += generation_ms
+        self._stats["generation_ms_max"] = max(self._stats["generation_ms_max"], generation_ms)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve la ocupación actual y los tiempos medios de espera en cola y de generación."""
+        generations = self._stats["generations"]
+        return {
+            "slots": self._slots,
+            "active": self._active,
+            "queued": {lane: len(waiters) for lane, waiters in self._waiters.items()},
+            "max_queue": self._max_queue,
+            "admitted": self._stats["admitted"],
+            "rejected_queue_full": self._stats["rejected_queue_full"],
+            "rejected_timeout": self._stats["rejected_timeout"],
+            "queue_wait_ms": {
+                lane: {
+                    "avg": round(lane_stats["queue_wait_ms_total"] / lane_stats["admitted"], 1) if lane_stats["admitted"] else 0.0,
+                    "max": round(lane_stats["queue_wait_ms_max"], 1),
+                }
+                for lane, lane_stats in self._stats["lanes"].items()
+            },
+            "generation_ms": {
+                "avg": round(self._stats["generation_ms_total"] / generations, 1) if generations else 0.0,
+                "max": round(self._stats["generation_ms_max"], 1),
+            },
+        }
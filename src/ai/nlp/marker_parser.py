@@ -0,0 +1,202 @@
+import re
+import json
+import logging
+from typing import Callable, Optional
+
+logger = logging.getLogger("MarkerParser")
+
+MARKER_START_REGEX = re.compile(
+    r"(?P<recommendation>GENERAR_RECOMENDACION_JSON:|Generar recomendaci[oó]n JSON:)"
+    r"|(?P<preference>preference_set:)"
+    r"|(?P<json_block>```json)",
+    re.IGNORECASE
+)
+MARKER_KEYWORDS = ("generar_recomendacion_json:", "generar recomendación json:", "generar recomendacion json:", "preference_set:", "```json")
+CODE_FENCE = "```"
+_TRAILING_SEPARATOR_REGEX = re.compile(r"(?:\n---\s*)+$")
+_EXTRA_BLANK_LINES_REGEX = re.compile(r"\n{3,}")
+
+
+class MarkerStreamFilter:
+    """
+    Analizador incremental de los marcadores internos de la respuesta del modelo
+    (GENERAR_RECOMENDACION_JSON, preference_set: y bloques ```json```).
+
+    Consume el stream fragmento a fragmento en una sola pasada: deja pasar el texto visible a
+    medida que llega, retiene el que podría ser el inicio de un marcador hasta poder decidir y
+    registra cada marcador completo en `markers` (las recomendaciones con su JSON ya decodificado
+    en `data`). `on_marker` se llama en cuanto se cierra cada marcador, sin esperar al final del
+    stream, para que quien consume pueda actuar (y cortar la generación) antes de que termine.
+    """
+
+    def __init__(self, on_marker: Optional[Callable[[dict], None]] = None):
+        """
+        Args:
+            on_marker (Optional[Callable[[dict], None]]): Se llama con cada marcador al cerrarse.
+        """
+        self._on_marker = on_marker
+        self.reset()
+
+    def reset(self) -> None:
+        """Descarta todo lo analizado, para reutilizar el analizador al reintentar la generación."""
+        self._buffer: str = ""
+        self._marker_kind: Optional[str] = None
+        self._visible_parts: list[str] = []
+        self.markers: list[dict] = []
+
+    @property
+    def clean_text(self) -> str:
+        """Texto visible acumulado, sin el separador final ni líneas en blanco de sobra."""
+        text = _TRAILING_SEPARATOR_REGEX.sub("", "".join(self._visible_parts).strip()).strip()
+        return _EXTRA_BLANK_LINES_REGEX.sub("\n\n", text)
+
+    @property
+    def recommendations(self) -> list[dict]:
+        """JSON decodificado de los marcadores de recomendación válidos, en orden de aparición."""
+        return [marker["data"] for marker in self.markers if marker["type"] == "recommendation" and marker.get("data")]
+
+    def has_marker(self, kind: str) -> bool:
+        return any(marker["type"] == kind for marker in self.markers)
+
+    def feed(self, chunk: str) -> str:
+        """
+        Consume un fragmento del stream.
+
+        Args:
+            chunk (str): Fragmento de texto recibido del modelo.
+
+        Returns:
+            str: Texto visible que ya puede enviarse al cliente.
+        """
+        self._buffer += chunk
+        visible_parts = []
+
+        while self._buffer:
+            if self._marker_kind is None:
+                match = MARKER_START_REGEX.search(self._buffer)
+                if match:
+                    visible_parts.append(self._buffer[:match.start()])
+                    self._buffer = self._buffer[match.start():]
+                    self._marker_kind = match.lastgroup
+                    continue
+
+                keep = self._partial_marker_length(self._buffer)
+                visible_parts.append(self._buffer[:len(self._buffer) - keep])
+                self._buffer = self._buffer[len(self._buffer) - keep:]
+                break
+
+            marker_end = self._find_marker_end(self._buffer)
+            if marker_end is None:
+                break
+            self._close_marker(self._buffer[:marker_end])
+            self._buffer = self._buffer[marker_end:]
+
+        visible_text = "".join(visible_parts)
+        if visible_text:
+            self._visible_parts.append(visible_text)
+        return visible_text
+
+    def flush(self) -> str:
+        """
+        Vacía el búfer al terminar el stream.
+
+        Returns:
+            str: Texto visible pendiente. Un marcador incompleto se registra, no se emite.
+        """
+        remaining = self._buffer
+        self._buffer = ""
+        if self._marker_kind is not None:
+            self._close_marker(remaining)
+            return ""
+        if remaining:
+            self._visible_parts.append(remaining)
+        return remaining
+
+    def _close_marker(self, raw_marker: str) -> None:
+        """Registra un marcador completo, avisa a `on_marker` y vuelve al modo de texto visible."""
+        marker = {"type": self._marker_kind, "raw": raw_marker.strip()}
+        if self._marker_kind == "recommendation":
+            marker["data"] = self._decode_payload(marker["raw"])
+        self.markers.append(marker)
+        logger.debug(f"Marcador '{self._marker_kind}' retenido del stream: {marker['raw'][:200]}")
+        self._marker_kind = None
+        if self._on_marker is not None:
+            try:
+                self._on_marker(marker)
+            except Exception as e:
+                logger.error(f"Error al procesar el marcador '{marker['type']}': {e}")
+
+    @staticmethod
+    def _decode_payload(raw_marker: str) -> Optional[dict]:
+        """Decodifica el objeto JSON de un marcador de recomendación, o None si no es válido."""
+        start = raw_marker.find("{")
+        end = raw_marker.rfind("}")
+        if start == -1 or end < start:
+            return None
+        try:
+            data = json.loads(raw_marker[start:end + 1])
+        except json.JSONDecodeError as e:
+            logger.error(f"JSON de recomendación no válido en el marcador: {e}")
+            return None
+        return data if isinstance(data, dict) else None
+
+    def _find_marker_end(self, text: str) -> Optional[int]:
+        """Devuelve la posición donde termina el marcador en curso, o None si aún no ha terminado."""
+        if self._marker_kind == "preference":
+            newline = text.find("\n")
+            return None if newline == -1 else newline
+        if self._marker_kind == "json_block":
+            return self._find_fence_end(text, len("```json"))
+
+        position = text.find(":") + 1
+        while position < len(text) and text[position] in " \t\r\n":
+            position += 1
+        if position >= len(text):
+            return None
+        if text.startswith(CODE_FENCE, position):
+            return self._find_fence_end(text, position + len(CODE_FENCE))
+        if len(text) - position < len(CODE_FENCE) and CODE_FENCE.startswith(text[position:]):
+            return None
+        if text[position] != "{":
+            newline = text.find("\n", position)
+            return None if newline == -1 else newline
+
+        depth = 0
+        in_string = False
+        escaped = False
+        for index in range(position, len(text)):
+            char = text[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+            elif char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    return index + 1
+        return None
+
+    @staticmethod
+    def _find_fence_end(text: str, body_start: int) -> Optional[int]:
+        """Posición tras el cierre ``` de un bloque de código abierto antes de `body_start`."""
+        closing = text.find(CODE_FENCE, body_start)
+        return None if closing == -1 else closing + len(CODE_FENCE)
+
+    @staticmethod
+    def _partial_marker_length(text: str) -> int:
+        """Longitud del sufijo de `text` que podría ser el comienzo de un marcador."""
+        lowered = text[-len(max(MARKER_KEYWORDS, key=len)):].lower()
+        longest = 0
+        for keyword in MARKER_KEYWORDS:
+            for length in range(min(len(keyword) - 1, len(lowered)), longest, -1):
+                if keyword.startswith(lowered[-length:]):
+                    longest = length
+                    break
+        return longest
@@ -1,35 +1,50 @@
 import asyncio
+import hashlib
 import logging
 import re
-from typing import Optional, Any
+import time
+from typing import Optional, Any, AsyncIterator
 from pathlib import Path
-from ollama import AsyncClient, ResponseError
+from ollama import ResponseError
 from httpx import ConnectError
 from datetime import datetime
-from contextlib import asynccontextmanager
+from contextlib import asynccontextmanager, aclosing
 import json
 from src.ai.nlp.ollama_manager import OllamaManager
 from src.ai.nlp.config_manager import ConfigManager
 from src.ai.nlp.user_manager import UserManager
-from src.ai.nlp.prompt_creator import create_system_prompt
+from src.ai.nlp.prompt_creator import SystemPromptParts, create_system_prompt_parts, get_prompt_size_stats
+from src.ai.nlp.marker_parser import MarkerStreamFilter
+from src.ai.nlp.intent_router import IntentRouter
+from src.ai.nlp.destination_ranker import DestinationRanker, RankingFeatures
+from src.ai.nlp.context_budget import ContextBudgeter
+from src.ai.nlp.conversation_summarizer import ConversationSummarizer
+from src.ai.nlp.response_cache import ResponseCache, CacheProbe, context_fingerprint
+from src.ai.nlp.history_store import init_history_store, close_history_store
+from src.ai.nlp.llm_scheduler import LLMScheduler, LLMSchedulerOverloaded, LANE_INTERACTIVE
 from src.utils.datetime_utils import (
     get_current_datetime,
     format_date_human_readable,
     format_time_only,
     get_country_from_timezone,
 )
-from src.utils.destination_api import get_destinations_by_budget
+from src.utils.destination_api import init_destination_catalog, close_destination_catalog
+from src.utils.backend_client import init_backend_client, close_backend_client
+from src.utils.single_flight import SingleFlight
 import httpx
 from datetime import timedelta
 
 logger = logging.getLogger("NLPModule")
 
-PREFERENCE_MARKERS_REGEX = re.compile(r"(preference_set:)")
 ACCEPTANCE_PHRASES_REGEX = re.compile(r"\b(aceptar|sí|ok|confirmar|si|perfecto|excelente)\b|\bagend[a-z]*\b|\b(usa mis datos|registra en mi agenda|guardalo)\b", re.IGNORECASE)
-RECOMMENDATION_JSON_REGEX = re.compile(
-    r"(?:GENERAR_RECOMENDACION_JSON|Generar_recomendacion_JSON):\s*({.*?})",
-    re.DOTALL | re.IGNORECASE
-)
+# Tiempo máximo (s) de cada etapa de la preparación del contexto antes de continuar sin ella.
+DEFAULT_CONTEXT_STAGE_TIMEOUTS = {"user_data": 10.0, "history": 2.0, "summary": 1.0, "catalog": 5.0}
+RESPONSE_FORMAT_RECOMMENDATIONS = "recommendations"
+RECOMMENDATION_COUNT = 3
+# Generaciones estructuradas por solicitud: si la primera repite destinos se pide solo lo que falta.
+STRUCTURED_RECOMMENDATION_ATTEMPTS = 2
+RECOMMENDATION_TYPES = ["basado_en_preferencias", "basado_en_presupuesto", "basado_en_categoria"]
+RECOMMENDATION_TEXT_REGEX = re.compile(r"\*\*Destino:\*\*|\*\*Ubicación:\*\*|\*\*Presupuesto:\*\*")
 
 class NLPModule:
     """Clase principal para el procesamiento NLP con integración a Ollama."""
@@ -43,33 +58,611 @@ class NLPModule:
         self._config = self._config_manager.get_config()
         self._ollama_manager = OllamaManager(self._config["model"])
         self._online = self._ollama_manager.is_online()
-        self._user_manager = UserManager()
+        self._backend_client = init_backend_client(self._config.get("backend"))
+        self._history_store = init_history_store(self._config.get("history"))
+        self._user_manager = UserManager(
+            backend_client=self._backend_client,
+            cache_config=self._config.get("user_cache"),
+            history_store=self._history_store,
+            recommendations_config=self._config.get("recommendations"),
+        )
+        self._destination_catalog = init_destination_catalog(self._backend_client, self._config.get("destinations"))
+        self._intent_router = IntentRouter(
+            self._config.get("intent_router"), self._config["assistant_name"], self._config.get("timezone", "UTC")
+        )
+        self._destination_ranker = DestinationRanker(self._config.get("ranking"))
+        # Las características del ranking se construyen en el hilo de cada refresco del catálogo.
+        self._destination_catalog.register_features("ranking", RankingFeatures)
+        self._empty_ranking_features = RankingFeatures([])
+        self._context_budgeter = ContextBudgeter(self._config["model"], self._config.get("context_budget"))
+        self._response_cache = ResponseCache(self._config.get("response_cache"), self._ollama_manager)
+        self._turn_flight = SingleFlight("nlp_turns")
+        self._scheduler = LLMScheduler(self._config.get("scheduler"))
+        self._summarizer = ConversationSummarizer(
+            self._config.get("summaries"),
+            self._history_store,
+            self._ollama_manager,
+            self._scheduler,
+            self._config["model"],
+            keep_recent=self._context_budgeter.max_history_messages,
+        )
+        self._context_stage_timeouts = {
+            **DEFAULT_CONTEXT_STAGE_TIMEOUTS, **self._config.get("context_stages", {}).get("timeouts", {})
+        }
+        self._context_stage_stats = {}
+        # Con `early_stop` la generación se corta en cuanto se han recibido RECOMMENDATION_COUNT recomendaciones.
+        self._early_stop = bool(self._config.get("recommendations", {}).get("early_stop", True))
+        self._marker_stats = {"recommendation_saves": 0, "early_stops": 0}
         self._conversation_history = {}
         logger.info("NLPModule inicializado.")
 
+    async def start(self) -> bool:
+        """
+        Arranca Ollama sin bloquear el bucle de eventos y lanza la precarga del modelo.
+
+        Returns:
+            bool: True si el módulo quedó en línea.
+        """
+        self._online = await self._ollama_manager.start()
+        return self._online
+
     def __del__(self) -> None:
         """Libera recursos al destruir la instancia."""
         logger.info("Cerrando NLPModule.")
         del self._ollama_manager
 
+    @property
+    def user_manager(self) -> UserManager:
+        """UserManager compartido por el módulo."""
+        return self._user_manager
+
+    def get_metrics(self) -> dict:
+        """Devuelve las métricas de los recursos compartidos del módulo."""
+        return {
+            "ollama": self._ollama_manager.get_stats(),
+            "backend_client": self._backend_client.get_stats(),
+            "destination_catalog": self._destination_catalog.get_stats(),
+            "intent_router": self._intent_router.get_stats(),
+            "destination_ranker": self._destination_ranker.get_stats(),
+            "context_budget": self._context_budgeter.get_stats(),
+            "prompt_size": get_prompt_size_stats(),
+            "response_cache": self._response_cache.get_stats(),
+            "user_cache": self._user_manager.get_user_cache_stats(),
+            "history_store": self._history_store.get_stats(),
+            "turn_single_flight": self._turn_flight.get_stats(),
+            "scheduler": self._scheduler.get_stats(),
+            "summaries": self._summarizer.get_stats(),
+            "context_stages": {name: dict(stats) for name, stats in self._context_stage_stats.items()},
+            "markers": dict(self._marker_stats),
+        }
+
+    async def aclose(self) -> None:
+        """Detiene las tareas en segundo plano y cierra los clientes compartidos (Ollama y backend)."""
+        await self._summarizer.aclose()
+        await self._user_manager.aclose()
+        await self._ollama_manager.aclose()
+        await close_history_store()
+        await close_destination_catalog()
+        await close_backend_client()
+
+    def ensure_llm_capacity(self, lane: str = LANE_INTERACTIVE) -> None:
+        """
+        Rechaza de inmediato una solicitud si el planificador del LLM no puede admitirla.
+
+        Raises:
+            LLMSchedulerOverloaded: Si todos los slots están ocupados y la cola está llena.
+        """
+        self._scheduler.ensure_capacity(lane)
+
     def is_online(self) -> bool:
         """Devuelve True si el módulo NLP está online."""
         return self._ollama_manager.is_online()
 
-    def reload(self) -> None:
+    async def reload(self) -> None:
         """Recarga configuración y valida conexión."""
         logger.info("Recargando NLPModule...")
         self._config_manager.load_config()
         self._config = self._config_manager.get_config()
-        self._ollama_manager.reload(self._config["model"])
+        await self._ollama_manager.reload(self._config["model"])
         self._online = self._ollama_manager.is_online()
         log_fn = logger.info if self._online else logger.warning
         log_fn("NLPModule recargado." if self._online else "NLPModule recargado pero no en línea.")
 
-    async def generate_response(self, prompt: str, userId: int, auth_token: str) -> Optional[dict]:
-        """Genera una respuesta usando Ollama, gestionando memoria y permisos."""
+    async def generate_response(
+        self,
+        prompt: str,
+        userId: int,
+        auth_token: str,
+        allow_cache: bool = True,
+        lane: str = LANE_INTERACTIVE,
+        response_format: Optional[str] = None,
+    ) -> Optional[dict]:
+        """
+        Genera una respuesta usando Ollama, gestionando memoria y permisos.
+
+        Con `allow_cache=False` el turno no consulta ni alimenta la caché de respuestas.
+        `lane` es el carril de prioridad del planificador del LLM. Con
+        `response_format="recommendations"` el modelo responde con JSON restringido por un
+        esquema y el resultado incluye la lista `recommendations` ya validada (ver
+        `_generate_structured_recommendations`). Si el mismo usuario envía el mismo prompt
+        mientras el primero sigue en curso (doble envío), ambas solicitudes comparten un único turno.
+
+        Raises:
+            LLMSchedulerOverloaded: Si el planificador no admite la generación.
+        """
+        token_hash = hashlib.sha256((auth_token or "").encode("utf-8")).hexdigest()
+        turn_key = (str(userId), prompt, token_hash, allow_cache, response_format)
+        response = await self._turn_flight.do(
+            turn_key, lambda: self._generate_response(prompt, userId, auth_token, allow_cache, lane, response_format)
+        )
+        return dict(response) if response is not None else None
+
+    async def _generate_response(
+        self, prompt: str, userId: int, auth_token: str, allow_cache: bool, lane: str, response_format: Optional[str]
+    ) -> Optional[dict]:
+        """Ejecuta un turno completo de generate_response."""
         logger.info(f"Generando respuesta para el prompt: '{prompt[:100]}...' (Usuario ID: {userId})")
 
+        structured = response_format == RESPONSE_FORMAT_RECOMMENDATIONS
+        early_response, turn = await self._prepare_turn(prompt, userId, auth_token, structured=structured)
+        if early_response is not None:
+            return early_response
+
+        if structured:
+            return await self._generate_structured_recommendations(turn, lane)
+        if response_format is not None:
+            raise ValueError(f"Formato de respuesta desconocido: '{response_format}'")
+
+        marker_parser = self._new_marker_parser(turn)
+        cache_probe = await self._lookup_cached_response(prompt, turn, allow_cache)
+        if cache_probe is not None and cache_probe.response is not None:
+            marker_parser.feed(cache_probe.response)
+            marker_parser.flush()
+            return await self._finalize_turn(turn, cache_probe.response, marker_parser)
+
+        full_response_content, llm_error = await self._get_llm_response(
+            turn["messages"], options=turn["model_options"], route_key=userId,
+            marker_parser=marker_parser, turn=turn, lane=lane, timings=turn["timings"],
+        )
+        logger.info(f"Tiempos del LLM para {userId}: {turn['timings']}")
+
+        if llm_error:
+            return {
+                "response": llm_error,
+                "error": llm_error,
+                "user_name": turn["user_data"].get("nombre"),
+                "preference_key": None,
+                "preference_value": None,
+                "command": None,
+            }
+
+        if full_response_content:
+            await self._store_cached_response(cache_probe, turn, full_response_content, marker_parser)
+            return await self._finalize_turn(turn, full_response_content, marker_parser)
+
+        self._online = False
+        return {
+            "response": "No se pudo procesar tu solicitud. Intenta más tarde.",
+            "error": "Agotados intentos",
+            "user_name": turn["user_data"].get("nombre"),
+            "preference_key": None,
+            "preference_value": None,
+            "command": None,
+        }
+
+    async def generate_response_stream(
+        self,
+        prompt: str,
+        userId: int,
+        auth_token: str,
+        allow_cache: bool = True,
+        lane: str = LANE_INTERACTIVE,
+    ) -> AsyncIterator[dict]:
+        """
+        Variante en streaming de generate_response.
+
+        Emite eventos {"event": "token", "data": {"text": ...}} con el texto visible a medida que
+        llega de Ollama, reteniendo los marcadores internos, y termina con un único evento
+        {"event": "final", "data": ...} con la respuesta procesada y los marcadores retenidos.
+        El slot del planificador se mantiene mientras dura el stream, que se corta en cuanto
+        llegan RECOMMENDATION_COUNT recomendaciones si `recommendations.early_stop` está activo.
+
+        Raises:
+            LLMSchedulerOverloaded: Si el planificador no admite la generación.
+        """
+        logger.info(f"Generando respuesta en streaming para el prompt: '{prompt[:100]}...' (Usuario ID: {userId})")
+
+        early_response, turn = await self._prepare_turn(prompt, userId, auth_token)
+        if early_response is not None:
+            yield {"event": "final", "data": {**early_response, "markers": []}}
+            return
+
+        marker_filter = self._new_marker_parser(turn)
+        cache_probe = await self._lookup_cached_response(prompt, turn, allow_cache)
+        if cache_probe is not None and cache_probe.response is not None:
+            visible_text = marker_filter.feed(cache_probe.response) + marker_filter.flush()
+            if visible_text:
+                yield {"event": "token", "data": {"text": visible_text}}
+            result = await self._finalize_turn(turn, cache_probe.response, marker_filter)
+            yield {"event": "final", "data": {**result, "markers": marker_filter.markers}}
+            return
+
+        full_response_content = ""
+
+        try:
+            async with self._scheduler.slot(lane, turn["timings"]):
+                async with aclosing(self._stream_llm_response(
+                    turn["messages"], options=turn["model_options"], route_key=userId
+                )) as response_stream:
+                    async for piece in response_stream:
+                        full_response_content += piece
+                        visible_text = marker_filter.feed(piece)
+                        if visible_text:
+                            yield {"event": "token", "data": {"text": visible_text}}
+                        if self._should_stop_generation(turn):
+                            break
+        except LLMSchedulerOverloaded:
+            raise
+        except (ResponseError, ConnectError, Exception) as e:
+            logger.error(f"Error con Ollama durante el streaming: {e}")
+            self._discard_recommendation_saves(turn)
+            llm_error = f"Error con Ollama: {e}"
+            yield {"event": "final", "data": {
+                "response": llm_error,
+                "error": llm_error,
+                "user_name": turn["user_data"].get("nombre"),
+                "preference_key": None,
+                "preference_value": None,
+                "command": None,
+                "markers": marker_filter.markers,
+            }}
+            return
+
+        visible_text = marker_filter.flush()
+        if visible_text:
+            yield {"event": "token", "data": {"text": visible_text}}
+
+        if not full_response_content:
+            logger.warning("Respuesta vacía de Ollama en streaming.")
+            yield {"event": "final", "data": {
+                "response": "No se pudo procesar tu solicitud. Intenta más tarde.",
+                "error": "Respuesta vacía de Ollama",
+                "user_name": turn["user_data"].get("nombre"),
+                "preference_key": None,
+                "preference_value": None,
+                "command": None,
+                "markers": marker_filter.markers,
+            }}
+            return
+
+        await self._store_cached_response(cache_probe, turn, full_response_content, marker_filter)
+        result = await self._finalize_turn(turn, full_response_content, marker_filter)
+        yield {"event": "final", "data": {**result, "markers": marker_filter.markers}}
+
+    async def _generate_structured_recommendations(self, turn: dict, lane: str) -> dict:
+        """
+        Genera recomendaciones con salida estructurada de Ollama (`format` con esquema JSON).
+
+        El esquema limita `destinationId` a los IDs de los destinos enviados en el prompt y
+        fija el número de elementos. La gramática no puede impedir que el modelo repita un
+        destino, así que los duplicados se descartan y se vuelve a pedir solo lo que falta, con
+        los destinos ya elegidos fuera del esquema; si aun así faltan, se devuelven menos.
+        El userId lo pone el servidor, no el modelo. No guarda las recomendaciones:
+        las devuelve en `recommendations` para que las persista quien llama.
+        """
+        destinations_by_id = {d["id"]: d for d in turn["destinations"] if d.get("id")}
+        base_result = {
+            "user_name": turn["user_data"].get("nombre"),
+            "preference_key": None,
+            "preference_value": None,
+            "command": None,
+            "recommendations": [],
+            "timings": turn["timings"],
+        }
+        if not destinations_by_id:
+            message = "No hay destinos disponibles para recomendar."
+            return {**base_result, "response": message, "error": message}
+
+        target = min(RECOMMENDATION_COUNT, len(destinations_by_id))
+        messages = turn["messages"]
+        recommendations = []
+        reasons = {}
+        for attempt in range(STRUCTURED_RECOMMENDATION_ATTEMPTS):
+            missing = target - len(recommendations)
+            schema = self._build_recommendations_schema([i for i in destinations_by_id if i not in reasons], missing)
+            full_response_content, llm_error = await self._get_llm_response(
+                messages, response_format=schema, options=turn["model_options"], route_key=turn["user_id"],
+                lane=lane, timings=turn["timings"],
+            )
+            logger.info(f"Tiempos del LLM (recomendaciones) para {turn['user_id']}: {turn['timings']}")
+            if llm_error:
+                if not recommendations:
+                    return {**base_result, "response": llm_error, "error": llm_error}
+                logger.warning(f"Nueva petición de recomendaciones fallida para {turn['user_id']}: {llm_error}")
+                break
+
+            try:
+                self._collect_structured_recommendations(full_response_content, destinations_by_id, turn, recommendations, reasons)
+            except (json.JSONDecodeError, AttributeError, TypeError) as e:
+                logger.error(f"Respuesta estructurada inválida para {turn['user_id']}: {e}. Contenido: {full_response_content[:200]}")
+                if not recommendations:
+                    message = "El modelo no devolvió recomendaciones válidas."
+                    return {**base_result, "response": full_response_content, "error": message}
+                break
+
+            if len(recommendations) >= target:
+                break
+            chosen = ", ".join(r["destinationId"] for r in recommendations)
+            logger.info(f"Faltan {target - len(recommendations)} recomendaciones distintas para {turn['user_id']}; se vuelven a pedir.")
+            messages = turn["messages"] + [
+                {"role": "assistant", "content": full_response_content},
+                {
+                    "role": "user",
+                    "content": (
+                        f"Recomienda {target - len(recommendations)} destinos diferentes más de la lista, "
+                        f"distintos de los ya recomendados ({chosen})."
+                    ),
+                },
+            ]
+
+        if len(recommendations) < target:
+            logger.warning(f"Solo se obtuvieron {len(recommendations)} de {target} recomendaciones distintas para {turn['user_id']}")
+        summary = "\n".join(
+            f"- {destinations_by_id[r['destinationId']].get('name') or r['destinationId']}: {reasons[r['destinationId']]}"
+            for r in recommendations
+        )
+        assistant_message = {"role": "assistant", "content": f"Te recomiendo estos destinos:\n{summary}"}
+        await self._user_manager.append_conversation_messages(turn["user_id"], [turn["user_message"], assistant_message])
+        self._summarizer.schedule(turn["user_id"])
+        logger.info(f"Recomendaciones estructuradas para {turn['user_id']}: {[r['destinationId'] for r in recommendations]}")
+        return {**base_result, "response": full_response_content, "recommendations": recommendations}
+
+    @staticmethod
+    def _collect_structured_recommendations(
+        content: str, destinations_by_id: dict, turn: dict, recommendations: list, reasons: dict
+    ) -> None:
+        """Añade a `recommendations` los destinos válidos y aún no elegidos de una respuesta estructurada."""
+        for item in json.loads(content).get("recommendations", []):
+            destination_id = item.get("destinationId")
+            if destination_id not in destinations_by_id:
+                logger.warning(f"destinationId fuera de los candidatos ignorado: {destination_id}")
+                continue
+            if destination_id in reasons:
+                logger.info(f"Destino duplicado ignorado: {destination_id}")
+                continue
+            recommendations.append({
+                "userId": str(turn["user_id"]),
+                "destinationId": destination_id,
+                "tipo": item.get("tipo") if item.get("tipo") in RECOMMENDATION_TYPES else RECOMMENDATION_TYPES[0],
+                "aceptada": False,
+            })
+            reasons[destination_id] = str(item.get("motivo") or "").strip()
+
+    @staticmethod
+    def _build_recommendations_schema(destination_ids: list[str], count: int = RECOMMENDATION_COUNT) -> dict:
+        """Esquema JSON de la respuesta de recomendaciones, con los IDs candidatos como enum."""
+        count = min(count, len(destination_ids))
+        return {
+            "type": "object",
+            "properties": {
+                "recommendations": {
+                    "type": "array",
+                    "minItems": count,
+                    "maxItems": count,
+                    "items": {
+                        "type": "object",
+                        "properties": {
+                            "destinationId": {"type": "string", "enum": destination_ids},
+                            "tipo": {"type": "string", "enum": RECOMMENDATION_TYPES},
+                            "motivo": {"type": "string"},
+                        },
+                        "required": ["destinationId", "tipo", "motivo"],
+                    },
+                },
+            },
+            "required": ["recommendations"],
+        }
+
+    async def _lookup_cached_response(self, prompt: str, turn: dict, allow_cache: bool) -> Optional[CacheProbe]:
+        """
+        Busca la respuesta del turno en la caché de respuestas.
+
+        La huella incluye el estado de la conversación que ve el modelo (resumen e historial),
+        de modo que una pregunta de seguimiento ("¿y más baratos?") solo acierta en la misma
+        conversación y en el mismo punto.
+
+        Returns:
+            Optional[CacheProbe]: None si la caché está desactivada o el turno no puede usarla.
+        """
+        if not self._response_cache.enabled:
+            return None
+        if not allow_cache:
+            self._response_cache.record_bypass()
+            return None
+        fingerprint = context_fingerprint(
+            model=self._config["model"]["name"],
+            preferences=turn["preferences"],
+            catalog_version=self._destination_catalog.version,
+            summary=turn["summary"],
+            # El último mensaje del historial es el del turno actual, que ya forma parte de la clave.
+            history=[(m["role"], m["content"]) for m in turn["history"][:-1]],
+        )
+        return await self._response_cache.lookup(prompt, fingerprint)
+
+    async def _store_cached_response(
+        self, cache_probe: Optional[CacheProbe], turn: dict, response: str, marker_parser: MarkerStreamFilter
+    ) -> None:
+        """
+        Guarda la respuesta en la caché salvo que tenga efectos secundarios (recomendaciones o
+        cambios de preferencias) o datos personales del usuario.
+        """
+        if cache_probe is None:
+            return
+        user_name = turn["user_data"].get("nombre")
+        if (
+            marker_parser.markers
+            or RECOMMENDATION_TEXT_REGEX.search(response)
+            or str(turn["user_id"]) in response
+            or (user_name and user_name in response)
+        ):
+            self._response_cache.record_bypass()
+            return
+        await self._response_cache.store(cache_probe, response)
+
+    def _new_marker_parser(self, turn: dict) -> MarkerStreamFilter:
+        """
+        Analizador de marcadores del turno. Cada recomendación empieza a guardarse en cuanto se
+        cierra su marcador, mientras el modelo sigue generando el resto de la respuesta.
+        """
+        return MarkerStreamFilter(on_marker=lambda marker: self._on_marker_closed(turn, marker))
+
+    def _on_marker_closed(self, turn: dict, marker: dict) -> None:
+        """Lanza el guardado de la recomendación de un marcador (una por destino, hasta RECOMMENDATION_COUNT)."""
+        recommendation_data = marker.get("data")
+        if marker["type"] != "recommendation" or not recommendation_data:
+            return
+        saves = turn["recommendation_saves"]
+        destination_id = recommendation_data.get("destinationId")
+        if destination_id in saves or len(saves) >= RECOMMENDATION_COUNT:
+            logger.info(f"Recomendación de {turn['user_id']} ignorada (repetida o sobrante): {destination_id}")
+            return
+        saves[destination_id] = asyncio.create_task(self._save_recommendation(turn, recommendation_data))
+        self._marker_stats["recommendation_saves"] += 1
+
+    @staticmethod
+    def _discard_recommendation_saves(turn: dict) -> None:
+        """Cancela los guardados de recomendaciones lanzados por un intento de generación fallido."""
+        for task in turn["recommendation_saves"].values():
+            task.cancel()
+        turn["recommendation_saves"].clear()
+
+    async def _save_recommendation(self, turn: dict, recommendation_data: dict) -> Optional[dict]:
+        """
+        Guarda en el backend una recomendación del modelo.
+
+        Returns:
+            Optional[dict]: Los datos de la recomendación con `recommendation_id`, o None si no se guardó.
+        """
+        userId = turn["user_id"]
+        try:
+            recommendation_id = await self._user_manager.save_recommendation_to_api(
+                userId, recommendation_data, turn["auth_token"]
+            )
+        except Exception as e:
+            logger.error(f"Error inesperado al guardar la recomendación para el usuario {userId}: {e}")
+            return None
+        if not recommendation_id:
+            return None
+        return {**recommendation_data, "recommendation_id": recommendation_id}
+
+    def _should_stop_generation(self, turn: dict) -> bool:
+        """
+        Indica si ya se aceptaron RECOMMENDATION_COUNT recomendaciones distintas y puede cortarse
+        la generación. Las repetidas no cuentan: `_on_marker_closed` no las guarda.
+        """
+        if not self._early_stop or len(turn["recommendation_saves"]) < RECOMMENDATION_COUNT:
+            return False
+        self._marker_stats["early_stops"] += 1
+        logger.info(f"{RECOMMENDATION_COUNT} recomendaciones recibidas para {turn['user_id']}: se corta la generación.")
+        return True
+
+    async def _finalize_turn(self, turn: dict, full_response_content: str, marker_parser: MarkerStreamFilter) -> dict:
+        """
+        Procesa la respuesta completa del modelo: espera los guardados de recomendaciones lanzados
+        durante la generación, aplica el fallback por `**Destino:**` y guarda el historial.
+        La respuesta visible es el texto limpio del analizador de marcadores.
+        """
+        userId = turn["user_id"]
+        auth_token = turn["auth_token"]
+        user_data_container = turn["user_data"]
+        user_preferences_dict = turn["preferences"]
+        user_conversation_history = turn["history"]
+        visible_response = marker_parser.clean_text
+
+        assistant_message = {"role": "assistant", "content": full_response_content}
+        user_conversation_history.append(assistant_message)
+        command_to_return = None
+        recommendation_markers = [marker for marker in marker_parser.markers if marker["type"] == "recommendation"]
+        saved_recommendations = [
+            recommendation
+            for recommendation in await asyncio.gather(*turn["recommendation_saves"].values())
+            if recommendation
+        ]
+
+        if recommendation_markers:
+            command_to_return = recommendation_markers[0]["raw"]
+            if saved_recommendations:
+                await self._user_manager.save_last_recommendation(userId, saved_recommendations[0])
+                logger.info(f"Recomendaciones guardadas completamente para {userId}: {saved_recommendations}")
+        elif RECOMMENDATION_TEXT_REGEX.search(visible_response):
+            logger.warning(f"Recomendación detectada sin marcador JSON para {userId}. Intentando extraer destinationId...")
+            try:
+                destino_match = re.search(r"\*\*Destino:\*\*\s*(.+?)(?:\n|\*\*)", visible_response)
+                if destino_match:
+                    destino_nombre = destino_match.group(1).strip()
+                    logger.info(f"Destino detectado en respuesta: '{destino_nombre}'")
+                    max_budget = user_preferences_dict.get("preferencia_precio")
+                    if max_budget is None:
+                        max_budget = float('inf')
+                    matching_dest = await self._destination_catalog.find_by_name(destino_nombre)
+                    if matching_dest and matching_dest["precio"] > max_budget:
+                        matching_dest = None
+                    
+                    if matching_dest:
+                        recommendation_data = {
+                            "userId": str(userId),
+                            "destinationId": matching_dest["id"],
+                            "tipo": "basado_en_preferencias",
+                            "aceptada": False
+                        }
+                        recommendation_id = await self._user_manager.save_recommendation_to_api(
+                            userId, 
+                            recommendation_data, 
+                            auth_token
+                        )
+                        
+                        if recommendation_id:
+                            recommendation_data["recommendation_id"] = recommendation_id
+                            await self._user_manager.save_last_recommendation(userId, recommendation_data)
+                            command_to_return = f"GENERAR_RECOMENDACION_JSON: {json.dumps(recommendation_data)}"
+                            logger.info(f"Recomendación recuperada mediante fallback para {userId}: {recommendation_data}")
+                    else:
+                        logger.warning(f"No se pudo encontrar destino '{destino_nombre}' en available_destinations")
+                        destinations = await self._destination_catalog.get_by_budget(max_budget)
+                        logger.debug(f"Destinos disponibles: {[d.get('name') for d in destinations]}")
+                else:
+                    logger.warning(f"No se pudo extraer el nombre del destino de la respuesta")
+            except Exception as e:
+                logger.error(f"Error en fallback de recomendación para {userId}: {e}")
+        await self._user_manager.append_conversation_messages(userId, [turn["user_message"], assistant_message])
+        self._summarizer.schedule(userId)
+        if marker_parser.has_marker("preference"):
+            self._user_manager.invalidate_user_data(userId)
+        return {
+            "response": visible_response or full_response_content,
+            "user_name": user_data_container.get("nombre"),
+            "preference_key": None,
+            "preference_value": None,
+            "command": command_to_return,
+            "timings": turn["timings"],
+        }
+
+    async def _prepare_turn(
+        self, prompt: str, userId: int, auth_token: str, structured: bool = False
+    ) -> tuple[Optional[dict], Optional[dict]]:
+        """
+        Valida la solicitud y construye el contexto del turno (usuario, historial y system prompt).
+
+        Con `structured=True` (recomendaciones con esquema JSON) el prompt lo compone el servidor
+        envolviendo el mensaje del usuario, así que no se buscan en él aceptaciones ni intenciones:
+        un "sí" o un "ok" del usuario no debe disparar el guardado en la agenda.
+
+        Returns:
+            tuple: (respuesta_inmediata, turno). Si la solicitud se resuelve sin LLM (errores,
+            aceptación de recomendaciones, intenciones triviales) se devuelve la respuesta y el
+            turno es None.
+        """
+
         if not prompt or not prompt.strip():
             return {
                 "response": "El prompt no puede estar vacío.",
@@ -77,11 +670,11 @@ class NLPModule:
                 "user_name": "",
                 "preference_key": None,
                 "preference_value": None,
-            }
+            }, None
 
         if not self.is_online():
             try:
-                self.reload()
+                await self.reload()
                 if not self.is_online():
                     return {
                         "response": "El módulo NLP está fuera de línea.",
@@ -89,7 +682,7 @@ class NLPModule:
                         "user_name": "",
                         "preference_key": None,
                         "preference_value": None,
-                    }
+                    }, None
             except Exception as e:
                 return {
                     "response": f"El módulo NLP está fuera de línea: {e}",
@@ -97,7 +690,7 @@ class NLPModule:
                     "user_name": "",
                     "preference_key": None,
                     "preference_value": None,
-                }
+                }, None
 
         if userId is None:
             return {
@@ -106,11 +699,44 @@ class NLPModule:
                 "user_name": "",
                 "preference_key": None,
                 "preference_value": None,
-            }
+            }, None
 
-        user_data_container, user_permissions_str, user_preferences_dict = await self._user_manager.get_user_data_by_id(userId, auth_token)
+        # El historial, su resumen y el catálogo no dependen de los datos del usuario: se cargan a
+        # la vez que ellos, salvo que el mensaje vaya a resolverse sin LLM (aceptación o intención trivial).
+        timings: dict = {}
+        context_start = time.perf_counter()
+        is_acceptance = not structured and bool(ACCEPTANCE_PHRASES_REGEX.search(prompt))
+        intent = None if structured else self._intent_router.match(prompt)
+        context_tasks = None
+        if intent is None and not is_acceptance:
+            summary_task = asyncio.ensure_future(
+                self._run_context_stage("summary", self._summarizer.get_summary(userId), None, timings)
+            )
+            context_tasks = [
+                asyncio.ensure_future(self._run_context_stage("history", self._load_history(userId, summary_task), [], timings)),
+                summary_task,
+                asyncio.ensure_future(self._run_context_stage(
+                    "catalog", self._load_catalog_context(prompt), (self._empty_ranking_features, {}), timings
+                )),
+            ]
+
+        user_stage = await self._run_context_stage(
+            "user_data", self._user_manager.get_user_data_by_id(userId, auth_token), None, timings
+        )
+        if user_stage is None:
+            self._cancel_context_tasks(context_tasks)
+            return {
+                "response": "No se pudieron obtener los datos del usuario. Intenta de nuevo en unos segundos.",
+                "error": "Datos del usuario no disponibles",
+                "user_name": None,
+                "preference_key": None,
+                "preference_value": None,
+                "command": None,
+            }, None
+        user_data_container, user_permissions_str, user_preferences_dict = user_stage
 
         if not user_data_container:
+            self._cancel_context_tasks(context_tasks)
             return {
                 "response": "Usuario no autorizado o no encontrado.",
                 "error": "Usuario no autorizado o no encontrado.",
@@ -118,10 +744,10 @@ class NLPModule:
                 "preference_key": None,
                 "preference_value": None,
                 "command": None,
-            }
+            }, None
 
         # --- Lógica para manejar la aceptación de recomendaciones ---
-        if ACCEPTANCE_PHRASES_REGEX.search(prompt):
+        if is_acceptance:
             logger.info(f"Prompt de usuario indica aceptación: {prompt}")
             last_recommendation = await self._user_manager.get_last_recommendation(userId)
 
@@ -137,43 +763,41 @@ class NLPModule:
                         "preference_key": None,
                         "preference_value": None,
                         "command": None,
-                    }
+                    }, None
                 
-                update_recommendation_url = f"http://localhost:3001/api/recomendaciones-ia/{recommendation_id}"
+                update_recommendation_path = f"/api/recomendaciones-ia/{recommendation_id}"
                 logger.info(f"Actualizando recomendación {recommendation_id} a aceptada=true")
                 
                 try:
                     headers = {"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"}
-                    async with httpx.AsyncClient() as client:
-                        patch_response = await client.patch(
-                            update_recommendation_url, 
-                            json={"aceptada": True}, 
-                            headers=headers
-                        )
-                        patch_response.raise_for_status()
-                        logger.info(f"Recomendación {recommendation_id} actualizada a aceptada=true")
-                        
-                        agenda_api_url = "http://localhost:3001/api/agenda"
-                        scheduled_at = (datetime.now() + timedelta(days=1)).isoformat() + "Z"
-                        agenda_payload = {
-                            "userId": str(userId),
-                            "destinationId": last_recommendation["destinationId"],
-                            "scheduledAt": scheduled_at,
-                            "status": "PENDING",
-                        }
-                        
-                        logger.info(f"Guardando en agenda: {agenda_payload}")
-                        agenda_response = await client.post(agenda_api_url, json=agenda_payload, headers=headers)
-                        agenda_response.raise_for_status()
-                        logger.info(f"Recomendación guardada en agenda exitosamente para {userId}")
-                        
-                        return {
-                            "response": "Excelente. He agendado tu viaje. Que lo disfrutes.",
-                            "user_name": user_data_container.get("nombre"),
-                            "preference_key": None,
-                            "preference_value": None,
-                            "command": f"AGENDA_RECOMMENDATION:{json.dumps(agenda_payload)}",
-                        }
+                    patch_response = await self._backend_client.patch(
+                        update_recommendation_path, 
+                        json={"aceptada": True}, 
+                        headers=headers
+                    )
+                    patch_response.raise_for_status()
+                    logger.info(f"Recomendación {recommendation_id} actualizada a aceptada=true")
+                    
+                    scheduled_at = (datetime.now() + timedelta(days=1)).isoformat() + "Z"
+                    agenda_payload = {
+                        "userId": str(userId),
+                        "destinationId": last_recommendation["destinationId"],
+                        "scheduledAt": scheduled_at,
+                        "status": "PENDING",
+                    }
+                    
+                    logger.info(f"Guardando en agenda: {agenda_payload}")
+                    agenda_response = await self._backend_client.post("/api/agenda", json=agenda_payload, headers=headers)
+                    agenda_response.raise_for_status()
+                    logger.info(f"Recomendación guardada en agenda exitosamente para {userId}")
+                    
+                    return {
+                        "response": "Excelente. He agendado tu viaje. Que lo disfrutes.",
+                        "user_name": user_data_container.get("nombre"),
+                        "preference_key": None,
+                        "preference_value": None,
+                        "command": f"AGENDA_RECOMMENDATION:{json.dumps(agenda_payload)}",
+                    }, None
                         
                 except httpx.RequestError as e:
                     logger.error(f"Error de red al procesar aceptación para {userId}: {e}")
@@ -183,7 +807,7 @@ class NLPModule:
                         "preference_key": None,
                         "preference_value": None,
                         "command": None,
-                    }
+                    }, None
                 except httpx.HTTPStatusError as e:
                     logger.error(f"Error HTTP al procesar aceptación para {userId}: {e.response.status_code} - {e.response.text}")
                     return {
@@ -192,7 +816,7 @@ class NLPModule:
                         "preference_key": None,
                         "preference_value": None,
                         "command": None,
-                    }
+                    }, None
                 except Exception as e:
                     logger.error(f"Error inesperado al procesar aceptación para {userId}: {e}")
                     return {
@@ -201,7 +825,7 @@ class NLPModule:
                         "preference_key": None,
                         "preference_value": None,
                         "command": None,
-                    }
+                    }, None
             else:
                 logger.warning(f"No se encontró ninguna recomendación previa para agendar para el usuario {userId}.")
                 return {
@@ -210,17 +834,34 @@ class NLPModule:
                     "preference_key": None,
                     "preference_value": None,
                     "command": None,
-                }
+                }, None
 
-        retries = 2
-        client = AsyncClient(host="http://localhost:11434")
+        # Mensajes triviales (saludos, hora, fecha, preferencias...): respuesta de plantilla sin LLM.
+        if intent is not None:
+            response_text = self._intent_router.respond(intent, user_data_container.get("nombre"), user_preferences_dict)
+            logger.info(f"Intención '{intent}' respondida sin LLM para {userId}.")
+            await self._user_manager.append_conversation_messages(userId, [
+                {"role": "user", "content": prompt},
+                {"role": "assistant", "content": response_text},
+            ])
+            return {
+                "response": response_text,
+                "user_name": user_data_container.get("nombre"),
+                "preference_key": None,
+                "preference_value": None,
+                "command": None,
+                "intent": intent,
+            }, None
 
-        user_conversation_history = self._user_manager.load_conversation_history(userId)
-        
-        # NUEVO: Limitar historial a los últimos 6 mensajes para evitar context overflow
-        if len(user_conversation_history) > 6:
-            logger.info(f"Historial tiene {len(user_conversation_history)} mensajes, limitando a últimos 6")
-            user_conversation_history = user_conversation_history[-6:]
+        # El presupuestador de contexto recorta después lo que no quepa en num_ctx. Los mensajes
+        # anteriores al historial cargado llegan resumidos (ver ConversationSummarizer).
+        user_conversation_history, conversation_summary, (ranking_features, query_scores) = (
+            await asyncio.gather(*context_tasks)
+        )
+        summary_message = (
+            {"role": "system", "content": f"RESUMEN DE LA CONVERSACIÓN ANTERIOR:\n{conversation_summary['content']}"}
+            if conversation_summary else None
+        )
 
         timezone = self._config.get("timezone", "UTC")
         current_datetime = get_current_datetime(timezone)
@@ -229,178 +870,218 @@ class NLPModule:
         current_location = get_country_from_timezone(timezone)
 
         user_budget = user_preferences_dict.get("preferencia_precio")
-        available_destinations = []
-        if user_budget is not None:
-            all_destinations = get_destinations_by_budget(user_budget)
-            # NUEVO: Limitar a 20 destinos más relevantes para evitar context overflow
-            logger.info(f"Total de destinos disponibles: {len(all_destinations)}, limitando a 20")
-            filtered_destinations = all_destinations[:20]
-            available_destinations = json.dumps(filtered_destinations, ensure_ascii=False)
-        else:
-            # Si no hay presupuesto, obtener todos pero limitados
-            all_destinations = get_destinations_by_budget(float('inf'))
-            logger.info(f"Sin presupuesto definido. Total de destinos: {len(all_destinations)}, limitando a 20")
-            filtered_destinations = all_destinations[:20]
-            available_destinations = json.dumps(filtered_destinations, ensure_ascii=False)
-
-        system_prompt = create_system_prompt(
-            config=self._config,
-            user_id=userId,
-            user_name=user_data_container.get("nombre"),
-            user_email=user_data_container.get("email"),
-            user_username=user_data_container.get("username"),
-            user_permissions_str=user_permissions_str,
-            destino_favorito=user_preferences_dict.get("destino_favorito"),
-            ubicacion_favorita=user_preferences_dict.get("ubicacion_favorita"),
-            categoria_favorita=user_preferences_dict.get("categoria_favorita"),
-            no_le_gusta=user_preferences_dict.get("no_le_gusta"),
-            user_budget=user_budget,
-            current_date=current_date,
-            current_time=current_time,
-            current_location=current_location,
-            available_destinations=available_destinations,
-            travelerTypes=user_preferences_dict.get("travelerTypes"),
-            travelingWith=user_preferences_dict.get("travelingWith"),
-            travelDuration=user_preferences_dict.get("travelDuration"),
-            activities=user_preferences_dict.get("activities"),
-            placeTypes=user_preferences_dict.get("placeTypes"),
-            budget=user_preferences_dict.get("budget"),
-            transport=user_preferences_dict.get("transport"),
+        # Solo los destinos más relevantes para el mensaje y afines al usuario (dentro de su presupuesto) entran en el prompt.
+        available_destinations = self._destination_ranker.rank(ranking_features, user_preferences_dict, query_scores=query_scores)
+        logger.info(
+            f"Total de destinos: {len(ranking_features)}, {len(query_scores)} relevantes para el mensaje, "
+            f"{len(available_destinations)} candidatos para el prompt "
+            f"(presupuesto: {user_budget if user_budget is not None else 'sin definir'})"
         )
 
-        for attempt in range(retries):
-            user_conversation_history.append({"role": "user", "content": prompt})
+        def render_prompt(destinations: list) -> SystemPromptParts:
+            return create_system_prompt_parts(
+                config=self._config,
+                user_id=userId,
+                user_name=user_data_container.get("nombre"),
+                user_email=user_data_container.get("email"),
+                user_username=user_data_container.get("username"),
+                user_permissions_str=user_permissions_str,
+                destino_favorito=user_preferences_dict.get("destino_favorito"),
+                ubicacion_favorita=user_preferences_dict.get("ubicacion_favorita"),
+                categoria_favorita=user_preferences_dict.get("categoria_favorita"),
+                no_le_gusta=user_preferences_dict.get("no_le_gusta"),
+                user_budget=user_budget,
+                current_date=current_date,
+                current_time=current_time,
+                current_location=current_location,
+                available_destinations=destinations,
+                travelerTypes=user_preferences_dict.get("travelerTypes"),
+                travelingWith=user_preferences_dict.get("travelingWith"),
+                travelDuration=user_preferences_dict.get("travelDuration"),
+                activities=user_preferences_dict.get("activities"),
+                placeTypes=user_preferences_dict.get("placeTypes"),
+                budget=user_preferences_dict.get("budget"),
+                transport=user_preferences_dict.get("transport"),
+            )
 
-            messages = [
-                {"role": "system", "content": system_prompt},
-            ] + user_conversation_history
+        context_plan = self._context_budgeter.fit(
+            render_prompt,
+            user_conversation_history,
+            available_destinations,
+            prompt,
+            summary=summary_message["content"] if summary_message else None,
+        )
+        prompt_parts = context_plan.prompt_parts
+        timings["context_ms"] = round((time.perf_counter() - context_start) * 1000, 1)
+        logger.info(f"Contexto del turno listo para {userId} en {timings['context_ms']} ms: {timings}")
+        if len(context_plan.history) < len(user_conversation_history):
+            # Lo recortado no está en el resumen: se pliega en él tras este turno.
+            self._summarizer.note_trimmed(userId, len(context_plan.history))
+        user_conversation_history = context_plan.history
+        available_destinations = context_plan.destinations
 
-            full_response_content, llm_error = await self._get_llm_response(client, messages)
-            if llm_error:
-                if attempt == retries - 1:
-                    return {
-                        "response": llm_error,
-                        "error": llm_error,
-                        "user_name": user_data_container.get("nombre"),
-                        "preference_key": None,
-                        "preference_value": None,
-                        "command": None,
-                    }
-                continue
+        # Orden pensado para la caché de prefijos de Ollama: prefijo estático y contexto del
+        # usuario, historial, y justo antes del mensaje actual los datos volátiles (fecha y hora).
+        messages = [
+            {"role": "system", "content": prompt_parts.cacheable},
+        ] + ([summary_message] if summary_message else []) + user_conversation_history
+        if prompt_parts.volatile_context:
+            messages.append({"role": "system", "content": prompt_parts.volatile_context})
+        user_message = {"role": "user", "content": prompt}
+        messages.append(user_message)
+        user_conversation_history.append(user_message)
 
-            user_conversation_history.append({"role": "assistant", "content": full_response_content})
-            command_to_return = None
-            is_recommendation = re.search(r"\*\*Destino:\*\*|\*\*Ubicación:\*\*|\*\*Presupuesto:\*\*", full_response_content)
-            recommendation_match = RECOMMENDATION_JSON_REGEX.search(full_response_content)
-            
-            if recommendation_match:
-                try:
-                    recommendation_json_str = recommendation_match.group(1) or recommendation_match.group(2)
-                    command_to_return = recommendation_match.group(0)
-                    recommendation_data = json.loads(recommendation_json_str)
-                    recommendation_id = await self._user_manager.save_recommendation_to_api(
-                        userId, 
-                        recommendation_data, 
-                        auth_token
-                    )
-                    
-                    if recommendation_id:
-                        recommendation_data["recommendation_id"] = recommendation_id
-                        await self._user_manager.save_last_recommendation(userId, recommendation_data)
-                        logger.info(f"Recomendación guardada completamente para {userId}: {recommendation_data}")
-                    
-                except json.JSONDecodeError as e:
-                    logger.error(f"Error al decodificar JSON de recomendación para el usuario {userId}: {e}")
-                except Exception as e:
-                    logger.error(f"Error inesperado al procesar JSON de recomendación para el usuario {userId}: {e}")
-            elif is_recommendation:
-                logger.warning(f"Recomendación detectada sin marcador JSON para {userId}. Intentando extraer destinationId...")
-                try:
-                    destino_match = re.search(r"\*\*Destino:\*\*\s*(.+?)(?:\n|\*\*)", full_response_content)
-                    if destino_match:
-                        destino_nombre = destino_match.group(1).strip()
-                        logger.info(f"Destino detectado en respuesta: '{destino_nombre}'")
-                        destinations = get_destinations_by_budget(user_preferences_dict.get("preferencia_precio", float('inf')))
-                        matching_dest = next((d for d in destinations if d.get("name") == destino_nombre), None)
-                        
-                        if matching_dest:
-                            recommendation_data = {
-                                "userId": str(userId),
-                                "destinationId": matching_dest["id"],
-                                "tipo": "basado_en_preferencias",
-                                "aceptada": False
-                            }
-                            recommendation_id = await self._user_manager.save_recommendation_to_api(
-                                userId, 
-                                recommendation_data, 
-                                auth_token
-                            )
-                            
-                            if recommendation_id:
-                                recommendation_data["recommendation_id"] = recommendation_id
-                                await self._user_manager.save_last_recommendation(userId, recommendation_data)
-                                command_to_return = f"GENERAR_RECOMENDACION_JSON: {json.dumps(recommendation_data)}"
-                                logger.info(f"Recomendación recuperada mediante fallback para {userId}: {recommendation_data}")
-                        else:
-                            logger.warning(f"No se pudo encontrar destino '{destino_nombre}' en available_destinations")
-                            logger.debug(f"Destinos disponibles: {[d.get('name') for d in destinations]}")
-                    else:
-                        logger.warning(f"No se pudo extraer el nombre del destino de la respuesta")
-                except Exception as e:
-                    logger.error(f"Error en fallback de recomendación para {userId}: {e}")
-            self._user_manager.save_conversation_history(userId, user_conversation_history)
-            full_response_content = await self._user_manager.handle_preference_setting(
-                user_data_container, full_response_content, auth_token
-            )
-            full_response_content = PREFERENCE_MARKERS_REGEX.sub("", full_response_content).strip()
-            return {
-                "response": full_response_content,
-                "user_name": user_data_container.get("nombre"),
-                "preference_key": None,
-                "preference_value": None,
-                "command": command_to_return,
-            }
+        return None, {
+            "user_id": userId,
+            "auth_token": auth_token,
+            "user_data": user_data_container,
+            "preferences": user_preferences_dict,
+            "history": user_conversation_history,
+            "summary": conversation_summary["content"] if conversation_summary else None,
+            "user_message": user_message,
+            "destinations": available_destinations,
+            "timings": timings,
+            "messages": messages,
+            "model_options": self._build_model_options(context_plan.num_ctx),
+            # Guardados de recomendaciones lanzados durante la generación, por destinationId.
+            "recommendation_saves": {},
+        }
 
-        self._online = False
-        return {
-            "response": "No se pudo procesar tu solicitud. Intenta más tarde.",
-            "error": "Agotados intentos",
-            "user_name": user_data_container.get("nombre"),
-            "preference_key": None,
-            "preference_value": None,
-            "command": None,
+    async def _run_context_stage(self, name: str, awaitable, fallback: Any, timings: dict) -> Any:
+        """
+        Ejecuta una etapa de la preparación del contexto con su tiempo límite.
+
+        Si la etapa tarda demasiado o falla se usa `fallback` y el turno continúa; una etapa
+        que agota el tiempo sigue ejecutándose en segundo plano y deja su caché caliente para
+        el siguiente turno. La duración se guarda en `timings[f"{name}_ms"]`.
+        """
+        stage_stats = self._context_stage_stats.setdefault(name, {"runs": 0, "timeouts": 0, "errors": 0})
+        stage_stats["runs"] += 1
+        timeout = self._context_stage_timeouts.get(name)
+        task = asyncio.ensure_future(awaitable)
+        start = time.perf_counter()
+        try:
+            return await asyncio.wait_for(asyncio.shield(task), timeout)
+        except asyncio.TimeoutError:
+            stage_stats["timeouts"] += 1
+            # Recoge el resultado o el error de la etapa cuando termine, para que no quede sin consumir.
+            task.add_done_callback(lambda done: done.cancelled() or done.exception())
+            logger.warning(f"Etapa de contexto '{name}' sin respuesta tras {timeout} s; se continúa sin ella.")
+            return fallback
+        except Exception as e:
+            stage_stats["errors"] += 1
+            logger.error(f"Error en la etapa de contexto '{name}': {e}; se continúa sin ella.")
+            return fallback
+        finally:
+            timings[f"{name}_ms"] = round((time.perf_counter() - start) * 1000, 1)
+
+    async def _load_history(self, userId: int, summary_task: asyncio.Future) -> list:
+        """Historial reciente del usuario, ampliado hacia atrás hasta donde llega su resumen."""
+        summary = await summary_task
+        return await self._user_manager.load_conversation_history(
+            userId, self._context_budgeter.max_history_messages, since=self._summarizer.history_limits(summary)
+        )
+
+    async def _load_catalog_context(self, prompt: str) -> tuple:
+        """Características del ranking de la versión actual del catálogo y la relevancia BM25 de cada destino para el mensaje."""
+        ranking_features = await self._destination_catalog.get_features("ranking")
+        query_scores = await self._destination_catalog.score_query(prompt)
+        return ranking_features, query_scores
+
+    @staticmethod
+    def _cancel_context_tasks(context_tasks: Optional[list]) -> None:
+        """Descarta las etapas de contexto lanzadas para un turno que termina antes de usarlas."""
+        for task in context_tasks or []:
+            task.cancel()
+
+    def _build_model_options(self, num_ctx: Optional[int] = None) -> dict:
+        """
+        Construye las opciones de generación de Ollama a partir de la configuración del modelo.
+        `num_ctx`, si se indica, sustituye a la ventana de contexto configurada para este turno.
+        """
+        model_options = {
+            "temperature": self._config["model"].get("temperature", 0.3),
+            "num_predict": self._config["model"].get("max_tokens", 1024),
         }
+        if "top_p" in self._config["model"]:
+            model_options["top_p"] = self._config["model"]["top_p"]
+
+        if "top_k" in self._config["model"]:
+            model_options["top_k"] = self._config["model"]["top_k"]
+
+        if "repeat_penalty" in self._config["model"]:
+            model_options["repeat_penalty"] = self._config["model"]["repeat_penalty"]
 
-    async def _get_llm_response(self, client, messages: list[dict], retries=2) -> tuple:
-        """Obtiene la respuesta del modelo de lenguaje."""
+        if num_ctx is not None:
+            model_options["num_ctx"] = num_ctx
+        elif "num_ctx" in self._config["model"]:
+            model_options["num_ctx"] = self._config["model"]["num_ctx"]
+
+        return model_options
+
+    async def _stream_llm_response(
+        self, messages: list[dict], response_format: Any = "", options: Optional[dict] = None, route_key: Any = None
+    ) -> AsyncIterator[str]:
+        """
+        Emite los fragmentos de texto de la respuesta del modelo a medida que llegan.
+        `response_format` se envía como `format` de Ollama ("json" o un esquema JSON),
+        `options` sustituye a las opciones de generación por defecto y `route_key` (el usuario)
+        elige el servidor Ollama cuando el reparto es por afinidad.
+        """
+        async with self._ollama_manager.acquire(route_key) as client:
+            response_stream = await client.chat(
+                model=self._config["model"]["name"],
+                messages=messages,
+                options=options or self._build_model_options(),
+                keep_alive=self._config["model"].get("keep_alive"),
+                format=response_format,
+                stream=True,
+            )
+            try:
+                async for chunk in response_stream:
+                    if "content" in chunk["message"] and chunk["message"]["content"]:
+                        yield chunk["message"]["content"]
+            finally:
+                # Si quien consume deja el stream a medias, cerrar la conexión hace que Ollama
+                # deje de generar en lugar de seguir hasta `num_predict`.
+                await response_stream.aclose()
+
+    async def _get_llm_response(
+        self, messages: list[dict], retries=2, response_format: Any = "", options: Optional[dict] = None,
+        route_key: Any = None, marker_parser: Optional[MarkerStreamFilter] = None, turn: Optional[dict] = None,
+        lane: str = LANE_INTERACTIVE, timings: Optional[dict] = None,
+    ) -> tuple:
+        """
+        Obtiene la respuesta del modelo de lenguaje.
+        Con `marker_parser` (el analizador de `turn`) la respuesta se analiza a medida que llega y
+        la generación se corta en cuanto se han recibido todas las recomendaciones. Los guardados
+        lanzados por un intento fallido se cancelan antes de reintentar.
+
+        Cada intento reserva su propio slot del planificador en el carril `lane` y lo libera al
+        terminar, de modo que un turno que falla no retiene el slot durante los reintentos y
+        vuelve a pasar por el control de admisión.
+
+        Raises:
+            LLMSchedulerOverloaded: Si el planificador no admite alguno de los intentos.
+        """
         for attempt in range(retries):
             try:
-                model_options = {
-                    "temperature": self._config["model"].get("temperature", 0.3),
-                    "num_predict": self._config["model"].get("max_tokens", 1024),
-                }
-                if "top_p" in self._config["model"]:
-                    model_options["top_p"] = self._config["model"]["top_p"]
-                
-                if "top_k" in self._config["model"]:
-                    model_options["top_k"] = self._config["model"]["top_k"]
-                
-                if "repeat_penalty" in self._config["model"]:
-                    model_options["repeat_penalty"] = self._config["model"]["repeat_penalty"]
-                
-                if "num_ctx" in self._config["model"]:
-                    model_options["num_ctx"] = self._config["model"]["num_ctx"]
-
-                response_stream = await client.chat(
-                    model=self._config["model"]["name"],
-                    messages=messages,
-                    options=model_options,
-                    stream=True,
-                )
                 full_response_content = ""
-                async for chunk in response_stream:
-                    if "content" in chunk["message"]:
-                        full_response_content += chunk["message"]["content"]
+                if marker_parser is not None:
+                    marker_parser.reset()
+                    self._discard_recommendation_saves(turn)
+                async with self._scheduler.slot(lane, timings), aclosing(
+                    self._stream_llm_response(messages, response_format, options, route_key)
+                ) as response_stream:
+                    async for piece in response_stream:
+                        full_response_content += piece
+                        if marker_parser is None:
+                            continue
+                        marker_parser.feed(piece)
+                        if self._should_stop_generation(turn):
+                            break
+                if marker_parser is not None:
+                    marker_parser.flush()
 
                 if not full_response_content:
                     logger.warning("Respuesta vacía de Ollama. Reintentando...")
@@ -408,10 +1089,16 @@ class NLPModule:
 
                 return full_response_content, None
 
+            except LLMSchedulerOverloaded:
+                if marker_parser is not None:
+                    self._discard_recommendation_saves(turn)
+                raise
             except (ResponseError, ConnectError, Exception) as e:
                 logger.error(f"Error con Ollama: {e}. Reintentando...")
+                if marker_parser is not None:
+                    self._discard_recommendation_saves(turn)
                 if attempt == retries - 1:
                     return None, f"Error con Ollama después de {retries} intentos: {e}"
                 continue
 
-        return None, "No se pudo generar una respuesta después de varios intentos."
+        return None, "No se pudo generar una respuesta después de varios intentos."
\ No newline at end of file
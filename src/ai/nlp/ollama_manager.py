@@ -1,86 +1,418 @@
+import asyncio
+import hashlib
 import subprocess
 import time
 import logging
 import os
 import ollama
-from typing import Dict, Any, Optional
+import httpx
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Optional, List, AsyncIterator
 
 logger = logging.getLogger("OllamaManager")
 
+DEFAULT_OLLAMA_HOST = "http://localhost:11434"
+DEFAULT_TIMEOUTS = {"connect": 5.0, "read": 120.0, "write": 30.0, "pool": 10.0}
+DEFAULT_POOL = {"max_connections": 10, "max_keepalive_connections": 10, "keepalive_expiry": 60.0}
+DEFAULT_STARTUP = {"server_timeout": 30.0, "probe_interval": 0.25, "warmup": True, "warmup_prompt": "hola"}
+DEFAULT_ROUTING = {"sticky": False, "sticky_max_imbalance": 2, "max_failures": 3, "health_interval": 10.0}
+
+
+def is_endpoint_error(error: BaseException) -> bool:
+    """
+    Indica si el error es un problema del servidor Ollama (de red o una respuesta 5xx) y no de la
+    solicitud: un 4xx (modelo inexistente, `format` inválido...) no dice nada de la salud del servidor.
+    """
+    if isinstance(error, httpx.TransportError):
+        return True
+    return isinstance(error, ollama.ResponseError) and error.status_code >= 500
+
+
+class OllamaEndpoint:
+    """Un servidor Ollama del pool: su cliente asíncrono, las generaciones en curso y su estado de salud."""
+
+    def __init__(self, host: str, client_settings: Dict[str, Any]):
+        self.host: str = host
+        self._client_settings = client_settings
+        self.client: Optional[ollama.AsyncClient] = None
+        self.in_flight: int = 0
+        self.healthy: bool = True
+        self.consecutive_failures: int = 0
+        self.stats: Dict[str, int] = {"requests": 0, "errors": 0, "ejections": 0, "readmissions": 0}
+
+    def get_client(self) -> ollama.AsyncClient:
+        """Devuelve el cliente asíncrono del servidor, creándolo si es necesario."""
+        if self.client is None:
+            logger.info(f"Creando cliente asíncrono de Ollama compartido para {self.host}.")
+            self.client = ollama.AsyncClient(host=self.host, **self._client_settings)
+        return self.client
+
+
 class OllamaManager:
     """
     Gestiona el ciclo de vida del servidor Ollama y la conectividad del modelo.
+
+    El arranque (`start`) es asíncrono: espera al servidor sin bloquear el bucle de eventos y
+    después precarga el modelo en segundo plano, de modo que el primer usuario no paga su carga.
+
+    Con varios `hosts`, cada generación (`acquire`) va al servidor sano con menos generaciones
+    en curso, o siempre al mismo servidor para cada usuario con `routing.sticky`. Los servidores
+    que fallan se expulsan y se readmiten cuando vuelven a superar la comprobación de salud.
     """
     def __init__(self, model_config: Dict[str, Any]):
         """
-        Inicializa OllamaManager, intentando iniciar el servidor Ollama y verificar la conexión.
+        Prepara OllamaManager. El servidor se inicia y se verifica con `start`.
 
         Args:
             model_config (Dict[str, Any]): Configuración del modelo Ollama, incluyendo nombre, temperatura y max_tokens.
+                Acepta además `hosts` (lista de URLs de Ollama), `timeouts` y `pool` para el cliente HTTP compartido,
+                `startup` para la espera al servidor y la precarga del modelo, y `routing` para el reparto
+                entre servidores.
         """
         self._ollama_process: Optional[subprocess.Popen] = None
         self._online: bool = False
         self._model_config: Dict[str, Any] = model_config
         self._model_name: Optional[str] = model_config.get("name")
+        self._hosts: List[str] = self._read_hosts(model_config)
+        self._active_host: str = self._hosts[0]
+        self._client_settings: Dict[str, Any] = self._read_client_settings(model_config)
+        self._endpoints: Dict[str, OllamaEndpoint] = self._build_endpoints()
+        self._retired_async_clients: List[ollama.AsyncClient] = []
+        self._routing: Dict[str, Any] = {**DEFAULT_ROUTING, **model_config.get("routing", {})}
+        self._health_task: Optional[asyncio.Task] = None
+        self._startup_config: Dict[str, Any] = {**DEFAULT_STARTUP, **model_config.get("startup", {})}
+        self._warmup_task: Optional[asyncio.Task] = None
+        # Duración de cada fase del arranque en frío, en ms desde el inicio de `start`.
+        self._startup_stats: Dict[str, Any] = {
+            "server_started_by_app": False,
+            "server_ready_ms": None,
+            "model_loaded_ms": None,
+            "first_token_ms": None,
+            "warmup": "pending" if self._startup_config["warmup"] else "disabled",
+        }
+
+    async def start(self) -> bool:
+        """
+        Inicia (si hace falta) y verifica el servidor de Ollama sin bloquear el bucle de eventos,
+        y lanza en segundo plano la precarga del modelo.
+
+        Returns:
+            bool: True si el servidor respondió y el modelo configurado está disponible.
+        """
+        start = time.perf_counter()
         logger.debug("Iniciando Ollama server...")
-        self._start_ollama_server()
-        logger.debug("Verificando conexión a Ollama...")
-        self._online = self._check_connection()
+        if await self._start_ollama_server():
+            self._startup_stats["server_ready_ms"] = self._elapsed_ms(start)
+            logger.debug("Verificando conexión a Ollama...")
+            self._online = await self._acheck_connection()
         if self._online:
-            logger.info("OllamaManager inicializado y en línea.")
+            logger.info(f"OllamaManager inicializado y en línea en {self._startup_stats['server_ready_ms']} ms.")
+            self._start_health_checks()
+            if self._startup_config["warmup"]:
+                self._warmup_task = asyncio.create_task(self._warmup(start))
         else:
             logger.warning("OllamaManager inicializado pero no está en línea.")
+            if self._startup_config["warmup"]:
+                self._startup_stats["warmup"] = "skipped"
+        return self._online
+
+    async def _warmup(self, start: float) -> None:
+        """
+        Precarga el modelo en memoria y lo fija con `keep_alive`, midiendo la carga y el primer token.
+
+        Usa el mismo `num_ctx` que los turnos: si fuera distinto, Ollama recargaría el modelo
+        con la primera solicitud real. Con varios servidores se precargan todos los sanos; los
+        tiempos corresponden al host activo.
+        """
+        client = self.get_async_client()
+        keep_alive = self._model_config.get("keep_alive")
+        options = {"num_predict": 1}
+        if "num_ctx" in self._model_config:
+            options["num_ctx"] = self._model_config["num_ctx"]
+        try:
+            # Una generación con prompt vacío solo carga el modelo.
+            preloads = [
+                endpoint.get_client().generate(model=self._model_name, prompt="", options=options, keep_alive=keep_alive)
+                for endpoint in self._endpoints.values()
+                if endpoint.healthy and endpoint.host != self._active_host
+            ]
+            other_results = asyncio.gather(*preloads, return_exceptions=True)
+            await client.generate(model=self._model_name, prompt="", options=options, keep_alive=keep_alive)
+            self._startup_stats["model_loaded_ms"] = self._elapsed_ms(start)
+            for error in await other_results:
+                if isinstance(error, Exception):
+                    logger.warning(f"No se pudo precargar el modelo en un servidor secundario: {error}")
+
+            stream = await client.chat(
+                model=self._model_name,
+                messages=[{"role": "user", "content": self._startup_config["warmup_prompt"]}],
+                options=options,
+                keep_alive=keep_alive,
+                stream=True,
+            )
+            async for _ in stream:
+                if self._startup_stats["first_token_ms"] is None:
+                    self._startup_stats["first_token_ms"] = self._elapsed_ms(start)
+            self._startup_stats["warmup"] = "done"
+            logger.info(
+                f"Modelo '{self._model_name}' precargado (keep_alive={keep_alive}): servidor listo en "
+                f"{self._startup_stats['server_ready_ms']} ms, modelo cargado en {self._startup_stats['model_loaded_ms']} ms, "
+                f"primer token en {self._startup_stats['first_token_ms']} ms."
+            )
+        except asyncio.CancelledError:
+            self._startup_stats["warmup"] = "cancelled"
+            raise
+        except Exception as e:
+            self._startup_stats["warmup"] = "failed"
+            logger.warning(f"No se pudo precargar el modelo '{self._model_name}': {e}")
+
+    @staticmethod
+    def _elapsed_ms(start: float) -> float:
+        return round((time.perf_counter() - start) * 1000, 1)
 
-    def _start_ollama_server(self, retries: int = 30, delay: int = 1):
+    @staticmethod
+    def _read_hosts(model_config: Dict[str, Any]) -> List[str]:
         """
-        Inicia el servidor de Ollama como un subproceso si no está ya en ejecución.
-        Implementa un mecanismo de reintento para esperar a que el servidor esté listo.
+        Obtiene la lista de hosts de Ollama configurados, en orden de preferencia.
 
         Args:
-            retries (int): Número de intentos para conectar con el servidor.
-            delay (int): Retraso en segundos entre intentos.
+            model_config (Dict[str, Any]): Configuración del modelo Ollama.
+
+        Returns:
+            List[str]: Hosts configurados o el host local por defecto.
         """
-        logger.debug("Intentando verificar si el servidor Ollama ya está en ejecución.")
+        hosts = model_config.get("hosts") or [DEFAULT_OLLAMA_HOST]
+        if isinstance(hosts, str):
+            hosts = [hosts]
+        return [host.rstrip("/") for host in hosts]
+
+    @staticmethod
+    def _read_client_settings(model_config: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Construye los parámetros del cliente HTTP (timeouts y pool de conexiones keep-alive).
+
+        Args:
+            model_config (Dict[str, Any]): Configuración del modelo Ollama.
+
+        Returns:
+            Dict[str, Any]: Argumentos `timeout` y `limits` para el cliente httpx de Ollama.
+        """
+        timeouts = {**DEFAULT_TIMEOUTS, **model_config.get("timeouts", {})}
+        pool = {**DEFAULT_POOL, **model_config.get("pool", {})}
+        return {
+            "timeout": httpx.Timeout(
+                connect=timeouts["connect"],
+                read=timeouts["read"],
+                write=timeouts["write"],
+                pool=timeouts["pool"],
+            ),
+            "limits": httpx.Limits(
+                max_connections=pool["max_connections"],
+                max_keepalive_connections=pool["max_keepalive_connections"],
+                keepalive_expiry=pool["keepalive_expiry"],
+            ),
+        }
+
+    def get_async_client(self) -> ollama.AsyncClient:
+        """
+        Devuelve el cliente asíncrono compartido del host activo, creándolo si es necesario.
+        Las generaciones deben usar `acquire`, que reparte la carga entre los servidores.
+
+        Returns:
+            ollama.AsyncClient: Cliente de Ollama con pool de conexiones keep-alive acotado.
+        """
+        return self._endpoints[self._active_host].get_client()
+
+    def _build_endpoints(self) -> Dict[str, OllamaEndpoint]:
+        """Crea un OllamaEndpoint por cada host configurado."""
+        return {host: OllamaEndpoint(host, self._client_settings) for host in self._hosts}
+
+    @asynccontextmanager
+    async def acquire(self, route_key: Optional[Any] = None, track_health: bool = True) -> AsyncIterator[ollama.AsyncClient]:
+        """
+        Reserva un servidor Ollama para una generación y devuelve su cliente.
+
+        Se elige el servidor sano con menos generaciones en curso. Con `routing.sticky`, cada
+        `route_key` (el usuario) va siempre al mismo servidor, para aprovechar su caché de
+        prefijos, salvo que tenga `sticky_max_imbalance` generaciones más que el menos cargado.
+        Los errores de conexión y las respuestas 5xx cuentan para expulsar al servidor.
+
+        Args:
+            route_key (Optional[Any]): Clave de afinidad, normalmente el id del usuario.
+            track_health (bool): Si el resultado cuenta para la salud del servidor. Con False
+                (por ejemplo, embeddings con otro modelo) los fallos no lo expulsan.
+        """
+        endpoint = self._select_endpoint(route_key)
+        endpoint.in_flight += 1
+        endpoint.stats["requests"] += 1
         try:
-            client = ollama.Client(host='http://localhost:11434')
-            client.list()
-            logger.info("El servidor de Ollama ya está en ejecución.")
-            self._online = True
+            yield endpoint.get_client()
+        except Exception as e:
+            if track_health and is_endpoint_error(e):
+                self._record_failure(endpoint, e)
+            raise
+        else:
+            if track_health:
+                endpoint.consecutive_failures = 0
+        finally:
+            endpoint.in_flight -= 1
+
+    def _select_endpoint(self, route_key: Optional[Any]) -> OllamaEndpoint:
+        """Servidor para la siguiente generación (si todos están expulsados, se prueba con todos)."""
+        endpoints = list(self._endpoints.values())
+        if len(endpoints) == 1:
+            return endpoints[0]
+        candidates = [endpoint for endpoint in endpoints if endpoint.healthy] or endpoints
+        least_loaded = min(candidates, key=lambda endpoint: (endpoint.in_flight, endpoint.stats["requests"]))
+        if not self._routing["sticky"] or route_key is None:
+            return least_loaded
+        preferred = max(candidates, key=lambda endpoint: self._affinity(endpoint.host, route_key))
+        if preferred.in_flight - least_loaded.in_flight > self._routing["sticky_max_imbalance"]:
+            return least_loaded
+        return preferred
+
+    @staticmethod
+    def _affinity(host: str, route_key: Any) -> int:
+        """
+        Puntuación de rendezvous hashing: cada clave prefiere el host con la mayor. Al expulsar
+        un servidor solo cambian de host las claves que estaban en él.
+        """
+        digest = hashlib.blake2b(f"{host}|{route_key}".encode("utf-8"), digest_size=8).digest()
+        return int.from_bytes(digest, "big")
+
+    def _record_failure(self, endpoint: OllamaEndpoint, error: Exception) -> None:
+        """Cuenta un fallo del servidor y lo expulsa tras `max_failures` fallos seguidos."""
+        endpoint.stats["errors"] += 1
+        endpoint.consecutive_failures += 1
+        if endpoint.healthy and endpoint.consecutive_failures >= self._routing["max_failures"]:
+            self._eject(endpoint, f"{endpoint.consecutive_failures} fallos seguidos ({error})")
+
+    def _eject(self, endpoint: OllamaEndpoint, reason: str) -> None:
+        if len(self._endpoints) == 1 or not endpoint.healthy:
             return
-        except ollama.ResponseError:
-            logger.info("El servidor de Ollama no está en ejecución, intentando iniciarlo...")
+        endpoint.healthy = False
+        endpoint.stats["ejections"] += 1
+        logger.warning(f"Servidor Ollama {endpoint.host} expulsado del reparto: {reason}.")
+
+    async def _check_endpoint(self, endpoint: OllamaEndpoint) -> bool:
+        """
+        Comprueba que el servidor responda y tenga el modelo configurado, y actualiza su estado:
+        lo expulsa si no, y lo readmite si estaba expulsado y vuelve a estar disponible.
+
+        Returns:
+            bool: True si el servidor respondió (aunque le falte el modelo).
+        """
+        try:
+            available_models = await endpoint.get_client().list()
         except Exception as e:
-            logger.warning(f"Error al verificar el estado de Ollama: {e}. Intentando iniciar el servidor.")
+            logger.debug(f"Host de Ollama {endpoint.host} no disponible: {e}")
+            self._eject(endpoint, f"no responde ({e})")
+            return False
+        model_names = [m.get("name") for m in available_models.get("models", [])]
+        if self._model_name not in model_names:
+            self._eject(endpoint, f"no tiene el modelo '{self._model_name}'")
+        elif not endpoint.healthy:
+            endpoint.healthy = True
+            endpoint.consecutive_failures = 0
+            endpoint.stats["readmissions"] += 1
+            logger.info(f"Servidor Ollama {endpoint.host} readmitido en el reparto.")
+        return True
+
+    def _start_health_checks(self) -> None:
+        """Lanza la comprobación periódica de salud si hay varios servidores."""
+        interval = float(self._routing["health_interval"])
+        if len(self._endpoints) > 1 and interval > 0 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_check_loop(interval))
+
+    async def _health_check_loop(self, interval: float) -> None:
+        """Comprueba todos los servidores cada `interval` segundos."""
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await asyncio.gather(*(self._check_endpoint(endpoint) for endpoint in list(self._endpoints.values())))
+            except Exception as e:
+                logger.error(f"Error en la comprobación de salud de los servidores Ollama: {e}")
+
+    def _set_active_host(self, host: str) -> None:
+        """
+        Cambia el host activo (el que usa `get_async_client`).
+
+        Args:
+            host (str): Nuevo host de Ollama.
+        """
+        if host == self._active_host:
+            return
+        logger.info(f"Cambiando host activo de Ollama de {self._active_host} a {host}.")
+        self._active_host = host
+
+    async def _aprobe_hosts(self) -> bool:
+        """
+        Comprueba todos los hosts a la vez y marca como activo el primero que responde con el modelo.
+
+        Returns:
+            bool: True si algún host respondió, False en caso contrario.
+        """
+        endpoints = list(self._endpoints.values())
+        reachable = await asyncio.gather(*(self._check_endpoint(endpoint) for endpoint in endpoints))
+        responding = [endpoint for endpoint, ok in zip(endpoints, reachable) if ok]
+        if not responding:
+            return False
+        active = next((endpoint for endpoint in responding if endpoint.healthy), responding[0])
+        self._set_active_host(active.host)
+        logger.info(f"Servidores Ollama disponibles: {len(responding)}/{len(endpoints)}.")
+        return True
+
+    async def _start_ollama_server(self) -> bool:
+        """
+        Inicia el servidor de Ollama como un subproceso si no está ya en ejecución y espera a que
+        responda, sondeando cada `probe_interval` segundos hasta `server_timeout` sin bloquear el
+        bucle de eventos.
+
+        Returns:
+            bool: True si el servidor responde, False en caso contrario.
+        """
+        logger.debug("Intentando verificar si el servidor Ollama ya está en ejecución.")
+        if await self._aprobe_hosts():
+            logger.info(f"El servidor de Ollama ya está en ejecución en {self._active_host}.")
+            return True
+        logger.info("El servidor de Ollama no está en ejecución, intentando iniciarlo...")
+        self._set_active_host(self._hosts[0])
 
         try:
+            # La salida no se lee: con PIPE el servidor se bloquearía al llenarse el búfer.
             self._ollama_process = subprocess.Popen(
                 ["ollama", "serve"],
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=subprocess.DEVNULL,
                 creationflags=subprocess.CREATE_NO_WINDOW if os.name == 'nt' else 0
             )
+            self._startup_stats["server_started_by_app"] = True
             logger.info("Servidor de Ollama iniciado en segundo plano.")
-            
-            for attempt in range(retries):
-                try:
-                    client = ollama.Client(host='http://localhost:11434')
-                    client.list()
-                    logger.info("Conexión con el servidor de Ollama establecida exitosamente.")
-                    self._online = True
-                    return
-                except ollama.ResponseError:
-                    logger.debug(f"Intento {attempt + 1}/{retries}: Servidor Ollama aún no disponible. Reintentando en {delay}s...")
-                    time.sleep(delay)
-            
+
+            interval = float(self._startup_config["probe_interval"])
+            deadline = time.monotonic() + float(self._startup_config["server_timeout"])
+            local_endpoint = self._endpoints[self._hosts[0]]
+            attempt = 0
+            while time.monotonic() < deadline:
+                attempt += 1
+                if await self._check_endpoint(local_endpoint):
+                    logger.info(f"Conexión con el servidor de Ollama establecida exitosamente (intento {attempt}).")
+                    return True
+                if self._ollama_process.poll() is not None:
+                    logger.error(f"El servidor de Ollama terminó con código {self._ollama_process.returncode} al iniciarse.")
+                    return False
+                logger.debug(f"Intento {attempt}: Servidor Ollama aún no disponible. Reintentando en {interval}s...")
+                await asyncio.sleep(interval)
+
             logger.error("Fallo al conectar con el servidor de Ollama después de iniciarlo en el tiempo esperado.")
-            self._online = False
+            return False
 
         except FileNotFoundError:
             logger.error("El comando 'ollama' no se encontró. Asegúrese de que Ollama esté instalado y en el PATH.")
-            self._online = False
+            return False
         except Exception as e:
             logger.error(f"Error inesperado al iniciar el servidor de Ollama: {e}")
-            self._online = False
+            return False
 
     def __del__(self):
         """
@@ -88,6 +420,37 @@ class OllamaManager:
         """
         self.close()
 
+    def _retire_endpoints(self) -> None:
+        """
+        Retira los clientes asíncronos de los servidores sin cerrarlos, ya que puede haber
+        solicitudes en curso. Los clientes retirados se cierran en `aclose`.
+        """
+        for endpoint in self._endpoints.values():
+            if endpoint.client is not None:
+                self._retired_async_clients.append(endpoint.client)
+                endpoint.client = None
+
+    async def aclose(self) -> None:
+        """
+        Cierra ordenadamente el pool de conexiones del cliente asíncrono compartido y
+        libera el resto de recursos. Debe llamarse al apagar la aplicación.
+        """
+        for task in (self._warmup_task, self._health_task):
+            if task is not None and not task.done():
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+        self._health_task = None
+        self._retire_endpoints()
+        for client in self._retired_async_clients:
+            try:
+                await client._client.aclose()
+            except Exception as e:
+                logger.warning(f"Error al cerrar el cliente asíncrono de Ollama: {e}")
+        if self._retired_async_clients:
+            logger.info("Clientes asíncronos de Ollama cerrados.")
+        self._retired_async_clients = []
+        self.close()
+
     def close(self):
         """
         Termina explícitamente el proceso del servidor de Ollama si está en ejecución.
@@ -123,7 +486,7 @@ class OllamaManager:
             logger.info("El proceso de Ollama ya había terminado.")
             self._ollama_process = None
 
-    def _check_connection(self) -> bool:
+    async def _acheck_connection(self) -> bool:
         """
         Verifica la conexión con Ollama y la disponibilidad del modelo configurado.
         También valida los parámetros de configuración del modelo.
@@ -133,40 +496,53 @@ class OllamaManager:
         """
         logger.debug("Realizando verificación de conexión y modelo Ollama.")
         try:
-            client = ollama.Client(host='http://localhost:11434')
-            available_models = client.list()
-            model_names = [m['name'] for m in available_models.get('models', [])]
-            logger.debug(f"Modelos Ollama disponibles: {', '.join(model_names)}")
-
-            if not self._model_name or self._model_name not in model_names:
-                logger.error(f"Error: El modelo '{self._model_name}' no está disponible.")
-                logger.error("Modelos disponibles: " + ", ".join(model_names) if model_names else "Ninguno.")
-                return False
-                
-            temperature = self._model_config.get("temperature")
-            if not isinstance(temperature, (int, float)) or not (0 <= temperature <= 1):
-                logger.error(f"Error: El valor de 'temperature' ({temperature}) debe ser un número entre 0 y 1.")
-                return False
-                
-            max_tokens = self._model_config.get("max_tokens")
-            if not isinstance(max_tokens, int) or max_tokens <= 0:
-                logger.error(f"Error: El valor de 'max_tokens' ({max_tokens}) debe ser un número entero positivo.")
-                return False
+            return self._validate_model(await self.get_async_client().list())
+        except Exception as e:
+            return self._log_connection_error(e)
+
+    def _validate_model(self, available_models: Dict[str, Any]) -> bool:
+        """
+        Comprueba que el modelo configurado esté entre los disponibles y valida sus parámetros.
+
+        Args:
+            available_models (Dict[str, Any]): Respuesta de `list()` de Ollama.
+
+        Returns:
+            bool: True si el modelo está disponible y la configuración es válida.
+        """
+        model_names = [m['name'] for m in available_models.get('models', [])]
+        logger.debug(f"Modelos Ollama disponibles: {', '.join(model_names)}")
+
+        if not self._model_name or self._model_name not in model_names:
+            logger.error(f"Error: El modelo '{self._model_name}' no está disponible.")
+            logger.error("Modelos disponibles: " + ", ".join(model_names) if model_names else "Ninguno.")
+            return False
             
-            logger.info(f"Conexión Ollama y modelo '{self._model_name}' verificados exitosamente.")
-            return True
-        except ollama.ResponseError as e:
-            logger.error(f"Error de respuesta de Ollama al verificar la conexión: {e}")
+        temperature = self._model_config.get("temperature")
+        if not isinstance(temperature, (int, float)) or not (0 <= temperature <= 1):
+            logger.error(f"Error: El valor de 'temperature' ({temperature}) debe ser un número entre 0 y 1.")
             return False
-        except ConnectionError as e:
-            logger.error(f"Error de conexión con el servidor Ollama: {e}")
+            
+        max_tokens = self._model_config.get("max_tokens")
+        if not isinstance(max_tokens, int) or max_tokens <= 0:
+            logger.error(f"Error: El valor de 'max_tokens' ({max_tokens}) debe ser un número entero positivo.")
             return False
-        except KeyError:
+        
+        logger.info(f"Conexión Ollama y modelo '{self._model_name}' verificados exitosamente.")
+        return True
+
+    @staticmethod
+    def _log_connection_error(error: Exception) -> bool:
+        """Registra el error de la verificación de conexión y devuelve False."""
+        if isinstance(error, ollama.ResponseError):
+            logger.error(f"Error de respuesta de Ollama al verificar la conexión: {error}")
+        elif isinstance(error, (ConnectionError, httpx.TransportError)):
+            logger.error(f"Error de conexión con el servidor Ollama: {error}")
+        elif isinstance(error, KeyError):
             logger.error("La clave 'models' no se encontró en la respuesta de Ollama.")
-            return False
-        except Exception as e:
-            logger.error(f"Error inesperado al verificar la conexión de Ollama: {e}")
-            return False
+        else:
+            logger.error(f"Error inesperado al verificar la conexión de Ollama: {error}")
+        return False
 
     def is_online(self) -> bool:
         """
@@ -177,9 +553,31 @@ class OllamaManager:
         """
         return self._online
 
-    def reload(self, model_config: Dict[str, Any]):
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Devuelve el estado de Ollama y la duración de las fases del arranque en frío.
+
+        Returns:
+            Dict[str, Any]: Host activo, si está en línea, los tiempos (ms desde el inicio del arranque)
+                hasta que el servidor respondió, el modelo quedó cargado y llegó el primer token, y
+                la carga y el estado de cada servidor.
+        """
+        return {
+            "online": self._online,
+            "active_host": self._active_host,
+            "startup": dict(self._startup_stats),
+            "sticky": self._routing["sticky"],
+            "endpoints": {
+                host: {"healthy": endpoint.healthy, "in_flight": endpoint.in_flight, **endpoint.stats}
+                for host, endpoint in self._endpoints.items()
+            },
+        }
+
+    async def reload(self, model_config: Dict[str, Any]):
         """
-        Recarga la configuración del modelo y revalida la conexión con Ollama.
+        Recarga la configuración del modelo y revalida la conexión con Ollama sin bloquear el
+        bucle de eventos. Si vuelve a estar en línea, arranca la comprobación de salud de los
+        servidores en caso de que no estuviera en marcha (Ollama caído al arrancar).
 
         Args:
             model_config (Dict[str, Any]): La nueva configuración del modelo Ollama.
@@ -187,8 +585,21 @@ class OllamaManager:
         logger.info("Recargando configuración de Ollama y revalidando conexión...")
         self._model_config = model_config
         self._model_name = model_config.get("name")
-        self._online = self._check_connection()
+        self._routing = {**DEFAULT_ROUTING, **model_config.get("routing", {})}
+        hosts = self._read_hosts(model_config)
+        client_settings = self._read_client_settings(model_config)
+        if hosts != self._hosts or repr(client_settings) != repr(self._client_settings):
+            logger.info("Configuración del cliente de Ollama modificada. Reconstruyendo clientes.")
+            self._hosts = hosts
+            self._client_settings = client_settings
+            self._retire_endpoints()
+            self._endpoints = self._build_endpoints()
+            self._active_host = self._hosts[0]
+        if not await self._aprobe_hosts():
+            logger.warning("Ningún host de Ollama configurado respondió.")
+        self._online = await self._acheck_connection()
         if self._online:
+            self._start_health_checks()
             logger.info("Ollama recargado y en línea.")
         else:
             logger.warning("Ollama recargado pero no está en línea. Verifique la configuración y el servidor.")
\ No newline at end of file
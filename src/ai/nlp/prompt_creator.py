@@ -1,29 +1,55 @@
+import json
 import logging
 from datetime import datetime
-from typing import Any
-from src.ai.nlp.prompt_loader import load_system_prompt_template
+from typing import Any, NamedTuple
+from src.ai.nlp.prompt_loader import SECTION_SEPARATOR, get_system_prompt_template, join_sections
+from src.ai.nlp.token_counter import estimate_tokens
 from src.utils.datetime_utils import get_current_datetime, format_datetime, format_date_human_readable, format_time_only, get_country_from_timezone
 import re
 
 logger = logging.getLogger("PromptCreator")
 
+_prompt_size_stats = {
+    "renders": 0,
+    "last": {},
+    "max": {},
+    "total": {},
+}
+
+# Campos de cada destino que se incluyen en el bloque DESTINOS DISPONIBLES del prompt.
+PROMPT_DESTINATION_FIELDS = ("id", "name", "description", "location", "precio", "category")
+
+_SANITIZE_TABLE = {code: None for code in range(32) if chr(code) not in "\n\r\t"}
+_SANITIZE_TABLE.update({ord("{"): "{{", ord("}"): "}}"})
+
+class SystemPromptParts(NamedTuple):
+    """System prompt dividido según su estabilidad entre solicitudes."""
+    static_prefix: str
+    user_context: str
+    volatile_context: str
+
+    @property
+    def cacheable(self) -> str:
+        """Prefijo estático más contexto del usuario: la parte reutilizable entre turnos."""
+        return SECTION_SEPARATOR.join(part for part in (self.static_prefix, self.user_context) if part)
+
+    def join(self) -> str:
+        """System prompt completo en un único texto."""
+        return SECTION_SEPARATOR.join(part for part in self if part)
+
 def _safe_format_value(value: Any) -> str:
     """Convierte valores a strings seguros para formateo del system prompt."""
     if value is None:
         return "No disponible"
     if isinstance(value, dict):
         try:
-            import json
-            json_str = json.dumps(value, ensure_ascii=False)
-            return json_str
-        except:
+            return json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
             return ", ".join([f"{k}: {_safe_format_value(v)}" for k, v in value.items()])
     if isinstance(value, (list, tuple)):
         try:
-            import json
-            json_str = json.dumps(value, ensure_ascii=False)
-            return json_str
-        except:
+            return json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
             return ", ".join([_safe_format_value(item) for item in value])
     if isinstance(value, datetime):
         return value.isoformat()
@@ -34,17 +60,34 @@ def _safe_format_value(value: Any) -> str:
     
     if (result.startswith('{') and result.endswith('}')) or (result.startswith('[') and result.endswith(']')):
         try:
-            import json
             json.loads(result)
             return result
-        except:
+        except ValueError:
             pass
     
-    result = result.replace("{", "{{").replace("}", "}}")
-    result = ''.join(char for char in result if ord(char) >= 32 or char in '\n\r\t')
-    return result
+    return result.translate(_SANITIZE_TABLE)
+
+def _format_destinations_block(destinations: Any) -> str:
+    """Serializa el catálogo para el prompt con solo los campos que usa el modelo."""
+    if isinstance(destinations, (list, tuple)):
+        destinations = [
+            {field: d.get(field) for field in PROMPT_DESTINATION_FIELDS} if isinstance(d, dict) else d
+            for d in destinations
+        ]
+    return _safe_format_value(destinations)
+
+def estimate_destination_tokens(destination: dict) -> int:
+    """Tokens estimados que ocupa un destino en el bloque DESTINOS DISPONIBLES."""
+    return estimate_tokens(_format_destinations_block([destination]))
+
+def create_system_prompt(*args, **kwargs) -> str:
+    """
+    Crea el system_prompt completo para Ollama en un único texto.
+    Acepta los mismos argumentos que `create_system_prompt_parts`.
+    """
+    return create_system_prompt_parts(*args, **kwargs).join()
 
-def create_system_prompt(
+def create_system_prompt_parts(
     config: dict,
     user_id: int,
     user_name: str,
@@ -67,9 +110,13 @@ def create_system_prompt(
     placeTypes: Any = None,
     budget: Any = None,
     transport: Any = None,
-) -> str:
+) -> SystemPromptParts:
     """
-    Crea el system_prompt y el prompt_text para Ollama.
+    Crea el system_prompt para Ollama dividido en prefijo estático, contexto del
+    usuario y datos volátiles (destinos candidatos, fecha y hora), en ese orden.
+
+    El prefijo estático es idéntico byte a byte entre usuarios y turnos, de modo que
+    Ollama puede reutilizar su caché KV y solo procesa el texto que cambia.
     """
     logger.debug("Construyendo system_prompt para Ollama.")
     
@@ -79,9 +126,9 @@ def create_system_prompt(
     current_time_formatted = format_time_only(current_full_datetime)
     current_country = get_country_from_timezone(timezone_str)
 
-    system_prompt_template = load_system_prompt_template()
+    system_prompt_template = get_system_prompt_template()
     
-    system_prompt = system_prompt_template.format(
+    rendered_sections = system_prompt_template.render_sections(dict(
         assistant_name=config["assistant_name"],
         language=config["language"],
         user_id=user_id,
@@ -97,7 +144,7 @@ def create_system_prompt(
         categoria_favorita=_safe_format_value(categoria_favorita),
         no_le_gusta=_safe_format_value(no_le_gusta),
         preferencia_precio=_safe_format_value(user_budget),
-        available_destinations=_safe_format_value(available_destinations),
+        available_destinations=_format_destinations_block(available_destinations),
         travelerTypes=_safe_format_value(travelerTypes),
         travelingWith=_safe_format_value(travelingWith),
         travelDuration=_safe_format_value(travelDuration),
@@ -105,6 +152,43 @@ def create_system_prompt(
         placeTypes=_safe_format_value(placeTypes),
         budget=_safe_format_value(budget),
         transport=_safe_format_value(transport),
+    ))
+
+    _record_prompt_size(rendered_sections)
+    groups = {"static": [], "user": [], "volatile": []}
+    for name, text in rendered_sections:
+        groups[system_prompt_template.section_groups[name]].append((name, text))
+    return SystemPromptParts(
+        static_prefix=join_sections(groups["static"]),
+        user_context=join_sections(groups["user"]),
+        volatile_context=join_sections(groups["volatile"]),
     )
-    
-    return system_prompt
\ No newline at end of file
+
+def _record_prompt_size(rendered_sections: list[tuple[str, str]]) -> dict:
+    """Calcula los tokens estimados por sección del prompt y acumula las estadísticas."""
+    section_tokens = {name: estimate_tokens(text) for name, text in rendered_sections}
+    section_tokens["total"] = sum(section_tokens.values())
+
+    _prompt_size_stats["renders"] += 1
+    _prompt_size_stats["last"] = section_tokens
+    for name, tokens in section_tokens.items():
+        _prompt_size_stats["max"][name] = max(tokens, _prompt_size_stats["max"].get(name, 0))
+        _prompt_size_stats["total"][name] = _prompt_size_stats["total"].get(name, 0) + tokens
+
+    logger.info(f"Tokens estimados del system prompt por sección: {section_tokens}")
+    return section_tokens
+
+def get_prompt_size_stats() -> dict:
+    """
+    Devuelve las estadísticas de tamaño del system prompt (tokens estimados por sección).
+
+    Returns:
+        dict: Último render, máximo y promedio por sección, y número de renders.
+    """
+    renders = _prompt_size_stats["renders"]
+    return {
+        "renders": renders,
+        "last": dict(_prompt_size_stats["last"]),
+        "max": dict(_prompt_size_stats["max"]),
+        "avg": {name: round(total / renders, 1) for name, total in _prompt_size_stats["total"].items()} if renders else {},
+    }
\ No newline at end of file
@@ -1,6 +1,7 @@
 import os
+import string
 import logging
-from typing import Optional
+from typing import Any, Dict, List, Mapping, Optional, Tuple
 
 logger = logging.getLogger("PromptLoader")
 
@@ -13,24 +14,180 @@ except ImportError:
 
 YAML_PATH = os.path.join(os.path.dirname(__file__), "system_prompt.yaml")
 
+# Orden del prompt pensado para la caché de prefijos (KV cache) de Ollama: primero el texto
+# estático, idéntico byte a byte para todos los usuarios y turnos; después el contexto del
+# usuario; y al final los datos volátiles, que cambian en cada solicitud: los destinos
+# candidatos (elegidos por BM25 según el mensaje) y la fecha y hora.
+SECTION_LAYOUT = {
+    "static": ["identity", "policies", "objectives", "decision_flow", "formats", "examples"],
+    "user": ["context"],
+    "volatile": ["destinations", "volatile_context"],
+}
+SECTION_ORDER = [name for group in SECTION_LAYOUT.values() for name in group]
+SECTION_SEPARATOR = "\n\n"
+
+# Campos que pueden aparecer en las secciones estáticas sin romper su estabilidad:
+# solo dependen de la configuración del asistente.
+STATIC_FIELDS = frozenset({"assistant_name", "language", "current_country"})
+
+# Campos voluminosos que se renderizan completos una sola vez por prompt; el resto de
+# apariciones se sustituyen por el nombre del bloque donde ya se incluyeron.
+RENDER_ONCE_FIELDS: Dict[str, str] = {
+    "available_destinations": "DESTINOS DISPONIBLES",
+}
+
+_compiled_template: Optional["CompiledPromptTemplate"] = None
+_compiled_template_mtime: Optional[int] = None
+
+
+class CompiledPromptTemplate:
+    """
+    Template del system prompt precompilado por secciones.
+
+    Cada sección se analiza una sola vez en fragmentos literales y campos, de modo que
+    renderizar solo concatena los fragmentos con los valores, sin volver a parsear
+    el template en cada solicitud. Los campos de RENDER_ONCE_FIELDS se emiten completos
+    solo en su primera aparición.
+    """
+
+    def __init__(self, sections: List[Tuple[str, str]], render_once: Optional[Dict[str, str]] = None):
+        self.section_names = [name for name, _ in sections]
+        self.section_groups = {name: get_section_group(name) for name in self.section_names}
+        self._sections = [
+            (name, [
+                (literal, field_name, format_spec or "", conversion)
+                for literal, field_name, format_spec, conversion in string.Formatter().parse(text)
+            ])
+            for name, text in sections
+        ]
+        self._render_once = RENDER_ONCE_FIELDS if render_once is None else render_once
+        self.field_names = frozenset(
+            part[1] for _, parts in self._sections for part in parts if part[1] is not None
+        )
+        self._warn_unstable_static_sections()
+
+    def _warn_unstable_static_sections(self) -> None:
+        """Avisa si una sección estática usa campos que cambian por usuario o por solicitud."""
+        for name, parts in self._sections:
+            if self.section_groups[name] != "static":
+                continue
+            unstable_fields = {part[1] for part in parts if part[1] is not None} - STATIC_FIELDS
+            if unstable_fields:
+                logger.warning(
+                    f"La sección estática '{name}' usa campos variables {sorted(unstable_fields)}; "
+                    "esto impide reutilizar la caché de prefijos de Ollama."
+                )
+
+    def render_sections(self, values: Mapping[str, Any]) -> List[Tuple[str, str]]:
+        """
+        Sustituye los campos de cada sección por sus valores.
+
+        Args:
+            values (Mapping[str, Any]): Valores por nombre de campo.
+
+        Returns:
+            List[Tuple[str, str]]: Pares (nombre de sección, texto renderizado) en orden.
+
+        Raises:
+            KeyError: Si falta el valor de algún campo del template.
+        """
+        emitted = set()
+        rendered_sections = []
+        for name, parts in self._sections:
+            rendered = []
+            append = rendered.append
+            for literal, field_name, format_spec, conversion in parts:
+                if literal:
+                    append(literal)
+                if field_name is None:
+                    continue
+                if field_name in self._render_once:
+                    if field_name in emitted:
+                        append(self._render_once[field_name])
+                        continue
+                    emitted.add(field_name)
+                value = values[field_name]
+                if conversion == "r":
+                    value = repr(value)
+                elif conversion == "a":
+                    value = ascii(value)
+                elif conversion == "s":
+                    value = str(value)
+                append(value if type(value) is str and not format_spec else format(value, format_spec))
+            rendered_sections.append((name, "".join(rendered)))
+        return rendered_sections
+
+    def render(self, values: Mapping[str, Any]) -> str:
+        """
+        Renderiza el prompt completo.
+
+        Args:
+            values (Mapping[str, Any]): Valores por nombre de campo.
+
+        Returns:
+            str: Prompt renderizado.
+        """
+        return join_sections(self.render_sections(values))
+
+
+def get_section_group(name: str) -> str:
+    """Devuelve el grupo (static, user o volatile) al que pertenece una sección."""
+    for group, names in SECTION_LAYOUT.items():
+        if name in names:
+            return group
+    return "static"
+
+
+def join_sections(sections: List[Tuple[str, str]]) -> str:
+    """Une las secciones renderizadas en el texto final del prompt."""
+    return SECTION_SEPARATOR.join(text for _, text in sections).strip()
+
+
+def get_system_prompt_template() -> CompiledPromptTemplate:
+    """
+    Devuelve el template del system prompt precompilado.
+    Solo vuelve a leer y compilar el YAML cuando cambia su fecha de modificación.
+    """
+    global _compiled_template, _compiled_template_mtime
+    try:
+        mtime = os.stat(YAML_PATH).st_mtime_ns
+    except OSError:
+        mtime = None
+
+    if _compiled_template is None or mtime != _compiled_template_mtime:
+        if _compiled_template is not None:
+            logger.info("system_prompt.yaml modificado. Recompilando template del system prompt.")
+        _compiled_template = CompiledPromptTemplate(load_system_prompt_sections())
+        _compiled_template_mtime = mtime
+    return _compiled_template
+
+
 def load_system_prompt_template() -> str:
     """
     Carga el template del system prompt desde YAML si está disponible,
     o desde el módulo Python como fallback.
     """
-    yaml_template = _load_from_yaml()
-    if yaml_template:
+    return join_sections(load_system_prompt_sections())
+
+
+def load_system_prompt_sections() -> List[Tuple[str, str]]:
+    """
+    Carga las secciones del system prompt desde YAML si está disponible,
+    o desde el módulo Python como fallback (una única sección).
+    """
+    yaml_sections = _load_from_yaml()
+    if yaml_sections:
         logger.info("System prompt cargado desde YAML (estructura modular).")
-        return yaml_template
+        return yaml_sections
 
     logger.info("Usando fallback: system prompt desde módulo Python.")
     from src.ai.nlp.system_prompt import SYSTEM_PROMPT_TEMPLATE
-    return SYSTEM_PROMPT_TEMPLATE
+    return [("system_prompt", SYSTEM_PROMPT_TEMPLATE)]
 
 
-def _load_from_yaml() -> Optional[str]:
+def _load_from_yaml() -> Optional[List[Tuple[str, str]]]:
     """
-    Intenta cargar y ensamblar el template desde el archivo YAML modular.
+    Intenta cargar las secciones del template desde el archivo YAML modular, en orden.
     """
     if not YAML_AVAILABLE:
         logger.warning("PyYAML no disponible, no se puede leer YAML.")
@@ -48,25 +205,21 @@ def _load_from_yaml() -> Optional[str]:
             logger.error("El YAML no contiene una clave 'sections' válida.")
             return None
 
-        ordered_keys = [
-            "identity",
-            "policies",
-            "objectives",
-            "decision_flow",
-            "context",
-            "formats",
-            "examples"
-        ]
-
-        combined_prompt = "\n\n".join(
-            [sections[k] for k in ordered_keys if k in sections]
-        )
+        ordered_sections = [(k, sections[k]) for k in SECTION_LAYOUT["static"] if k in sections]
 
+        # El footer es texto fijo: va al final del prefijo estático, antes de los datos por usuario.
         footer = yaml_data.get("footer")
         if footer:
-            combined_prompt += f"\n\n{footer}"
+            ordered_sections.append(("footer", footer))
+
+        ordered_sections += [
+            (k, sections[k])
+            for group in ("user", "volatile")
+            for k in SECTION_LAYOUT[group]
+            if k in sections
+        ]
 
-        return combined_prompt.strip()
+        return ordered_sections
 
     except Exception as e:
         logger.error(f"Error al cargar o parsear system_prompt.yaml: {e}")
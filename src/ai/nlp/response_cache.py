@@ -0,0 +1,219 @@
+import hashlib
+import json
+import logging
+import re
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, NamedTuple, Optional, Set
+import numpy as np
+
+logger = logging.getLogger("ResponseCache")
+
+DEFAULT_RESPONSE_CACHE_CONFIG: Dict[str, Any] = {
+    "enabled": False,
+    "max_entries": 512,
+    "ttl_seconds": 900,
+    "similarity_threshold": 0.93,
+    "embedding_model": "nomic-embed-text",
+}
+
+_NON_WORD_REGEX = re.compile(r"[^\w\s]")
+_WHITESPACE_REGEX = re.compile(r"\s+")
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Normaliza un prompt para compararlo: minúsculas, sin tildes, sin puntuación y con espacios simples."""
+    text = unicodedata.normalize("NFKD", prompt.lower())
+    text = "".join(char for char in text if not unicodedata.combining(char))
+    text = _NON_WORD_REGEX.sub(" ", text)
+    return _WHITESPACE_REGEX.sub(" ", text).strip()
+
+
+def context_fingerprint(**context: Any) -> str:
+    """Huella del contexto que condiciona la respuesta (preferencias, versión del catálogo, modelo...)."""
+    return hashlib.sha1(
+        json.dumps(context, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+    ).hexdigest()
+
+
+class CacheProbe(NamedTuple):
+    """Resultado de una búsqueda en la caché, reutilizable para guardar la respuesta si no hubo acierto."""
+    response: Optional[str]
+    key: tuple
+    embedding: Optional[np.ndarray]
+
+
+class ResponseCache:
+    """
+    Caché de respuestas del modelo para preguntas repetidas.
+
+    Las entradas se indexan por el prompt normalizado y una huella del contexto. Primero se
+    busca la coincidencia exacta y, si no la hay, la entrada más parecida con la misma huella
+    por similitud coseno de embeddings de Ollama. Expulsa por LRU y caduca por TTL.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None, ollama_manager=None):
+        """
+        Args:
+            config (Optional[Dict[str, Any]]): Sección `response_cache` de la configuración
+                (`enabled`, `max_entries`, `ttl_seconds`, `similarity_threshold`, `embedding_model`).
+            ollama_manager (OllamaManager): Gestor de Ollama para calcular embeddings. Si es None
+                o no hay `embedding_model`, solo se usa la coincidencia exacta.
+        """
+        config = {**DEFAULT_RESPONSE_CACHE_CONFIG, **(config or {})}
+        self.enabled: bool = bool(config["enabled"])
+        self._max_entries: int = int(config["max_entries"])
+        self._ttl: float = float(config["ttl_seconds"])
+        self._threshold: float = float(config["similarity_threshold"])
+        self._embedding_model: Optional[str] = config["embedding_model"]
+        self._ollama_manager = ollama_manager
+
+        # key = (huella, prompt normalizado) -> {"response", "embedding", "expires_at"}
+        self._entries: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        self._keys_by_fingerprint: Dict[str, Set[tuple]] = {}
+        self._stats: Dict[str, int] = {
+            "lookups": 0,
+            "exact_hits": 0,
+            "semantic_hits": 0,
+            "misses": 0,
+            "bypassed": 0,
+            "stores": 0,
+            "evictions": 0,
+            "expirations": 0,
+            "embedding_errors": 0,
+        }
+        if self.enabled:
+            logger.info(
+                f"Caché de respuestas activada (máx. {self._max_entries} entradas, TTL {self._ttl:.0f}s, "
+                f"similitud {self._threshold}, embeddings: {self._embedding_model or 'desactivados'})."
+            )
+
+    @property
+    def _semantic_enabled(self) -> bool:
+        return bool(self._embedding_model) and self._ollama_manager is not None
+
+    async def lookup(self, prompt: str, fingerprint: str) -> CacheProbe:
+        """
+        Busca una respuesta para el prompt con el mismo contexto.
+
+        Args:
+            prompt (str): Mensaje del usuario.
+            fingerprint (str): Huella del contexto (ver `context_fingerprint`).
+
+        Returns:
+            CacheProbe: Respuesta en caché (o None) y los datos para guardarla después con `store`.
+        """
+        self._stats["lookups"] += 1
+        key = (fingerprint, normalize_prompt(prompt))
+
+        entry = self._get_live_entry(key)
+        if entry is not None:
+            self._stats["exact_hits"] += 1
+            logger.info(f"Acierto exacto en caché de respuestas para: '{prompt[:60]}'")
+            return CacheProbe(entry["response"], key, entry["embedding"])
+
+        embedding = None
+        if self._semantic_enabled and self._keys_by_fingerprint.get(fingerprint):
+            embedding = await self._embed(key[1])
+            match = self._find_similar(fingerprint, embedding) if embedding is not None else None
+            if match is not None:
+                similar_key, similarity = match
+                self._stats["semantic_hits"] += 1
+                self._entries.move_to_end(similar_key)
+                logger.info(f"Acierto semántico en caché de respuestas (similitud {similarity:.3f}) para: '{prompt[:60]}'")
+                return CacheProbe(self._entries[similar_key]["response"], key, embedding)
+
+        self._stats["misses"] += 1
+        return CacheProbe(None, key, embedding)
+
+    async def store(self, probe: CacheProbe, response: str) -> None:
+        """Guarda la respuesta generada para el prompt de una búsqueda sin acierto."""
+        embedding = probe.embedding
+        if embedding is None and self._semantic_enabled:
+            embedding = await self._embed(probe.key[1])
+
+        if probe.key in self._entries:
+            self._remove(probe.key)
+        self._entries[probe.key] = {
+            "response": response,
+            "embedding": embedding,
+            "expires_at": time.monotonic() + self._ttl,
+        }
+        self._keys_by_fingerprint.setdefault(probe.key[0], set()).add(probe.key)
+        self._stats["stores"] += 1
+
+        while len(self._entries) > self._max_entries:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self._stats["evictions"] += 1
+
+    def record_bypass(self) -> None:
+        """Cuenta un turno que no pasa por la caché (efectos secundarios o caché no permitida)."""
+        self._stats["bypassed"] += 1
+
+    def clear(self) -> None:
+        """Vacía la caché."""
+        self._entries.clear()
+        self._keys_by_fingerprint.clear()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores de la caché y su tasa de aciertos."""
+        hits = self._stats["exact_hits"] + self._stats["semantic_hits"]
+        return {
+            **self._stats,
+            "enabled": self.enabled,
+            "entries": len(self._entries),
+            "hit_rate": round(hits / self._stats["lookups"], 3) if self._stats["lookups"] else 0.0,
+        }
+
+    def _get_live_entry(self, key: tuple) -> Optional[Dict[str, Any]]:
+        """Devuelve la entrada si existe y no ha caducado, marcándola como usada recientemente."""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires_at"] < time.monotonic():
+            self._remove(key)
+            self._stats["expirations"] += 1
+            return None
+        self._entries.move_to_end(key)
+        return entry
+
+    def _find_similar(self, fingerprint: str, embedding: np.ndarray) -> Optional[tuple]:
+        """Devuelve (clave, similitud) de la entrada vigente más parecida por encima del umbral."""
+        candidates = [
+            key for key in list(self._keys_by_fingerprint.get(fingerprint, ()))
+            if self._get_live_entry(key) is not None and self._entries[key]["embedding"] is not None
+        ]
+        if not candidates:
+            return None
+        matrix = np.stack([self._entries[key]["embedding"] for key in candidates])
+        similarities = matrix @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] < self._threshold:
+            return None
+        return candidates[best], float(similarities[best])
+
+    async def _embed(self, text: str) -> Optional[np.ndarray]:
+        """Calcula el embedding normalizado del texto con Ollama."""
+        try:
+            # El modelo de embeddings puede no estar en todos los servidores: sus fallos no
+            # deben expulsar del reparto a un servidor que genera respuestas sin problema.
+            async with self._ollama_manager.acquire(track_health=False) as client:
+                result = await client.embeddings(model=self._embedding_model, prompt=text)
+            vector = np.asarray(result["embedding"], dtype=np.float32)
+            norm = np.linalg.norm(vector)
+            return vector / norm if norm else None
+        except Exception as e:
+            self._stats["embedding_errors"] += 1
+            logger.warning(f"No se pudo calcular el embedding para la caché de respuestas: {e}")
+            return None
+
+    def _remove(self, key: tuple) -> None:
+        """Elimina una entrada y su referencia en el índice por huella."""
+        self._entries.pop(key, None)
+        keys = self._keys_by_fingerprint.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._keys_by_fingerprint[key[0]]
@@ -0,0 +1,28 @@
+import re
+
+# Promedio aproximado de caracteres por token del tokenizador de Qwen2.5 en texto
+# mixto español/JSON. Suficiente para presupuestar contexto sin cargar el tokenizador.
+CHARS_PER_TOKEN = 3.5
+
+_WORD_OR_SYMBOL_REGEX = re.compile(r"\w+|[^\w\s]")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Estima el número de tokens de un texto.
+
+    Toma el máximo entre la estimación por caracteres y el número de palabras y
+    símbolos, ya que el texto con mucha puntuación (JSON, UUIDs) genera más tokens
+    de los que sugiere su longitud.
+
+    Args:
+        text (str): Texto a medir.
+
+    Returns:
+        int: Número estimado de tokens.
+    """
+    if not text:
+        return 0
+    by_chars = int(len(text) / CHARS_PER_TOKEN + 0.5)
+    by_pieces = len(_WORD_OR_SYMBOL_REGEX.findall(text))
+    return max(by_chars, by_pieces)
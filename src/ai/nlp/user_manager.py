@@ -1,23 +1,80 @@
 import asyncio
+import copy
+import hashlib
 import logging
-import re
-from typing import Optional
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
 import httpx
 import json
-from pathlib import Path
+from src.ai.nlp.history_store import HistoryStore, get_history_store
+from src.utils.backend_client import BackendClient, get_backend_client
+from src.utils.single_flight import SingleFlight
 
 logger = logging.getLogger("UserManager")
 
-HISTORY_DIR = Path("data")
-HISTORY_DIR.mkdir(parents=True, exist_ok=True)
+DEFAULT_RECOMMENDATIONS_CONFIG: Dict[str, Any] = {
+    "bulk_path": None,
+    "max_concurrency": 4,
+}
+
+DEFAULT_USER_CACHE_CONFIG: Dict[str, Any] = {
+    "ttl_seconds": 120,
+    "stale_seconds": 600,
+    "max_entries": 1024,
+}
 
 class UserManager:
     """
     Gestiona la lógica relacionada con usuarios, permisos y preferencias.
+
+    Los datos y preferencias de cada usuario se guardan en una caché en memoria por
+    (usuario, token): dentro del TTL se sirven sin llamar al backend y, durante la
+    ventana `stale_seconds` posterior, se sirven los datos anteriores mientras se
+    revalidan en segundo plano.
     """
-    def __init__(self):
+    def __init__(
+        self,
+        backend_client: Optional[BackendClient] = None,
+        cache_config: Optional[Dict[str, Any]] = None,
+        history_store: Optional[HistoryStore] = None,
+        recommendations_config: Optional[Dict[str, Any]] = None,
+    ):
+        """
+        Args:
+            backend_client (Optional[BackendClient]): Cliente compartido del backend.
+            cache_config (Optional[Dict[str, Any]]): Sección `user_cache` de la configuración
+                (`ttl_seconds`, `stale_seconds`, `max_entries`). Con `ttl_seconds` 0 la caché se desactiva.
+            history_store (Optional[HistoryStore]): Almacén compartido del historial de conversación.
+            recommendations_config (Optional[Dict[str, Any]]): Sección `recommendations` de la
+                configuración (`bulk_path`, `max_concurrency`) para guardar varias recomendaciones.
+        """
+        self._backend = backend_client or get_backend_client()
+        self._history_store = history_store or get_history_store()
         self._last_recommendation = {}
 
+        recommendations_config = {**DEFAULT_RECOMMENDATIONS_CONFIG, **(recommendations_config or {})}
+        self._recommendations_bulk_path: Optional[str] = recommendations_config["bulk_path"]
+        self._recommendations_max_concurrency: int = max(1, int(recommendations_config["max_concurrency"]))
+
+        cache_config = {**DEFAULT_USER_CACHE_CONFIG, **(cache_config or {})}
+        self._user_cache_ttl: float = float(cache_config["ttl_seconds"])
+        self._user_cache_stale: float = float(cache_config["stale_seconds"])
+        self._user_cache_max_entries: int = int(cache_config["max_entries"])
+        self._user_cache: "OrderedDict[tuple, dict]" = OrderedDict()
+        self._user_cache_generation: Dict[str, int] = {}
+        self._user_refresh_tasks: Dict[tuple, asyncio.Task] = {}
+        self._user_fetch_flight = SingleFlight("user_data")
+        self._user_cache_stats: Dict[str, int] = {
+            "hits": 0,
+            "stale_hits": 0,
+            "misses": 0,
+            "refreshes": 0,
+            "refresh_errors": 0,
+            "invalidations": 0,
+            "evictions": 0,
+        }
+
     async def save_recommendation_to_api(self, user_id: str, recommendation_data: dict, auth_token: str) -> Optional[str]:
         """
         Guarda la recomendación en /api/recomendaciones-ia con aceptada=false.
@@ -31,7 +88,6 @@ class UserManager:
         Returns:
             recommendation_id si fue exitoso, None si hubo error
         """
-        recommendations_api_url = "http://localhost:3001/api/recomendaciones-ia"
         try:
             payload = {
                 "userId": str(user_id),
@@ -47,14 +103,13 @@ class UserManager:
             headers = {"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"}
             logger.info(f"Guardando recomendación en API con aceptada=false: {payload}")
 
-            async with httpx.AsyncClient() as client:
-                response = await client.post(recommendations_api_url, json=payload, headers=headers)
-                response.raise_for_status()
-                response_data = response.json()
-                recommendation_id = response_data.get("id")
+            response = await self._backend.post("/api/recomendaciones-ia", json=payload, headers=headers)
+            response.raise_for_status()
+            response_data = response.json()
+            recommendation_id = response_data.get("id")
 
-                logger.info(f"Recomendación guardada en API con ID: {recommendation_id}")
-                return recommendation_id
+            logger.info(f"Recomendación guardada en API con ID: {recommendation_id}")
+            return recommendation_id
 
         except httpx.RequestError as e:
             logger.error(f"Error de red al guardar recomendación para {user_id}: {e}")
@@ -66,6 +121,77 @@ class UserManager:
             logger.error(f"Error inesperado al guardar recomendación para {user_id}: {e}")
             return None
 
+    async def save_recommendations_to_api(self, user_id: str, recommendations: list[dict], auth_token: str) -> list[Optional[str]]:
+        """
+        Guarda varias recomendaciones en /api/recomendaciones-ia con aceptada=false.
+
+        Usa el endpoint masivo `bulk_path` si está configurado y el backend lo soporta; si no,
+        envía las recomendaciones en paralelo con como máximo `max_concurrency` solicitudes a la vez.
+
+        Args:
+            user_id: ID del usuario
+            recommendations: Lista de diccionarios con los datos de cada recomendación
+            auth_token: Token de autenticación
+
+        Returns:
+            IDs de las recomendaciones creadas, en el mismo orden (None en las que fallaron)
+        """
+        if not recommendations:
+            return []
+
+        if self._recommendations_bulk_path:
+            recommendation_ids = await self._save_recommendations_bulk(user_id, recommendations, auth_token)
+            if recommendation_ids is not None:
+                return recommendation_ids
+
+        semaphore = asyncio.Semaphore(self._recommendations_max_concurrency)
+
+        async def save_one(recommendation_data: dict) -> Optional[str]:
+            async with semaphore:
+                return await self.save_recommendation_to_api(user_id, recommendation_data, auth_token)
+
+        return list(await asyncio.gather(*(save_one(recommendation) for recommendation in recommendations)))
+
+    async def _save_recommendations_bulk(self, user_id: str, recommendations: list[dict], auth_token: str) -> Optional[list[Optional[str]]]:
+        """
+        Guarda las recomendaciones con una sola solicitud al endpoint masivo.
+
+        Returns:
+            IDs creados en el mismo orden, o None si el endpoint masivo no está disponible
+            (en ese caso se desactiva y se usan solicitudes individuales).
+        """
+        payloads = [
+            {
+                "userId": str(user_id),
+                "destinationId": recommendation.get("destinationId"),
+                "tipo": recommendation.get("tipo", "basado_en_preferencias"),
+                "aceptada": False,
+            }
+            for recommendation in recommendations
+        ]
+        valid_payloads = [payload for payload in payloads if payload["destinationId"]]
+        headers = {"Authorization": f"Bearer {auth_token}", "Content-Type": "application/json"}
+        try:
+            logger.info(f"Guardando {len(valid_payloads)} recomendaciones en bloque en {self._recommendations_bulk_path}")
+            response = await self._backend.post(self._recommendations_bulk_path, json=valid_payloads, headers=headers)
+            if response.status_code in (404, 405, 501):
+                logger.warning(
+                    f"El backend no soporta {self._recommendations_bulk_path} ({response.status_code}). "
+                    "Se usarán solicitudes individuales."
+                )
+                self._recommendations_bulk_path = None
+                return None
+            response.raise_for_status()
+            created = iter(response.json())
+            return [(next(created, None) or {}).get("id") if payload["destinationId"] else None for payload in payloads]
+        except httpx.RequestError as e:
+            logger.error(f"Error de red al guardar recomendaciones en bloque para {user_id}: {e}")
+        except httpx.HTTPStatusError as e:
+            logger.error(f"Error HTTP al guardar recomendaciones en bloque para {user_id}: {e.response.status_code} - {e.response.text}")
+        except Exception as e:
+            logger.error(f"Error inesperado al guardar recomendaciones en bloque para {user_id}: {e}")
+        return [None] * len(payloads)
+
     async def save_last_recommendation(self, user_id: str, recommendation_data: dict) -> None:
         """
         Guarda la última recomendación SOLO en memoria (no llama a API).
@@ -88,7 +214,114 @@ class UserManager:
 
     async def get_user_data_by_id(self, user_id: str, auth_token: str) -> tuple[Optional[dict], str, dict]:
         """
-        Recupera los datos del usuario.
+        Recupera los datos del usuario, desde la caché si están vigentes.
+        """
+        key = self._user_cache_key(user_id, auth_token)
+        entry = self._user_cache.get(key)
+        if entry is not None:
+            age = time.monotonic() - entry["fetched_at"]
+            if age < self._user_cache_ttl:
+                self._user_cache_stats["hits"] += 1
+                self._user_cache.move_to_end(key)
+            elif age < self._user_cache_ttl + self._user_cache_stale:
+                self._user_cache_stats["stale_hits"] += 1
+                self._user_cache.move_to_end(key)
+                self._schedule_user_refresh(key, user_id, auth_token)
+            else:
+                entry = None
+
+        if entry is not None:
+            user_data_container = copy.deepcopy(entry["data"])
+        else:
+            self._user_cache_stats["misses"] += 1
+            generation = self._user_cache_generation.get(str(user_id), 0)
+            user_data_container, fetched = await self._user_fetch_flight.do(
+                key, lambda: self._fetch_user_data(user_id, auth_token)
+            )
+            if fetched:
+                self._store_user_data(key, user_data_container, generation)
+            # Las llamadas agrupadas comparten el resultado: cada una recibe su propia copia.
+            user_data_container = copy.deepcopy(user_data_container)
+
+        user_permissions_str = user_data_container.get("permissions", "")
+        user_preferences_dict = user_data_container.get("preferences_dict", {})
+
+        return user_data_container, user_permissions_str, user_preferences_dict
+
+    def invalidate_user_data(self, user_id: str) -> None:
+        """
+        Descarta los datos en caché del usuario (para todos sus tokens), por ejemplo tras
+        cambiar sus preferencias. Los refrescos en curso no volverán a guardarlos.
+        """
+        user_key = str(user_id)
+        self._user_cache_generation[user_key] = self._user_cache_generation.get(user_key, 0) + 1
+        for key in [key for key in self._user_cache if key[0] == user_key]:
+            del self._user_cache[key]
+        self._user_cache_stats["invalidations"] += 1
+        logger.info(f"Caché de datos de usuario invalidada para {user_id}.")
+
+    def get_user_cache_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores de la caché de datos de usuario."""
+        lookups = self._user_cache_stats["hits"] + self._user_cache_stats["stale_hits"] + self._user_cache_stats["misses"]
+        hits = self._user_cache_stats["hits"] + self._user_cache_stats["stale_hits"]
+        return {
+            **self._user_cache_stats,
+            "entries": len(self._user_cache),
+            "hit_rate": round(hits / lookups, 3) if lookups else 0.0,
+            "single_flight": self._user_fetch_flight.get_stats(),
+        }
+
+    async def aclose(self) -> None:
+        """Cancela los refrescos de datos de usuario en segundo plano."""
+        for task in self._user_refresh_tasks.values():
+            if not task.done():
+                task.cancel()
+        self._user_refresh_tasks.clear()
+
+    @staticmethod
+    def _user_cache_key(user_id: str, auth_token: str) -> tuple:
+        """Clave de la caché: el usuario y un hash del token con el que se autorizó la lectura."""
+        token_hash = hashlib.sha256((auth_token or "").encode("utf-8")).hexdigest()
+        return str(user_id), token_hash
+
+    def _store_user_data(self, key: tuple, user_data_container: dict, generation: int) -> None:
+        """Guarda los datos del usuario si no se invalidaron mientras se descargaban."""
+        if self._user_cache_ttl <= 0 or generation != self._user_cache_generation.get(key[0], 0):
+            return
+        self._user_cache[key] = {"data": copy.deepcopy(user_data_container), "fetched_at": time.monotonic()}
+        self._user_cache.move_to_end(key)
+        while len(self._user_cache) > self._user_cache_max_entries:
+            self._user_cache.popitem(last=False)
+            self._user_cache_stats["evictions"] += 1
+
+    def _schedule_user_refresh(self, key: tuple, user_id: str, auth_token: str) -> None:
+        """Lanza la revalidación en segundo plano de los datos del usuario si no hay otra en curso."""
+        task = self._user_refresh_tasks.get(key)
+        if task is None or task.done():
+            self._user_refresh_tasks[key] = asyncio.create_task(self._refresh_user_data(key, user_id, auth_token))
+
+    async def _refresh_user_data(self, key: tuple, user_id: str, auth_token: str) -> None:
+        """Vuelve a descargar los datos del usuario y actualiza la caché."""
+        generation = self._user_cache_generation.get(key[0], 0)
+        try:
+            user_data_container, fetched = await self._user_fetch_flight.do(
+                key, lambda: self._fetch_user_data(user_id, auth_token)
+            )
+            if fetched:
+                self._store_user_data(key, user_data_container, generation)
+                self._user_cache_stats["refreshes"] += 1
+            else:
+                self._user_cache_stats["refresh_errors"] += 1
+        finally:
+            self._user_refresh_tasks.pop(key, None)
+
+    async def _fetch_user_data(self, user_id: str, auth_token: str) -> tuple[dict, bool]:
+        """
+        Descarga y procesa los datos y preferencias del usuario desde el backend.
+
+        Returns:
+            tuple[dict, bool]: Datos del usuario (con valores por defecto si hubo error) y si la
+            descarga fue correcta.
         """
         logger.debug(f"Intentando recuperar datos de usuario para user_id: {user_id}")
         
@@ -99,72 +332,73 @@ class UserManager:
             "preferences_dict": {}
         }
 
-        user_preferences_url = f"http://localhost:3001/api/user-preferences/preferences/{user_id}"
+        fetched = False
+        user_preferences_path = f"/api/user-preferences/preferences/{user_id}"
         try:
-            async with httpx.AsyncClient() as client:
-                headers = {"Authorization": f"Bearer {auth_token}"}
-                response = await client.get(user_preferences_url, headers=headers)
-                response.raise_for_status()
-                preferences_data = response.json()
-                logger.debug(f"API response for user preferences: {preferences_data}")
+            headers = {"Authorization": f"Bearer {auth_token}"}
+            response = await self._backend.get(user_preferences_path, headers=headers)
+            response.raise_for_status()
+            preferences_data = response.json()
+            logger.debug(f"API response for user preferences: {preferences_data}")
+            
+            if preferences_data and isinstance(preferences_data, list) and len(preferences_data) > 0:
+                first_preference = preferences_data[0]
                 
-                if preferences_data and isinstance(preferences_data, list) and len(preferences_data) > 0:
-                    first_preference = preferences_data[0]
-                    
-                    user_data_container["nombre"] = first_preference.get("profile", {}).get("name", user_data_container["nombre"])
-                    user_data_container["email"] = first_preference.get("user", {}).get("email", user_data_container.get("email"))
-                    user_data_container["username"] = first_preference.get("user", {}).get("username", user_data_container.get("username"))
-
-                    dynamic_preferences_str = []
-                    dynamic_preferences_dict = {}
-
-                    if first_preference.get("destinationName"):
-                        dynamic_preferences_str.append(f"destino_favorito: {first_preference['destinationName']}")
-                        dynamic_preferences_dict["destino_favorito"] = first_preference['destinationName']
-                    if first_preference.get("location"):
-                        dynamic_preferences_str.append(f"ubicacion_favorita: {first_preference['location']}")
-                        dynamic_preferences_dict["ubicacion_favorita"] = first_preference['location']
-                    if first_preference.get("category"):
-                        dynamic_preferences_str.append(f"categoria_favorita: {first_preference['category']}")
-                        dynamic_preferences_dict["categoria_favorita"] = first_preference['category']
-                    if first_preference.get("precio") is not None:
-                        dynamic_preferences_str.append(f"preferencia_precio: {first_preference['precio']}")
-                        dynamic_preferences_dict["preferencia_precio"] = first_preference['precio']
-                    if first_preference.get("unliked"):
-                        # Procesar los subcampos avanzados de preferencias
-                        unliked_data = first_preference["unliked"]
-                        if isinstance(unliked_data, str):
-                            try:
-                                unliked_data = json.loads(unliked_data)
-                            except Exception:
-                                pass
-                        if isinstance(unliked_data, dict):
-                            for key in [
-                                "travelerTypes", "travelingWith", "travelDuration", "activities", "placeTypes", "budget", "transport"
-                            ]:
-                                if key in unliked_data:
-                                    dynamic_preferences_str.append(f"{key}: {unliked_data[key]}")
-                                    dynamic_preferences_dict[key] = unliked_data[key]
-                        else:
-                            dynamic_preferences_str.append(f"no_le_gusta: {unliked_data}")
-                            dynamic_preferences_dict["no_le_gusta"] = unliked_data
-                    if first_preference.get("interestType"):
-                        dynamic_preferences_str.append(f"tipo_interes: {first_preference['interestType']}")
-                        dynamic_preferences_dict["tipo_interes"] = first_preference['interestType']
-                    if first_preference.get("preferredDuration"):
-                        dynamic_preferences_str.append(f"duracion_preferida: {first_preference['preferredDuration']}")
-                        dynamic_preferences_dict["duracion_preferida"] = first_preference['preferredDuration']
-                    if first_preference.get("geographicalFocus"):
-                        dynamic_preferences_str.append(f"enfoque_geografico: {first_preference['geographicalFocus']}")
-                        dynamic_preferences_dict["enfoque_geografico"] = first_preference['geographicalFocus']
-                    if dynamic_preferences_str:
-                        user_data_container["preferences_str"] = ", ".join(dynamic_preferences_str)
-                    if dynamic_preferences_dict:
-                        user_data_container["preferences_dict"] = dynamic_preferences_dict
-
-                    logger.info(f"Preferencias de usuario cargadas dinámicamente para {user_id}: {user_data_container['preferences_dict']}")
-                else:
-                    logger.warning(f"No se encontraron preferencias para el usuario {user_id} en el endpoint. Usando valores por defecto.")
+                user_data_container["nombre"] = first_preference.get("profile", {}).get("name", user_data_container["nombre"])
+                user_data_container["email"] = first_preference.get("user", {}).get("email", user_data_container.get("email"))
+                user_data_container["username"] = first_preference.get("user", {}).get("username", user_data_container.get("username"))
+
+                dynamic_preferences_str = []
+                dynamic_preferences_dict = {}
+
+                if first_preference.get("destinationName"):
+                    dynamic_preferences_str.append(f"destino_favorito: {first_preference['destinationName']}")
+                    dynamic_preferences_dict["destino_favorito"] = first_preference['destinationName']
+                if first_preference.get("location"):
+                    dynamic_preferences_str.append(f"ubicacion_favorita: {first_preference['location']}")
+                    dynamic_preferences_dict["ubicacion_favorita"] = first_preference['location']
+                if first_preference.get("category"):
+                    dynamic_preferences_str.append(f"categoria_favorita: {first_preference['category']}")
+                    dynamic_preferences_dict["categoria_favorita"] = first_preference['category']
+                if first_preference.get("precio") is not None:
+                    dynamic_preferences_str.append(f"preferencia_precio: {first_preference['precio']}")
+                    dynamic_preferences_dict["preferencia_precio"] = first_preference['precio']
+                if first_preference.get("unliked"):
+                    # Procesar los subcampos avanzados de preferencias
+                    unliked_data = first_preference["unliked"]
+                    if isinstance(unliked_data, str):
+                        try:
+                            unliked_data = json.loads(unliked_data)
+                        except Exception:
+                            pass
+                    if isinstance(unliked_data, dict):
+                        for key in [
+                            "travelerTypes", "travelingWith", "travelDuration", "activities", "placeTypes", "budget", "transport"
+                        ]:
+                            if key in unliked_data:
+                                dynamic_preferences_str.append(f"{key}: {unliked_data[key]}")
+                                dynamic_preferences_dict[key] = unliked_data[key]
+                    else:
+                        dynamic_preferences_str.append(f"no_le_gusta: {unliked_data}")
+                        dynamic_preferences_dict["no_le_gusta"] = unliked_data
+                if first_preference.get("interestType"):
+                    dynamic_preferences_str.append(f"tipo_interes: {first_preference['interestType']}")
+                    dynamic_preferences_dict["tipo_interes"] = first_preference['interestType']
+                if first_preference.get("preferredDuration"):
+                    dynamic_preferences_str.append(f"duracion_preferida: {first_preference['preferredDuration']}")
+                    dynamic_preferences_dict["duracion_preferida"] = first_preference['preferredDuration']
+                if first_preference.get("geographicalFocus"):
+                    dynamic_preferences_str.append(f"enfoque_geografico: {first_preference['geographicalFocus']}")
+                    dynamic_preferences_dict["enfoque_geografico"] = first_preference['geographicalFocus']
+                if dynamic_preferences_str:
+                    user_data_container["preferences_str"] = ", ".join(dynamic_preferences_str)
+                if dynamic_preferences_dict:
+                    user_data_container["preferences_dict"] = dynamic_preferences_dict
+
+                logger.info(f"Preferencias de usuario cargadas dinámicamente para {user_id}: {user_data_container['preferences_dict']}")
+            else:
+                logger.warning(f"No se encontraron preferencias para el usuario {user_id} en el endpoint. Usando valores por defecto.")
+            fetched = True
 
         except httpx.RequestError as e:
             logger.error(f"Error de red o conexión al obtener preferencias para {user_id}: {e}. Usando valores por defecto.")
@@ -175,52 +409,22 @@ class UserManager:
         except Exception as e:
             logger.error(f"Error inesperado al obtener preferencias para {user_id}: {e}. Usando valores por defecto.")
 
-        user_permissions_str = user_data_container.get("permissions", "")
-        user_preferences_dict = user_data_container.get("preferences_dict", {})
+        return user_data_container, fetched
 
-        return user_data_container, user_permissions_str, user_preferences_dict
+    async def load_conversation_history(self, user_id: str, limit: int, since: Optional[tuple] = None) -> list[dict]:
+        """
+        Devuelve los últimos `limit` mensajes del historial de conversación del usuario o, con
+        `since` = (desde, mínimo, máximo), los posteriores al mensaje número `desde` (ver
+        `ConversationSummarizer.history_limits`).
+        """
+        if since is not None:
+            history = await self._history_store.get_since(user_id, *since)
+        else:
+            history = await self._history_store.get_recent(user_id, limit)
+        logger.debug(f"Historial cargado para {user_id}: {len(history)} mensajes.")
+        return history
 
-    async def handle_preference_setting(self, user_data: dict, full_response_content: str, auth_token: str) -> str:
-        """
-        Limpia los marcadores JSON del contenido visible al usuario.
-        """
-        user_id = user_data.get("id")
-        if not user_id:
-            logger.error("No se pudo obtener user_id de user_data para handle_preference_setting.")
-            return full_response_content
-        recommendation_pattern = re.compile(
-            r"(?:GENERAR_RECOMENDACION_JSON:\s*{.*?}|```json\s*{.*?}\s*```|Generar recomendación JSON:[\s\S]*?```json[\s\S]*?```)",
-            re.DOTALL | re.IGNORECASE
-        )
-        cleaned_response_content = recommendation_pattern.sub("", full_response_content).strip()
-        cleaned_response_content = re.sub(r"\n---\s*$", "", cleaned_response_content).strip()
-        cleaned_response_content = re.sub(r"\n{3,}", "\n\n", cleaned_response_content)
-        
-        return cleaned_response_content if cleaned_response_content else full_response_content
-
-    def _get_history_file_path(self, user_id: str) -> Path:
-        """Obtiene la ruta del archivo de historial para un user_id dado."""
-        return HISTORY_DIR / f"{user_id}_history.json"
-
-    def load_conversation_history(self, user_id: str) -> list[dict]:
-        """Carga el historial de conversación de un usuario desde un archivo JSON."""
-        history_file = self._get_history_file_path(user_id)
-        if history_file.exists():
-            try:
-                with open(history_file, "r", encoding="utf-8") as f:
-                    history = json.load(f)
-                    logger.debug(f"Historial cargado para {user_id}: {len(history)} mensajes.")
-                    return history
-            except json.JSONDecodeError:
-                logger.warning(f"Archivo de historial corrupto para {user_id}. Iniciando historial vacío.")
-        return []
-
-    def save_conversation_history(self, user_id: str, history: list[dict]) -> None:
-        """Guarda el historial de conversación de un usuario en un archivo JSON."""
-        history_file = self._get_history_file_path(user_id)
-        try:
-            with open(history_file, "w", encoding="utf-8") as f:
-                json.dump(history, f, indent=4, ensure_ascii=False)
-            logger.debug(f"Historial guardado para {user_id}: {len(history)} mensajes.")
-        except IOError as e:
-            logger.error(f"Error al guardar el historial para {user_id}: {e}")
+    async def append_conversation_messages(self, user_id: str, messages: list[dict]) -> None:
+        """Añade los mensajes de un turno al historial de conversación del usuario."""
+        await self._history_store.append(user_id, messages)
+        logger.debug(f"Historial actualizado para {user_id}: {len(messages)} mensajes añadidos.")
@@ -1,15 +1,32 @@
 import logging
-import re
 import json
-from fastapi import APIRouter, HTTPException, Request, Depends
-from src.api.nlp_schemas import NLPQuery, NLPResponse, RecommendationsResponse, Recommendation
+import time
+from typing import Optional
+from fastapi import APIRouter, HTTPException, Request, Response, Depends, Query
+from fastapi.responses import StreamingResponse
+from src.api.nlp_schemas import (
+    NLPQuery, NLPResponse, NLPStreamFinal, RecommendationsResponse, Recommendation, DestinationSearchResponse,
+)
 from src.api.schemas import StatusResponse
 from src.api import utils
+from src.ai.nlp.llm_scheduler import LLMSchedulerOverloaded, LANE_BATCH
+from src.ai.nlp.nlp_core import RESPONSE_FORMAT_RECOMMENDATIONS
+from src.utils.destination_api import get_destination_catalog
 
 logger = logging.getLogger("APIRoutes")
 
 nlp_router = APIRouter()
 
+
+def _overloaded_exception(error: LLMSchedulerOverloaded) -> HTTPException:
+    """Convierte un rechazo del planificador del LLM en una respuesta 429/503 con Retry-After."""
+    return HTTPException(
+        status_code=error.status_code,
+        detail=f"Servicio NLP saturado: {error}. Intenta de nuevo en {error.retry_after} s.",
+        headers={"Retry-After": str(error.retry_after)},
+    )
+
+
 @nlp_router.post("/nlp/query", response_model=NLPResponse)
 async def query_nlp(query: NLPQuery, request: Request):
     """Procesa una consulta NLP y devuelve la respuesta generada."""
@@ -46,215 +63,172 @@ async def query_nlp(query: NLPQuery, request: Request):
         
     except HTTPException:
         raise
+    except LLMSchedulerOverloaded as e:
+        raise _overloaded_exception(e)
     except Exception as e:
         logger.error(f"Error inesperado en consulta NLP para /nlp/query: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error al procesar la consulta NLP: {str(e)}")
 
 
-@nlp_router.post("/nlp/recommendations", response_model=RecommendationsResponse)
-async def get_recommendations(query: NLPQuery, request: Request):
-    """Devuelve exactamente 3 recomendaciones en formato JSON puro, sin texto extra."""
+
+def _format_sse_event(event: str, data: dict) -> str:
+    """Serializa un evento en formato Server-Sent Events."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@nlp_router.post("/nlp/query/stream")
+async def query_nlp_stream(query: NLPQuery, request: Request):
+    """
+    Procesa una consulta NLP y devuelve la respuesta como Server-Sent Events.
+
+    Emite eventos `token` con el texto visible a medida que el modelo lo genera y un evento
+    `final` con la respuesta procesada, el comando y los marcadores retenidos del stream.
+    """
     auth_header = request.headers.get("Authorization")
     if not auth_header or not auth_header.startswith("Bearer "):
         raise HTTPException(status_code=401, detail="Token de autenticación Bearer no proporcionado o inválido.")
     auth_token = auth_header.split(" ")[1]
 
     try:
-        recommendation_prompt = f"""INSTRUCCIÓN CRÍTICA: Genera EXACTAMENTE 3 recomendaciones de destinos diferentes.
+        utils._nlp_module.ensure_llm_capacity()
+    except LLMSchedulerOverloaded as e:
+        raise _overloaded_exception(e)
+
+    async def event_source():
+        try:
+            async for event in utils._nlp_module.generate_response_stream(
+                query.prompt,
+                userId=query.userId,
+                auth_token=auth_token
+            ):
+                if event["event"] == "final":
+                    final_data = event["data"]
+                    payload = NLPStreamFinal(
+                        response=final_data["response"],
+                        command=final_data.get("command"),
+                        prompt_sent=query.prompt,
+                        user_name=final_data.get("user_name"),
+                        userId=query.userId,
+                        error=final_data.get("error"),
+                        markers=final_data.get("markers", []),
+                    )
+                    logger.info(f"Consulta NLP en streaming finalizada. Respuesta completa: {payload.model_dump()}")
+                    yield _format_sse_event("final", payload.model_dump())
+                else:
+                    yield _format_sse_event(event["event"], event["data"])
+        except LLMSchedulerOverloaded as e:
+            yield _format_sse_event("error", {
+                "detail": f"Servicio NLP saturado: {e}",
+                "status_code": e.status_code,
+                "retry_after": e.retry_after,
+            })
+        except Exception as e:
+            logger.error(f"Error inesperado en consulta NLP para /nlp/query/stream: {e}", exc_info=True)
+            yield _format_sse_event("error", {"detail": f"Error al procesar la consulta NLP: {str(e)}"})
+
+    return StreamingResponse(
+        event_source(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@nlp_router.delete("/nlp/users/{user_id}/cache", status_code=204)
+async def invalidate_user_cache(user_id: str, request: Request):
+    """
+    Descarta los datos y preferencias en caché de un usuario. El backend puede llamarlo
+    cuando el usuario cambia sus preferencias para que el siguiente turno las relea.
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Token de autenticación Bearer no proporcionado o inválido.")
 
-        FORMATO OBLIGATORIO para cada una (sin excepciones):
-        **Destino:** [nombre del destino]
-        **Ubicación:** [ubicación]
-        **Descripción:** [breve descripción]
-        **Presupuesto:** [precio] euros
-        **Ideal para:** [razón según perfil del usuario]
-        ---
-        GENERAR_RECOMENDACION_JSON: {{"userId":"{query.userId}","destinationId":"[ID exacto del destino]","tipo":"basado_en_preferencias","aceptada":false}}
+    utils._nlp_module.user_manager.invalidate_user_data(user_id)
 
-        [LÍNEA EN BLANCO]
 
-        [Repetir para destino 2]
+@nlp_router.get("/nlp/destinations/search", response_model=DestinationSearchResponse)
+async def search_destinations(
+    q: str, request: Request, limit: int = Query(10, ge=1, le=50), max_budget: Optional[float] = None
+):
+    """
+    Busca destinos por texto libre en el índice BM25 del catálogo ("playas cerca de Cartagena").
+    Es la misma búsqueda que elige los destinos relevantes para el prompt; útil para depurar y medir.
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Token de autenticación Bearer no proporcionado o inválido.")
 
-        [LÍNEA EN BLANCO]
+    start = time.perf_counter()
+    results = await get_destination_catalog().search(q, limit=limit, max_budget=max_budget)
+    return DestinationSearchResponse(
+        query=q,
+        results=[{"destination": destination, "score": round(score, 4)} for destination, score in results],
+        elapsed_ms=round((time.perf_counter() - start) * 1000, 3),
+    )
 
-        [Repetir para destino 3]
 
-        REGLAS ABSOLUTAS:
-        - USA el userId UUID: {query.userId}
-        - NO uses bloques de código ```json```
-        - NO generes listas de más de 3 destinos
-        - El destinationId debe existir en available_destinations
-        - DEBES incluir el marcador GENERAR_RECOMENDACION_JSON: para cada recomendación
+@nlp_router.post("/nlp/recommendations", response_model=RecommendationsResponse)
+async def get_recommendations(query: NLPQuery, request: Request, http_response: Response):
+    """
+    Devuelve exactamente 3 recomendaciones en formato JSON puro, sin texto extra.
+
+    El modelo genera las recomendaciones como JSON restringido por un esquema cuyos
+    destinationId solo pueden ser los destinos enviados en el prompt, así que una sola
+    generación basta. Se guardan todas a la vez al final. La cabecera Server-Timing separa el tiempo del modelo (`llm`, con `queue` de espera en cola)
+    del tiempo de guardado en el backend (`persist`).
+    """
+    auth_header = request.headers.get("Authorization")
+    if not auth_header or not auth_header.startswith("Bearer "):
+        raise HTTPException(status_code=401, detail="Token de autenticación Bearer no proporcionado o inválido.")
+    auth_token = auth_header.split(" ")[1]
 
-        Pregunta del usuario: {query.prompt}"""
-        
+    try:
+        recommendation_prompt = (
+            "Recomienda exactamente 3 destinos diferentes de la lista de destinos disponibles, "
+            "según el perfil y las preferencias del usuario. Para cada uno indica el destinationId, "
+            "el tipo de recomendación y un motivo breve.\n\n"
+            f"Pregunta del usuario: {query.prompt}"
+        )
+
+        user_manager = utils._nlp_module.user_manager
+
+        llm_start = time.perf_counter()
         response = await utils._nlp_module.generate_response(
             recommendation_prompt,
             userId=query.userId,
-            auth_token=auth_token
-        )
-        
-        raw_content = response.get("command", "")
-        
-        if not raw_content:
-            from src.ai.nlp.user_manager import UserManager
-            user_manager = UserManager()
-            history = user_manager.load_conversation_history(query.userId)
-            if history and len(history) > 0:
-                for msg in reversed(history):
-                    if msg.get("role") == "assistant":
-                        raw_content = msg.get("content", "")
-                        break
-        
-        logger.info(f"Contenido crudo para extraer recomendaciones: {raw_content[:500]}...")
-        
-        recomendaciones = []
-        
-        pattern = re.compile(
-            r'(?:GENERAR_RECOMENDACION_JSON|Generar_recomendacion_JSON):\s*(\{[^}]+\})|```json\s*(\{[^}]+\})\s*```|(?:^|\n)(\{\s*"userId"[^}]+\})',
-            re.DOTALL | re.IGNORECASE | re.MULTILINE
+            auth_token=auth_token,
+            allow_cache=False,
+            lane=LANE_BATCH,
+            response_format=RESPONSE_FORMAT_RECOMMENDATIONS
         )
-        
-        matches = pattern.finditer(raw_content)
-        
-        logger.info(f"Iniciando extracción de recomendaciones...")
-        
-        for match in matches:
-            json_str = match.group(1) or match.group(2) or match.group(3)
-            if not json_str:
-                continue
-            
-            json_str = json_str.strip()
-            
-            logger.debug(f"JSON extraído: {json_str}")
-            
-            try:
-                rec = json.loads(json_str)
-                
-                if not all(key in rec for key in ["destinationId", "userId", "tipo", "aceptada"]):
-                    logger.warning(f"JSON no tiene todas las claves necesarias: {rec}")
-                    continue
-                
-                if rec["userId"] != query.userId:
-                    logger.warning(f"Corrigiendo userId de '{rec['userId']}' a '{query.userId}'")
-                    rec["userId"] = query.userId
-                
-                if any(r.destinationId == rec["destinationId"] for r in recomendaciones):
-                    logger.info(f"Destino duplicado ignorado: {rec['destinationId']}")
-                    continue
-                
-                from src.ai.nlp.user_manager import UserManager
-                user_manager = UserManager()
-                recommendation_id = await user_manager.save_recommendation_to_api(
-                    query.userId,
-                    rec,
-                    auth_token
-                )
-                
-                if recommendation_id:
-                    rec["recommendation_id"] = recommendation_id
-                    recomendaciones.append(Recommendation(**rec))
-                    logger.info(f"Recomendación {len(recomendaciones)} procesada y guardada con ID {recommendation_id}: {rec['destinationId']}")
-                else:
-                    logger.warning(f"No se pudo guardar la recomendación en la API, pero se agregará a la respuesta")
-                    recomendaciones.append(Recommendation(**rec))
-                
-            except json.JSONDecodeError as e:
-                logger.error(f"Error al parsear JSON: {e} - Contenido: {json_str[:200]}")
-                continue
-            except Exception as e:
-                logger.error(f"Error al procesar recomendación: {e}", exc_info=True)
-                continue
-            
-            if len(recomendaciones) >= 3:
-                logger.info("Se alcanzaron 3 recomendaciones, deteniendo búsqueda")
-                break
-        
-        logger.info(f"Total de recomendaciones extraídas: {len(recomendaciones)}")
-
-        if len(recomendaciones) < 3:
-            logger.warning(f"Solo se generaron {len(recomendaciones)} recomendaciones, intentando obtener más...")
-            try:
-                additional_prompt = f"""CRÍTICO: Necesito EXACTAMENTE {3 - len(recomendaciones)} recomendaciones MÁS.
-
-                FORMATO OBLIGATORIO (copia este formato exactamente):
-                **Destino:** [nombre]
-                **Ubicación:** [ubicación]
-                **Descripción:** [descripción]
-                **Presupuesto:** [precio] euros
-                ---
-                GENERAR_RECOMENDACION_JSON: {{"userId":"{query.userId}","destinationId":"[id]","tipo":"basado_en_categoria","aceptada":false}}  
-
-                NO repitas estos destinos: {[r.destinationId for r in recomendaciones]}
-                USA diferentes destinos de available_destinations."""
-
-                additional_response = await utils._nlp_module.generate_response(
-                    additional_prompt,
-                    userId=query.userId,
-                    auth_token=auth_token
-                )
-                
-                additional_raw = additional_response.get("command", "")
-                if not additional_raw:
-                    from src.ai.nlp.user_manager import UserManager
-                    user_manager = UserManager()
-                    history = user_manager.load_conversation_history(query.userId)
-                    if history and len(history) > 0:
-                        for msg in reversed(history):
-                            if msg.get("role") == "assistant":
-                                additional_raw = msg.get("content", "")
-                                break
-                
-                additional_matches = pattern.finditer(additional_raw)
-                logger.info(f"Buscando recomendaciones adicionales...")
-                
-                for match in additional_matches:
-                    json_str = match.group(1) or match.group(2) or match.group(3)
-                    if not json_str:
-                        continue
-                    
-                    json_str = json_str.strip()
-                    
-                    try:
-                        rec = json.loads(json_str)
-                        if not all(key in rec for key in ["destinationId", "userId", "tipo", "aceptada"]):
-                            continue
-                        
-                        if rec["userId"] != query.userId:
-                            rec["userId"] = query.userId
-                        
-                        if any(r.destinationId == rec["destinationId"] for r in recomendaciones):
-                            continue
-                        
-                        from src.ai.nlp.user_manager import UserManager
-                        user_manager = UserManager()
-                        recommendation_id = await user_manager.save_recommendation_to_api(
-                            query.userId,
-                            rec,
-                            auth_token
-                        )
-                        
-                        if recommendation_id:
-                            rec["recommendation_id"] = recommendation_id
-                        
-                        recomendaciones.append(Recommendation(**rec))
-                        logger.info(f"Recomendación adicional procesada: {rec['destinationId']}")
-                        
-                    except Exception:
-                        continue
-                    
-                    if len(recomendaciones) >= 3:
-                        break
-                        
-            except Exception as e:
-                logger.error(f"Error al obtener recomendaciones adicionales: {e}", exc_info=True)
-
-        if len(recomendaciones) > 0 and len(recomendaciones) < 3:
+        llm_ms = (time.perf_counter() - llm_start) * 1000
+        queue_ms = (response.get("timings") or {}).get("queue_wait_ms", 0.0)
+
+        if response.get("error"):
+            logger.error(f"Error al generar recomendaciones para {query.userId}: {response['error']}")
+        recomendaciones = response.get("recommendations") or []
+        logger.info(f"Total de recomendaciones generadas: {len(recomendaciones)}")
+
+        persist_start = time.perf_counter()
+        recommendation_ids = await user_manager.save_recommendations_to_api(query.userId, recomendaciones, auth_token)
+        persist_ms = (time.perf_counter() - persist_start) * 1000
+        for rec, recommendation_id in zip(recomendaciones, recommendation_ids):
+            if recommendation_id:
+                rec["recommendation_id"] = recommendation_id
+            else:
+                logger.warning(f"No se pudo guardar la recomendación {rec['destinationId']} en la API, pero se agregará a la respuesta")
+        saved = next((rec for rec in recomendaciones if rec.get("recommendation_id")), None)
+        if saved:
+            await user_manager.save_last_recommendation(query.userId, saved)
+        recomendaciones = [Recommendation(**rec) for rec in recomendaciones]
+
+        http_response.headers["Server-Timing"] = f"llm;dur={llm_ms:.1f}, queue;dur={queue_ms:.1f}, persist;dur={persist_ms:.1f}"
+        logger.info(f"Recomendaciones: LLM {llm_ms:.1f} ms (cola {queue_ms:.1f} ms), guardado {persist_ms:.1f} ms")
+
+        if 0 < len(recomendaciones) < 3:
+            # Nunca se rellena con duplicados: se devuelven solo las recomendaciones distintas obtenidas.
             logger.warning(f"Solo se pudieron generar {len(recomendaciones)} recomendaciones únicas")
-            while len(recomendaciones) < 3:
-                last_rec = recomendaciones[-1]
-                recomendaciones.append(last_rec)
-        
+
         if len(recomendaciones) == 0:
             raise HTTPException(
                 status_code=500,
@@ -267,6 +241,8 @@ async def get_recommendations(query: NLPQuery, request: Request):
         
     except HTTPException:
         raise
+    except LLMSchedulerOverloaded as e:
+        raise _overloaded_exception(e)
     except Exception as e:
         logger.error(f"Error inesperado en consulta NLP para /nlp/recommendations: {e}", exc_info=True)
         raise HTTPException(status_code=500, detail=f"Error al procesar las recomendaciones: {str(e)}")
\ No newline at end of file
@@ -14,6 +14,27 @@ class NLPResponse(BaseModel):
     user_name: Optional[str] = None
     userId: Optional[str] = None
 
+class StreamMarker(BaseModel):
+    """Marcador interno retenido del stream visible (recomendación, preferencia o bloque JSON)."""
+    type: str
+    raw: str
+
+class NLPStreamFinal(NLPResponse):
+    """Evento final del streaming NLP: respuesta procesada y marcadores retenidos."""
+    error: Optional[str] = None
+    markers: list[StreamMarker] = []
+
+class DestinationSearchHit(BaseModel):
+    """Destino encontrado por la búsqueda de texto libre y su puntuación BM25."""
+    destination: dict
+    score: float
+
+class DestinationSearchResponse(BaseModel):
+    """Resultados de la búsqueda de destinos, de mayor a menor relevancia."""
+    query: str
+    results: list[DestinationSearchHit]
+    elapsed_ms: float
+
 class Recommendation(BaseModel):
     """Modelo para una recomendación individual."""
     destinationId: str
@@ -22,14 +43,16 @@ class Recommendation(BaseModel):
     aceptada: bool
 
 class RecommendationsResponse(BaseModel):
-    """Modelo para la respuesta de recomendaciones (exactamente 3)."""
+    """Modelo para la respuesta de recomendaciones (hasta 3, con destinos distintos)."""
     recommendations: list[Recommendation]
 
     @field_validator('recommendations')
     @classmethod
     def validate_recommendations_count(cls, v):
-        if len(v) != 3:
-            raise ValueError('Se requieren exactamente 3 recomendaciones')
+        if not 1 <= len(v) <= 3:
+            raise ValueError('Se requieren entre 1 y 3 recomendaciones')
+        if len({rec.destinationId for rec in v}) != len(v):
+            raise ValueError('Las recomendaciones deben ser de destinos distintos')
         return v
 
     class Config:
@@ -25,4 +25,13 @@ async def get_status():
         return status
     except Exception as e:
         logger.error(f"Error al obtener estado para /status: {e}")
-        raise HTTPException(status_code=500, detail="Error interno del servidor")   
\ No newline at end of file
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
+
+@router.get("/metrics")
+async def get_metrics():
+    """Devuelve métricas de monitorización de los módulos (pools de conexiones, cachés, colas)."""
+    try:
+        return utils.get_module_metrics()
+    except Exception as e:
+        logger.error(f"Error al obtener métricas para /metrics: {e}")
+        raise HTTPException(status_code=500, detail="Error interno del servidor")
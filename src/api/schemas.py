@@ -1,3 +1,4 @@
+from typing import Dict
 from pydantic import BaseModel
 
 class StatusResponse(BaseModel):
@@ -5,4 +6,5 @@ class StatusResponse(BaseModel):
     nlp: str
     stt: str = "OFFLINE"
     tts: str = "OFFLINE"
-    utils: str = "OFFLINE"
\ No newline at end of file
+    utils: str = "OFFLINE"
+    states: Dict[str, str] = {}
\ No newline at end of file
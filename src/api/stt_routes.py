@@ -13,7 +13,8 @@ stt_router = APIRouter()
 @stt_router.post("/stt/transcribe", response_model=STTResponse)
 async def transcribe_audio(audio_file: UploadFile = File(...)):
     """Convierte voz a texto usando el módulo STT."""
-    if utils._stt_module is None or not utils._stt_module.is_online():
+    stt_module = await utils.ensure_stt_module()
+    if stt_module is None or not stt_module.is_online():
         raise HTTPException(status_code=503, detail="El módulo STT está fuera de línea")
     
     # Guardar el archivo de audio temporalmente en un directorio temporal
@@ -24,7 +25,7 @@ async def transcribe_audio(audio_file: UploadFile = File(...)):
                 content = await audio_file.read()
                 file_object.write(content)
             
-            transcribed_text = utils._stt_module.transcribe_audio(str(file_location)).result()
+            transcribed_text = stt_module.transcribe_audio(str(file_location)).result()
 
         if transcribed_text is None:
             raise HTTPException(status_code=500, detail="No se pudo transcribir el audio")
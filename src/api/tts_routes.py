@@ -24,14 +24,15 @@ async def generate_audio(request: TTSTextRequest):
     Raises:
         HTTPException: Si el módulo TTS está fuera de línea o si ocurre un error durante la generación de audio.
     """
-    if utils._tts_module is None or not utils._tts_module.is_online():
+    tts_module = await utils.ensure_tts_module()
+    if tts_module is None or not tts_module.is_online():
         raise HTTPException(status_code=503, detail="El módulo TTS está fuera de línea")
     
     try:
         audio_filename = f"tts_audio_{uuid.uuid4()}.wav"
         file_location = AUDIO_OUTPUT_DIR / audio_filename
         
-        future_audio_generated = utils._tts_module.generate_speech(request.text, str(file_location))
+        future_audio_generated = tts_module.generate_speech(request.text, str(file_location))
         audio_generated = future_audio_generated.result()
 
         if not audio_generated:
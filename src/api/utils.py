@@ -1,21 +1,43 @@
 from src.ai.nlp.nlp_core import NLPModule
-from src.ai.stt.stt import STTModule
-from src.ai.tts.tts_module import TTSModule
+from src.ai.nlp.config_manager import ConfigManager
 import os
 import logging
 from datetime import datetime
+from pathlib import Path
 import json
 
 import asyncio
 from src.api.schemas import StatusResponse
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, TYPE_CHECKING
 from src.utils.error_handler import ErrorHandler
 
+if TYPE_CHECKING:
+    # Whisper y XTTS se importan al cargar cada módulo: su importación ya tarda varios segundos.
+    from src.ai.stt.stt import STTModule
+    from src.ai.tts.tts_module import TTSModule
+
 logger = logging.getLogger("APIUtils")
 
+CONFIG_PATH = Path(__file__).parent.parent / "ai" / "config" / "config.json"
+
+# Estados de carga de cada módulo, visibles en `states` de /status.
+MODULE_LOADING = "LOADING"
+MODULE_READY = "READY"
+MODULE_FAILED = "FAILED"
+MODULE_DISABLED = "DISABLED"
+MODULE_DEFERRED = "DEFERRED"
+
+DEFAULT_MODULES_CONFIG: Dict[str, Dict[str, bool]] = {
+    "stt": {"enabled": True, "lazy": False},
+    "tts": {"enabled": True, "lazy": False},
+}
+
 _nlp_module: Optional[NLPModule] = None
-_stt_module: Optional[STTModule] = None
-_tts_module: Optional[TTSModule] = None
+_stt_module: Optional["STTModule"] = None
+_tts_module: Optional["TTSModule"] = None
+
+_module_states: Dict[str, str] = {"nlp": MODULE_LOADING, "stt": MODULE_LOADING, "tts": MODULE_LOADING}
+_module_tasks: Dict[str, asyncio.Task] = {}
 
 def get_module_status() -> StatusResponse:
     """
@@ -33,9 +55,21 @@ def get_module_status() -> StatusResponse:
         nlp=nlp_status,
         stt=stt_status,
         tts=tts_status,
-        utils=utils_status
+        utils=utils_status,
+        states=dict(_module_states),
     )
 
+def get_module_metrics() -> Dict[str, Any]:
+    """
+    Devuelve las métricas de monitorización de los módulos.
+
+    Returns:
+        Dict[str, Any]: Métricas por módulo (pools de conexiones, cachés, colas).
+    """
+    return {
+        "nlp": _nlp_module.get_metrics() if _nlp_module else None,
+    }
+
 def _sanitize_data(data: Dict[str, Any]) -> Dict[str, Any]:
     sensitive_keys = ["password", "token", "access_key", "secret", "api_key"]
     sanitized_data = data.copy()
@@ -44,6 +78,14 @@ def _sanitize_data(data: Dict[str, Any]) -> Dict[str, Any]:
             sanitized_data[key] = "[REDACTED]"
     return sanitized_data
 
+def _load_modules_config() -> Dict[str, Dict[str, bool]]:
+    """
+    Lee la sección `modules` de config.json: si STT y TTS están habilitados (`enabled`) y si se
+    cargan al arrancar o en su primer uso (`lazy`).
+    """
+    config = ConfigManager(CONFIG_PATH).get_config().get("modules", {})
+    return {name: {**defaults, **config.get(name, {})} for name, defaults in DEFAULT_MODULES_CONFIG.items()}
+
 @ErrorHandler.handle_async_exceptions
 async def initialize_nlp_module() -> None:
     """
@@ -51,47 +93,131 @@ async def initialize_nlp_module() -> None:
     """
     global _nlp_module
     logger.info("Inicializando módulo NLP...")
+    _module_states["nlp"] = MODULE_LOADING
     _nlp_module = await ErrorHandler.safe_execute_async(
         lambda: NLPModule(),
         default_return=None,
         context="initialize_nlp.nlp_module"
     )
+    if _nlp_module:
+        await ErrorHandler.safe_execute_async(
+            _nlp_module.start,
+            default_return=False,
+            context="initialize_nlp.ollama_startup"
+        )
+    _module_states["nlp"] = MODULE_READY if _nlp_module else MODULE_FAILED
     logger.info(f"NLPModule inicializado. Online: {_nlp_module.is_online() if _nlp_module else False}")
 
-@ErrorHandler.handle_async_exceptions
-async def initialize_stt_module() -> None:
+def _create_stt_module() -> "STTModule":
+    from src.ai.stt.stt import STTModule
+    return STTModule()
+
+def _create_tts_module() -> "TTSModule":
+    from src.ai.tts.tts_module import TTSModule
+    return TTSModule()
+
+async def _load_audio_module(name: str) -> None:
     """
-    Inicializa el módulo STT.
+    Carga el módulo STT o TTS en un hilo de trabajo, sin bloquear el bucle de eventos.
+
+    Args:
+        name (str): "stt" o "tts".
     """
-    global _stt_module
-    logger.info("Inicializando módulo STT...")
-    _stt_module = await ErrorHandler.safe_execute_async(
-        lambda: STTModule(),
+    global _stt_module, _tts_module
+    label = name.upper()
+    logger.info(f"Inicializando módulo {label}...")
+    _module_states[name] = MODULE_LOADING
+    factory = _create_stt_module if name == "stt" else _create_tts_module
+    module = await ErrorHandler.safe_execute_async(
+        asyncio.to_thread,
+        factory,
         default_return=None,
-        context="initialize_nlp.stt_module"
+        context=f"initialize_nlp.{name}_module"
     )
-    logger.info(f"STTModule inicializado. Online: {_stt_module.is_online() if _stt_module else False}")
+    if name == "stt":
+        _stt_module = module
+    else:
+        _tts_module = module
+    _module_states[name] = MODULE_READY if module and module.is_online() else MODULE_FAILED
+    logger.info(f"{label}Module inicializado. Estado: {_module_states[name]}")
 
-@ErrorHandler.handle_async_exceptions
-async def initialize_tts_module() -> None:
+def _start_audio_module_load(name: str) -> asyncio.Task:
+    """Lanza la carga del módulo en segundo plano, o devuelve la que ya está en curso."""
+    task = _module_tasks.get(name)
+    if task is None:
+        task = asyncio.create_task(_load_audio_module(name))
+        _module_tasks[name] = task
+    return task
+
+async def _ensure_audio_module(name: str):
     """
-    Inicializa el módulo TTS.
+    Devuelve el módulo STT o TTS, esperando a que termine de cargarse. Un módulo diferido
+    empieza a cargarse con la primera solicitud que lo necesita.
+
+    Returns:
+        El módulo, o None si está deshabilitado o su carga falló.
     """
-    global _tts_module
-    logger.info("Inicializando módulo TTS...")
-    _tts_module = await ErrorHandler.safe_execute_async(
-        lambda: TTSModule(),
-        default_return=None,
-        context="initialize_nlp.tts_module"
-    )
-    logger.info(f"TTSModule inicializado. Online: {_tts_module.is_online() if _tts_module else False}")
+    if _module_states[name] == MODULE_DISABLED:
+        return None
+    await asyncio.shield(_start_audio_module_load(name))
+    return _stt_module if name == "stt" else _tts_module
+
+async def ensure_stt_module() -> Optional["STTModule"]:
+    """Devuelve el módulo STT, cargándolo si está diferido. None si está deshabilitado o falló."""
+    return await _ensure_audio_module("stt")
+
+async def ensure_tts_module() -> Optional["TTSModule"]:
+    """Devuelve el módulo TTS, cargándolo si está diferido. None si está deshabilitado o falló."""
+    return await _ensure_audio_module("tts")
 
 async def initialize_all_modules() -> None:
     """
     Inicializa todos los módulos (NLP, STT, TTS).
+
+    STT y TTS se cargan en hilos de trabajo a la vez que el NLP, y el arranque solo espera al
+    NLP: la API atiende texto mientras se cargan los modelos de voz. Los módulos deshabilitados
+    en `modules` no se cargan y los marcados como `lazy` se cargan en su primer uso.
     """
     logger.info("Inicializando todos los módulos...")
+    modules_config = _load_modules_config()
+    for name, module_config in modules_config.items():
+        if not module_config["enabled"]:
+            _module_states[name] = MODULE_DISABLED
+            logger.info(f"Módulo {name.upper()} deshabilitado en la configuración.")
+        elif module_config["lazy"]:
+            _module_states[name] = MODULE_DEFERRED
+            logger.info(f"Módulo {name.upper()} diferido hasta su primer uso.")
+        else:
+            _start_audio_module_load(name)
     await initialize_nlp_module()
-    await initialize_stt_module()
-    await initialize_tts_module()
-    logger.info("Todos los módulos inicializados correctamente.")
\ No newline at end of file
+    logger.info(f"Módulo NLP listo. Estados: {_module_states}")
+
+async def shutdown_all_modules() -> None:
+    """
+    Libera los recursos de los módulos al apagar la aplicación.
+    """
+    logger.info("Liberando recursos de los módulos...")
+    pending_loads = [task for task in _module_tasks.values() if not task.done()]
+    if pending_loads:
+        # La carga en el hilo no se puede interrumpir: se espera para liberar el módulo resultante.
+        logger.info("Esperando a que terminen las cargas de módulos en curso...")
+        await asyncio.gather(*pending_loads, return_exceptions=True)
+    if _nlp_module:
+        await ErrorHandler.safe_execute_async(
+            _nlp_module.aclose,
+            default_return=None,
+            context="shutdown.nlp_module"
+        )
+    if _stt_module:
+        ErrorHandler.safe_execute(
+            _stt_module.shutdown,
+            default_return=None,
+            context="shutdown.stt_module"
+        )
+    if _tts_module:
+        ErrorHandler.safe_execute(
+            _tts_module.shutdown,
+            default_return=None,
+            context="shutdown.tts_module"
+        )
+    logger.info("Recursos de los módulos liberados.")
\ No newline at end of file
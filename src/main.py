@@ -88,6 +88,7 @@ async def shutdown_event() -> None:
     Evento de cierre de la aplicación.
     """
     logger.info("Cerrando aplicación...")
+    await utils.shutdown_all_modules()
     logger.info("Aplicación cerrada correctamente")
 
 app.include_router(router, prefix="")
\ No newline at end of file
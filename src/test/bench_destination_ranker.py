@@ -0,0 +1,60 @@
+"""
+Micro-benchmark del ranking de destinos sobre un catálogo sintético.
+
+Mide la construcción de características (una vez por versión del catálogo, en el hilo del
+refresco) y el tiempo por consulta con preferencias completas. Uso: python -m src.test.bench_destination_ranker
+"""
+import random
+import timeit
+from src.ai.nlp.destination_ranker import DestinationRanker, RankingFeatures
+
+CATALOG_SIZES = [500, 5000, 20000]
+ITERATIONS = 2000
+
+CATEGORIES = ["playa", "montaña", "ciudad", "cultural", "naturaleza", "gastronomía"]
+LOCATIONS = ["Cartagena, Colombia", "Bogotá, Colombia", "Medellín, Colombia", "Cusco, Perú", "Lima, Perú", "Quito, Ecuador"]
+WORDS = ["buceo", "senderismo", "museos", "arena", "cascada", "café", "historia", "surf", "mercado", "volcán", "aves", "río"]
+
+PREFERENCES = {
+    "categoria_favorita": "Playa",
+    "ubicacion_favorita": "Cartagena",
+    "preferencia_precio": 800,
+    "no_le_gusta": "museos",
+    "activities": ["buceo", "senderismo"],
+    "placeTypes": ["playa", "naturaleza"],
+}
+
+
+def build_catalog(size: int, seed: int = 7) -> list:
+    """Genera un catálogo ordenado por precio como el de DestinationCatalog."""
+    rng = random.Random(seed)
+    catalog = [
+        {
+            "id": f"00000000-0000-0000-0000-{i:012d}",
+            "name": f"Destino {i}",
+            "description": " ".join(rng.sample(WORDS, 4)),
+            "location": rng.choice(LOCATIONS),
+            "precio": round(rng.uniform(50, 2000), 2),
+            "category": rng.choice(CATEGORIES),
+        }
+        for i in range(size)
+    ]
+    catalog.sort(key=lambda d: d["precio"])
+    return catalog
+
+
+def main():
+    for size in CATALOG_SIZES:
+        catalog = build_catalog(size)
+        ranker = DestinationRanker()
+        features = RankingFeatures(catalog)
+        rank_ms = timeit.timeit(lambda: ranker.rank(features, PREFERENCES), number=ITERATIONS) * 1000 / ITERATIONS
+        top = ranker.rank(features, PREFERENCES, top_k=3)
+        print(
+            f"{size:6d} destinos: construcción de características {features.build_ms:8.2f} ms, "
+            f"consulta {rank_ms:6.3f} ms; mejores: {[(d['category'], d['location'], d['precio']) for d in top]}"
+        )
+
+
+if __name__ == "__main__":
+    main()
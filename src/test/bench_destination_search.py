@@ -0,0 +1,41 @@
+"""
+Micro-benchmark del índice BM25 de destinos sobre un catálogo sintético.
+
+Mide la construcción completa, la actualización incremental tras cambiar el 1 % del
+catálogo y el tiempo por consulta. Uso: python -m src.test.bench_destination_search
+"""
+import time
+import timeit
+from src.test.bench_destination_ranker import build_catalog
+from src.utils.destination_search import DestinationSearchIndex
+
+CATALOG_SIZES = [500, 5000, 20000]
+ITERATIONS = 500
+QUERIES = ["playas cerca de Cartagena", "museos en Bogotá", "senderismo y cascadas", "café"]
+
+
+def main():
+    for size in CATALOG_SIZES:
+        catalog = build_catalog(size)
+        start = time.perf_counter()
+        index = DestinationSearchIndex().update(catalog)
+        build_ms = (time.perf_counter() - start) * 1000
+
+        changed = [dict(d, description=d["description"] + " surf") if i % 100 == 0 else d for i, d in enumerate(catalog)]
+        start = time.perf_counter()
+        index = index.update(changed)
+        update_ms = (time.perf_counter() - start) * 1000
+
+        query_ms = {
+            query: timeit.timeit(lambda: index.search(query, limit=20), number=ITERATIONS) * 1000 / ITERATIONS
+            for query in QUERIES
+        }
+        print(f"{size:6d} destinos: construcción {build_ms:8.1f} ms, actualización del 1 % {update_ms:7.1f} ms")
+        for query, elapsed in query_ms.items():
+            top = index.search(query, limit=1)
+            best = f"{top[0][0]['name']} ({top[0][0]['location']}, {top[0][1]:.2f})" if top else "-"
+            print(f"    {query!r:30s} {elapsed:7.3f} ms  mejor: {best}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,194 @@
+"""
+Prueba del reparto de generaciones entre varios servidores Ollama, contra servidores falsos locales.
+
+Levanta FAKE_SERVERS servidores HTTP mínimos que imitan `/api/tags`, `/api/generate`,
+`/api/chat` (en streaming, con una latencia por token distinta en cada uno) y `/api/embeddings`
+(sin el modelo de embeddings: responde 404) y comprueba: el reparto por menos generaciones en
+curso, la expulsión de un servidor caído y su readmisión cuando vuelve, que los errores 4xx de
+la solicitud y los fallos de embeddings no expulsan servidores, y la afinidad por usuario con
+`routing.sticky`. Termina con AssertionError si alguna comprobación falla.
+
+No requiere Ollama. Uso: python -m src.test.bench_ollama_routing
+"""
+import asyncio
+import json
+import time
+from collections import Counter
+from src.ai.nlp.ollama_manager import OllamaManager
+
+MODEL = "fake-model"
+BASE_PORT = 11501
+FAKE_SERVERS = 3
+TOKEN_DELAYS = [0.002, 0.004, 0.008]
+TOKENS = 20
+REQUESTS = 120
+CONCURRENCY = 12
+
+
+class FakeOllamaServer:
+    """Servidor HTTP/1.1 mínimo que responde como Ollama."""
+
+    def __init__(self, port: int, token_delay: float):
+        self.port = port
+        self.host = f"http://127.0.0.1:{port}"
+        self.token_delay = token_delay
+        self.chats = 0
+        self._server = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle, "127.0.0.1", self.port)
+
+    async def stop(self):
+        self._server.close()
+        await self._server.wait_closed()
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            _, path, _ = request_line.decode().split(" ", 2)
+            content_length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.decode().partition(":")
+                if name.lower() == "content-length":
+                    content_length = int(value)
+            body = json.loads(await reader.readexactly(content_length)) if content_length else {}
+
+            if path == "/api/embeddings" or (path == "/api/chat" and body.get("model") != MODEL):
+                error = json.dumps({"error": f"model '{body.get('model')}' not found"}).encode()
+                writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Type: application/json\r\n"
+                             b"Content-Length: " + str(len(error)).encode() + b"\r\nConnection: close\r\n\r\n" + error)
+                await writer.drain()
+                return
+
+            writer.write(b"HTTP/1.1 200 OK\r\nContent-Type: application/x-ndjson\r\nConnection: close\r\n\r\n")
+            if path == "/api/tags":
+                writer.write(json.dumps({"models": [{"name": MODEL}]}).encode())
+            elif path == "/api/generate":
+                writer.write(json.dumps({"model": MODEL, "response": "", "done": True}).encode())
+            elif path == "/api/chat":
+                self.chats += 1
+                for i in range(TOKENS if body.get("stream") else 0):
+                    await asyncio.sleep(self.token_delay)
+                    writer.write(json.dumps({"message": {"role": "assistant", "content": f"t{i} "}, "done": False}).encode() + b"\n")
+                    await writer.drain()
+                writer.write(json.dumps({"message": {"role": "assistant", "content": ""}, "done": True}).encode() + b"\n")
+            await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+
+async def run_requests(manager: OllamaManager, users: int = 30) -> Counter:
+    """Lanza REQUESTS generaciones con CONCURRENCY en paralelo y cuenta a qué servidor fue cada una."""
+    routed = Counter()
+    semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    async def one(i: int):
+        async with semaphore:
+            try:
+                async with manager.acquire(route_key=f"user-{i % users}") as client:
+                    routed[client._client.base_url.port] += 1
+                    stream = await client.chat(model=MODEL, messages=[{"role": "user", "content": "hola"}], stream=True)
+                    async for _ in stream:
+                        pass
+            except Exception:
+                routed["errores"] += 1
+
+    await asyncio.gather(*(one(i) for i in range(REQUESTS)))
+    return routed
+
+
+def print_endpoints(manager: OllamaManager) -> dict:
+    endpoints = manager.get_stats()["endpoints"]
+    for host, stats in endpoints.items():
+        print(f"    {host}: sano={stats['healthy']}, solicitudes={stats['requests']}, errores={stats['errors']}, "
+              f"expulsiones={stats['ejections']}, readmisiones={stats['readmissions']}")
+    return endpoints
+
+
+async def run_bad_requests(manager: OllamaManager, requests: int = 10) -> int:
+    """Lanza chats con un modelo inexistente y embeddings sin modelo (404) y cuenta los errores."""
+    errors = 0
+    for i in range(requests):
+        try:
+            async with manager.acquire(route_key=f"user-{i}") as client:
+                await client.chat(model="modelo-inexistente", messages=[{"role": "user", "content": "hola"}])
+        except Exception:
+            errors += 1
+        try:
+            async with manager.acquire(track_health=False) as client:
+                await client.embeddings(model="nomic-embed-text", prompt="hola")
+        except Exception:
+            errors += 1
+    return errors
+
+
+async def main():
+    servers = [FakeOllamaServer(BASE_PORT + i, TOKEN_DELAYS[i % len(TOKEN_DELAYS)]) for i in range(FAKE_SERVERS)]
+    for server in servers:
+        await server.start()
+
+    model_config = {
+        "name": MODEL,
+        "temperature": 0.4,
+        "max_tokens": 64,
+        "hosts": [server.host for server in servers],
+        "startup": {"warmup": False},
+        "routing": {"health_interval": 0.2, "max_failures": 2},
+    }
+    manager = OllamaManager(model_config)
+    print(f"En línea: {await manager.start()}")
+
+    start = time.perf_counter()
+    routed = await run_requests(manager)
+    print(f"\nMenos generaciones en curso ({time.perf_counter() - start:.2f} s), latencias {TOKEN_DELAYS}: {dict(routed)}")
+    assert "errores" not in routed, "Ninguna generación debería fallar con todos los servidores sanos"
+    assert len(routed) == FAKE_SERVERS, "Todos los servidores deberían recibir generaciones"
+    assert routed[servers[0].port] > routed[servers[-1].port], "El servidor más rápido debería recibir más generaciones"
+
+    errors = await run_bad_requests(manager)
+    print(f"\nSolicitudes con errores 4xx (modelo inexistente y embeddings): {errors} errores")
+    endpoints = print_endpoints(manager)
+    assert errors == 20, "Las solicitudes inválidas deberían fallar"
+    assert all(stats["healthy"] and stats["ejections"] == 0 for stats in endpoints.values()), \
+        "Los errores 4xx y los fallos de embeddings no deben expulsar servidores"
+
+    await servers[0].stop()
+    routed = await run_requests(manager)
+    print(f"\nCon {servers[0].host} caído: {dict(routed)}")
+    endpoints = print_endpoints(manager)
+    assert not endpoints[servers[0].host]["healthy"], "El servidor caído debería quedar expulsado"
+    # Solo las generaciones lanzadas a la vez antes de la expulsión pueden llegar al servidor caído.
+    assert routed[servers[0].port] <= CONCURRENCY, \
+        "Tras la expulsión no deberían llegar más generaciones al servidor caído"
+
+    await servers[0].start()
+    await asyncio.sleep(0.5)
+    print(f"\nTras reiniciar {servers[0].host}:")
+    endpoints = print_endpoints(manager)
+    assert endpoints[servers[0].host]["healthy"], "El servidor reiniciado debería readmitirse"
+    assert endpoints[servers[0].host]["readmissions"] == 1
+    await manager.aclose()
+
+    sticky = OllamaManager({**model_config, "routing": {**model_config["routing"], "sticky": True}})
+    await sticky.start()
+    hosts_per_user = {}
+    for user in range(10):
+        for _ in range(5):
+            async with sticky.acquire(route_key=f"user-{user}") as client:
+                hosts_per_user.setdefault(user, set()).add(client._client.base_url.port)
+    print(f"\nAfinidad por usuario (un servidor por usuario): {all(len(h) == 1 for h in hosts_per_user.values())}, "
+          f"usuarios por servidor: {dict(Counter(next(iter(h)) for h in hosts_per_user.values()))}")
+    assert all(len(h) == 1 for h in hosts_per_user.values()), "Con sticky cada usuario debería ir siempre al mismo servidor"
+    await sticky.aclose()
+
+    for server in servers:
+        await server.stop()
+    print("\nTodas las comprobaciones superadas.")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
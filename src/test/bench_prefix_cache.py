@@ -0,0 +1,102 @@
+"""
+Benchmark de la caché de prefijos de Ollama en turnos consecutivos.
+
+Compara el tiempo de prefill (prompt_eval_duration) entre el orden anterior del prompt,
+con la fecha y la hora en medio del system prompt, y el orden actual: prefijo estático,
+contexto del usuario, historial y datos volátiles al final.
+
+Requiere un servidor Ollama con el modelo configurado. Uso: python -m src.test.bench_prefix_cache
+"""
+import json
+import statistics
+from pathlib import Path
+from ollama import Client
+from src.ai.nlp import prompt_loader
+from src.ai.nlp.prompt_creator import _safe_format_value
+from src.test.bench_prompt_render import SAMPLE_VALUES
+
+CONFIG_PATH = Path(__file__).resolve().parents[1] / "ai" / "config" / "config.json"
+TURNS = 6
+USERS = [
+    ("4841d633-34a4-4ba8-90d2-d3b72090b5f6", "Ana"),
+    ("90ed5b50-f1b0-4f0b-92a5-536f2e05b186", "Luis"),
+]
+PROMPTS = [
+    "Hola, ¿qué destinos tienes?",
+    "¿Cuál es el más barato?",
+    "¿Y alguno de montaña?",
+    "Háblame del primero",
+    "¿Cuánto cuesta?",
+    "Gracias",
+]
+LEGACY_ORDER = ["identity", "context", "destinations", "volatile_context", "examples"]
+
+
+def _render(user_id: str, user_name: str, turn: int) -> dict:
+    """Renderiza las secciones del prompt con una hora distinta en cada turno."""
+    values = {key: _safe_format_value(value) for key, value in SAMPLE_VALUES.items()}
+    values.update(user_id=user_id, user_name=user_name, current_time=f"10:{turn:02d}")
+    return dict(prompt_loader.get_system_prompt_template().render_sections(values))
+
+
+def build_legacy_messages(sections: dict, history: list, prompt: str) -> list:
+    """Orden anterior: un único system prompt con la fecha y la hora antes de los ejemplos."""
+    system = prompt_loader.SECTION_SEPARATOR.join(sections[name] for name in LEGACY_ORDER if name in sections)
+    return [{"role": "system", "content": system}] + history + [{"role": "user", "content": prompt}]
+
+
+def build_cached_messages(sections: dict, history: list, prompt: str) -> list:
+    """Orden actual: prefijo estático y contexto del usuario, historial y datos volátiles al final."""
+    groups = {"static": [], "user": [], "volatile": []}
+    for name, text in sections.items():
+        groups[prompt_loader.get_section_group(name)].append(text)
+    head = prompt_loader.SECTION_SEPARATOR.join(groups["static"] + groups["user"])
+    volatile = prompt_loader.SECTION_SEPARATOR.join(groups["volatile"])
+    return (
+        [{"role": "system", "content": head}]
+        + history
+        + [{"role": "system", "content": volatile}, {"role": "user", "content": prompt}]
+    )
+
+
+def run(client: Client, model_config: dict, build_messages) -> list:
+    """Simula conversaciones intercaladas de varios usuarios y devuelve el prefill de cada turno en ms."""
+    histories = {user_id: [] for user_id, _ in USERS}
+    prefill_ms = []
+    for turn, prompt in enumerate(PROMPTS[:TURNS]):
+        for user_id, user_name in USERS:
+            messages = build_messages(_render(user_id, user_name, turn), histories[user_id], prompt)
+            response = client.chat(
+                model=model_config["name"],
+                messages=messages,
+                options={"num_predict": 32, "num_ctx": model_config.get("num_ctx", 8192), "temperature": 0},
+                keep_alive=model_config.get("keep_alive", "30m"),
+            )
+            prefill_ms.append(response.get("prompt_eval_duration", 0) / 1e6)
+            histories[user_id] += [
+                {"role": "user", "content": prompt},
+                {"role": "assistant", "content": response["message"]["content"]},
+            ]
+    return prefill_ms
+
+
+def main():
+    with open(CONFIG_PATH, encoding="utf-8") as f:
+        model_config = json.load(f)["model"]
+    client = Client(host=model_config.get("hosts", ["http://localhost:11434"])[0])
+
+    # Carga el modelo antes de medir para no contar el arranque en el primer turno.
+    client.generate(model=model_config["name"], prompt="", keep_alive=model_config.get("keep_alive", "30m"))
+
+    for name, build_messages in (("orden anterior", build_legacy_messages), ("prefijo estable", build_cached_messages)):
+        prefill_ms = run(client, model_config, build_messages)
+        # El primer turno de cada modo rellena la caché; se excluye de la media.
+        steady = prefill_ms[1:]
+        print(
+            f"{name:16s} prefill medio {statistics.mean(steady):8.1f} ms "
+            f"(mediana {statistics.median(steady):8.1f} ms, primer turno {prefill_ms[0]:8.1f} ms)"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+"""Micro-benchmark del renderizado del system prompt. Uso: python -m src.test.bench_prompt_render"""
+import json
+import timeit
+from src.ai.nlp import prompt_loader
+from src.ai.nlp.prompt_creator import _safe_format_value
+
+ITERATIONS = 2000
+
+SAMPLE_DESTINATIONS = [
+    {
+        "id": f"00000000-0000-0000-0000-{i:012d}",
+        "name": f"Destino {i}",
+        "description": "Una hermosa playa con aguas cristalinas y arena blanca.",
+        "location": "Cartagena, Colombia",
+        "latitude": 10.39,
+        "longitude": -75.47,
+        "precio": 100.0 + i,
+        "category": "playa",
+        "status": True,
+        "createdAt": "2025-10-01T00:00:00Z",
+        "updatedAt": "2025-10-01T00:00:00Z",
+        "status_code": None,
+    }
+    for i in range(20)
+]
+
+SAMPLE_VALUES = {
+    "assistant_name": "KODI",
+    "language": "es",
+    "user_id": "4841d633-34a4-4ba8-90d2-d3b72090b5f6",
+    "user_name": "Ana",
+    "user_email": "ana@ejemplo.com",
+    "user_username": "ana",
+    "user_permissions": "",
+    "current_date": "Hoy es 17 de octubre del 2026",
+    "current_time": "10:30",
+    "current_country": "Colombia",
+    "destino_favorito": "Playa Blanca",
+    "ubicacion_favorita": "Cartagena",
+    "categoria_favorita": "playa",
+    "no_le_gusta": None,
+    "preferencia_precio": 800,
+    "available_destinations": SAMPLE_DESTINATIONS,
+    "travelerTypes": ["aventurero"],
+    "travelingWith": "pareja",
+    "travelDuration": "1 semana",
+    "activities": ["buceo", "senderismo"],
+    "placeTypes": ["playa", "naturaleza"],
+    "budget": "medio",
+    "transport": "avión",
+}
+
+
+def _legacy_safe_format_value(value):
+    """Sanitización anterior: json importado en cada llamada y filtrado carácter a carácter."""
+    if value is None:
+        return "No disponible"
+    if isinstance(value, (dict, list, tuple)):
+        import json as legacy_json
+        return legacy_json.dumps(value, ensure_ascii=False)
+    if isinstance(value, bool):
+        return str(value).lower()
+    result = str(value)
+    if (result.startswith('{') and result.endswith('}')) or (result.startswith('[') and result.endswith(']')):
+        try:
+            import json as legacy_json
+            legacy_json.loads(result)
+            return result
+        except ValueError:
+            pass
+    result = result.replace("{", "{{").replace("}", "}}")
+    return ''.join(char for char in result if ord(char) >= 32 or char in '\n\r\t')
+
+
+def render_legacy() -> str:
+    """Ruta anterior: relee y parsea el YAML en cada solicitud y formatea con str.format."""
+    template = prompt_loader.load_system_prompt_template()
+    values = {key: _legacy_safe_format_value(value) for key, value in SAMPLE_VALUES.items()}
+    values["available_destinations"] = _legacy_safe_format_value(json.dumps(SAMPLE_DESTINATIONS, ensure_ascii=False))
+    return template.format(**values)
+
+
+def render_compiled() -> str:
+    """Ruta actual: template precompilado (recargado solo si cambia el mtime) y sanitización por tabla."""
+    template = prompt_loader.get_system_prompt_template()
+    values = {key: _safe_format_value(value) for key, value in SAMPLE_VALUES.items()}
+    return template.render(values)
+
+
+def main():
+    assert render_legacy() == render_compiled(), "Los dos caminos de renderizado no producen el mismo prompt"
+
+    for name, func in (("anterior (YAML + str.format)", render_legacy), ("precompilado", render_compiled)):
+        seconds = min(timeit.repeat(func, number=ITERATIONS, repeat=3))
+        print(f"{name:32s} {seconds / ITERATIONS * 1e6:10.1f} µs por render")
+
+
+if __name__ == "__main__":
+    main()
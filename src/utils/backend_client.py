@@ -0,0 +1,326 @@
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Dict, Optional
+import httpx
+from src.utils.circuit_breaker import CircuitBreaker, CircuitOpenError, CIRCUIT_CLOSED
+
+logger = logging.getLogger("BackendClient")
+
+DEFAULT_BACKEND_CONFIG: Dict[str, Any] = {
+    "base_url": "http://localhost:3001",
+    "http2": False,
+    "timeouts": {"connect": 3.0, "read": 10.0, "write": 10.0, "pool": 5.0},
+    "pool": {"max_connections": 50, "max_keepalive_connections": 20, "keepalive_expiry": 30.0},
+    "hedging": {"enabled": False, "delay_ms": 150.0, "max_hedges": 1},
+}
+
+# Segmentos de ruta que son identificadores (números, UUID, ObjectId): se agrupan en un mismo endpoint.
+_ID_SEGMENT_REGEX = re.compile(r"/(?:\d+|[0-9a-fA-F]{24}|[0-9a-fA-F]{8}-[0-9a-fA-F-]{27})(?=/|$)")
+
+_backend_client: Optional["BackendClient"] = None
+
+
+class BackendClient:
+    """
+    Cliente HTTP compartido para la API REST del backend (usuarios, recomendaciones, agenda, destinos).
+
+    Mantiene un único pool de conexiones keep-alive para toda la aplicación y lleva
+    contadores de uso para monitorización.
+
+    Cada endpoint (método y ruta sin identificadores) tiene su propio circuito: si el backend
+    falla o no responde, las solicitudes a ese endpoint se rechazan al instante con
+    `CircuitOpenError` en lugar de esperar a los timeouts. Con `hedging`, un GET que tarda más de
+    `delay_ms` se repite en paralelo y se usa la primera respuesta.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Inicializa el cliente a partir de la sección `backend` de la configuración.
+
+        Args:
+            config (Optional[Dict[str, Any]]): Configuración con `base_url`, `http2`, `timeouts`, `pool`,
+                `circuit_breaker` y `hedging`.
+        """
+        config = config or {}
+        self._base_url: str = config.get("base_url", DEFAULT_BACKEND_CONFIG["base_url"]).rstrip("/")
+        timeouts = {**DEFAULT_BACKEND_CONFIG["timeouts"], **config.get("timeouts", {})}
+        pool = {**DEFAULT_BACKEND_CONFIG["pool"], **config.get("pool", {})}
+        self._http2: bool = bool(config.get("http2", DEFAULT_BACKEND_CONFIG["http2"])) and self._h2_available()
+        self._hedging: Dict[str, Any] = {**DEFAULT_BACKEND_CONFIG["hedging"], **config.get("hedging", {})}
+        self._breaker_config: Dict[str, Any] = config.get("circuit_breaker", {})
+        self._breakers_enabled: bool = bool(self._breaker_config.get("enabled", True))
+        self._breakers: Dict[str, CircuitBreaker] = {}
+        self._client = httpx.AsyncClient(
+            base_url=self._base_url,
+            http2=self._http2,
+            timeout=httpx.Timeout(
+                connect=timeouts["connect"],
+                read=timeouts["read"],
+                write=timeouts["write"],
+                pool=timeouts["pool"],
+            ),
+            limits=httpx.Limits(
+                max_connections=pool["max_connections"],
+                max_keepalive_connections=pool["max_keepalive_connections"],
+                keepalive_expiry=pool["keepalive_expiry"],
+            ),
+        )
+        self._stats: Dict[str, Any] = {
+            "requests_total": 0,
+            "requests_in_flight": 0,
+            "errors_total": 0,
+            "status_codes": {},
+            "total_latency_ms": 0.0,
+            "circuit_rejections": 0,
+            "hedges": 0,
+            "hedge_wins": 0,
+        }
+        logger.info(f"BackendClient inicializado para {self._base_url} (HTTP/2: {self._http2}).")
+
+    @staticmethod
+    def _h2_available() -> bool:
+        """Comprueba si el paquete `h2` necesario para HTTP/2 está instalado."""
+        try:
+            import h2  # noqa: F401
+            return True
+        except ImportError:
+            logger.warning("HTTP/2 solicitado pero el paquete 'h2' no está instalado. Usando HTTP/1.1 keep-alive.")
+            return False
+
+    @property
+    def base_url(self) -> str:
+        """URL base del backend."""
+        return self._base_url
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        *,
+        headers: Optional[Dict[str, str]] = None,
+        json: Any = None,
+        params: Optional[Dict[str, Any]] = None,
+        timeout: Optional[float] = None,
+        hedge: Optional[bool] = None,
+    ) -> httpx.Response:
+        """
+        Envía una solicitud al backend reutilizando el pool de conexiones, a través del
+        circuito de su endpoint.
+
+        Args:
+            method (str): Método HTTP.
+            path (str): Ruta relativa a `base_url` (ej. "/api/agenda").
+            headers (Optional[Dict[str, str]]): Cabeceras adicionales.
+            json (Any): Cuerpo JSON de la solicitud.
+            params (Optional[Dict[str, Any]]): Parámetros de consulta.
+            timeout (Optional[float]): Timeout total para esta llamada; si es None se usan los de la configuración.
+            hedge (Optional[bool]): Repetir en paralelo la solicitud si tarda; por defecto solo en los GET
+                (idempotentes) y si `hedging.enabled`.
+
+        Returns:
+            httpx.Response: Respuesta del backend (sin validar el código de estado).
+
+        Raises:
+            CircuitOpenError: Si el circuito del endpoint está abierto (subclase de `httpx.RequestError`).
+            httpx.RequestError: Si la solicitud falla por red o timeout.
+        """
+        request_kwargs: Dict[str, Any] = {"headers": headers, "json": json, "params": params}
+        if timeout is not None:
+            request_kwargs["timeout"] = timeout
+
+        breaker = self._get_breaker(method, path)
+        self._check_circuit(breaker, method, path)
+        if hedge is None:
+            hedge = method.upper() == "GET" and self._hedging["enabled"]
+        if hedge and self._hedging["max_hedges"] > 0:
+            return await self._send_hedged(breaker, method, path, request_kwargs)
+        return await self._send(breaker, method, path, request_kwargs)
+
+    async def _send(
+        self, breaker: Optional[CircuitBreaker], method: str, path: str, request_kwargs: Dict[str, Any]
+    ) -> httpx.Response:
+        """Envía una solicitud y registra su resultado en las estadísticas y en el circuito."""
+        self._stats["requests_total"] += 1
+        self._stats["requests_in_flight"] += 1
+        start = time.perf_counter()
+        try:
+            response = await self._client.request(method, path, **request_kwargs)
+            status_key = str(response.status_code)
+            self._stats["status_codes"][status_key] = self._stats["status_codes"].get(status_key, 0) + 1
+            if breaker is not None:
+                # Los 4xx son errores de la solicitud, no del backend.
+                breaker.record_failure() if response.status_code >= 500 else breaker.record_success()
+            return response
+        except httpx.RequestError:
+            self._stats["errors_total"] += 1
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+            raise
+        finally:
+            self._stats["requests_in_flight"] -= 1
+            self._stats["total_latency_ms"] += (time.perf_counter() - start) * 1000
+
+    async def _send_hedged(
+        self, breaker: Optional[CircuitBreaker], method: str, path: str, request_kwargs: Dict[str, Any]
+    ) -> httpx.Response:
+        """
+        Envía la solicitud y, si no ha respondido en `hedging.delay_ms` (o ha fallado antes), lanza
+        hasta `max_hedges` copias en paralelo. Devuelve la primera respuesta y cancela el resto.
+
+        El circuito registra un único resultado por solicitud lógica, no uno por copia: una GET
+        lenta con su copia cuenta como un fallo, no como dos.
+        """
+        try:
+            response = await self._race_hedges(breaker, method, path, request_kwargs)
+        except httpx.RequestError:
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        except BaseException:
+            if breaker is not None:
+                breaker.release()
+            raise
+        if breaker is not None:
+            # Los 4xx son errores de la solicitud, no del backend.
+            breaker.record_failure() if response.status_code >= 500 else breaker.record_success()
+        return response
+
+    async def _race_hedges(
+        self, breaker: Optional[CircuitBreaker], method: str, path: str, request_kwargs: Dict[str, Any]
+    ) -> httpx.Response:
+        """Lanza la solicitud y sus copias (ver `_send_hedged`) sin registrar sus resultados en el circuito."""
+        delay = float(self._hedging["delay_ms"]) / 1000
+        original = asyncio.ensure_future(self._send(None, method, path, request_kwargs))
+        attempts = [original]
+        hedges_left = int(self._hedging["max_hedges"])
+        last_error: BaseException = httpx.RequestError("Sin respuesta del backend")
+        try:
+            while attempts:
+                done, _ = await asyncio.wait(
+                    attempts, timeout=delay if hedges_left else None, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    attempts.remove(task)
+                    if task.exception() is None:
+                        if task is not original:
+                            self._stats["hedge_wins"] += 1
+                        return task.result()
+                    last_error = task.exception()
+                if hedges_left and (not done or not attempts):
+                    # Sin respuesta a tiempo, o el único intento en curso falló: se lanza otra copia,
+                    # salvo que el circuito no esté cerrado (un sondeo semiabierto es una sola solicitud).
+                    if breaker is not None and breaker.state != CIRCUIT_CLOSED:
+                        hedges_left = 0
+                        continue
+                    hedges_left -= 1
+                    self._stats["hedges"] += 1
+                    attempts.append(asyncio.ensure_future(self._send(None, method, path, request_kwargs)))
+        finally:
+            for task in attempts:
+                task.cancel()
+        raise last_error
+
+    def _get_breaker(self, method: str, path: str) -> Optional[CircuitBreaker]:
+        """Circuito del endpoint (método y ruta con los identificadores sustituidos por `{id}`)."""
+        if not self._breakers_enabled:
+            return None
+        endpoint = f"{method.upper()} {_ID_SEGMENT_REGEX.sub('/{id}', path.split('?', 1)[0])}"
+        breaker = self._breakers.get(endpoint)
+        if breaker is None:
+            breaker = self._breakers[endpoint] = CircuitBreaker(endpoint, self._breaker_config)
+        return breaker
+
+    def _check_circuit(self, breaker: Optional[CircuitBreaker], method: str, path: str) -> None:
+        """Lanza CircuitOpenError si el circuito del endpoint no admite la solicitud."""
+        if breaker is not None and not breaker.allow():
+            raise self._circuit_open_error(breaker, method, path)
+
+    def _circuit_open_error(self, breaker: Optional[CircuitBreaker], method: str, path: str) -> CircuitOpenError:
+        self._stats["circuit_rejections"] += 1
+        name = breaker.name if breaker is not None else f"{method} {path}"
+        return CircuitOpenError(
+            f"Circuito abierto para {name}: el backend no está respondiendo",
+            request=self._client.build_request(method, path),
+        )
+
+    async def get(self, path: str, **kwargs) -> httpx.Response:
+        """Atajo para solicitudes GET."""
+        return await self.request("GET", path, **kwargs)
+
+    async def post(self, path: str, **kwargs) -> httpx.Response:
+        """Atajo para solicitudes POST."""
+        return await self.request("POST", path, **kwargs)
+
+    async def patch(self, path: str, **kwargs) -> httpx.Response:
+        """Atajo para solicitudes PATCH."""
+        return await self.request("PATCH", path, **kwargs)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Devuelve los contadores de uso del cliente y el estado del pool de conexiones.
+
+        Returns:
+            Dict[str, Any]: Estadísticas de solicitudes y conexiones (abiertas, ociosas, activas).
+        """
+        stats = dict(self._stats)
+        stats["status_codes"] = dict(self._stats["status_codes"])
+        completed = stats["requests_total"] - stats["requests_in_flight"]
+        stats["avg_latency_ms"] = round(stats["total_latency_ms"] / completed, 2) if completed else 0.0
+        stats["total_latency_ms"] = round(stats["total_latency_ms"], 2)
+        stats["pool"] = self._get_pool_stats()
+        stats["circuits"] = {name: breaker.get_stats() for name, breaker in self._breakers.items()}
+        return stats
+
+    def _get_pool_stats(self) -> Dict[str, Any]:
+        """Lee el estado del pool de conexiones de httpcore, si está disponible."""
+        try:
+            connections = self._client._transport._pool.connections
+            idle = sum(1 for connection in connections if connection.is_idle())
+            return {
+                "connections": len(connections),
+                "idle": idle,
+                "active": len(connections) - idle,
+                "http2": self._http2,
+            }
+        except AttributeError:
+            return {"connections": None, "idle": None, "active": None, "http2": self._http2}
+
+    async def aclose(self) -> None:
+        """Cierra el pool de conexiones."""
+        await self._client.aclose()
+        logger.info("BackendClient cerrado.")
+
+
+def init_backend_client(config: Optional[Dict[str, Any]] = None) -> BackendClient:
+    """
+    Crea el cliente compartido del backend para la aplicación, si aún no existe.
+
+    Args:
+        config (Optional[Dict[str, Any]]): Sección `backend` de la configuración.
+
+    Returns:
+        BackendClient: Cliente compartido.
+    """
+    global _backend_client
+    if _backend_client is None:
+        _backend_client = BackendClient(config)
+    return _backend_client
+
+
+def get_backend_client() -> BackendClient:
+    """Devuelve el cliente compartido del backend, creándolo con la configuración por defecto si es necesario."""
+    return init_backend_client()
+
+
+async def close_backend_client() -> None:
+    """Cierra el cliente compartido del backend, si existe."""
+    global _backend_client
+    if _backend_client is not None:
+        await _backend_client.aclose()
+        _backend_client = None
@@ -0,0 +1,126 @@
+import logging
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+import httpx
+
+logger = logging.getLogger("CircuitBreaker")
+
+CIRCUIT_CLOSED = "closed"
+CIRCUIT_OPEN = "open"
+CIRCUIT_HALF_OPEN = "half_open"
+
+DEFAULT_CIRCUIT_BREAKER_CONFIG: Dict[str, Any] = {
+    "enabled": True,
+    "window_seconds": 30.0,
+    "min_requests": 10,
+    "failure_rate": 0.5,
+    "open_seconds": 15.0,
+    "half_open_max_calls": 1,
+}
+
+
+class CircuitOpenError(httpx.RequestError):
+    """
+    La solicitud no se envió porque el circuito del endpoint está abierto.
+
+    Hereda de `httpx.RequestError` para que quien llama la trate como cualquier error de red.
+    """
+
+
+class CircuitBreaker:
+    """
+    Circuito de un endpoint del backend con ventana de tasa de fallos y sondeo semiabierto.
+
+    Cerrado: deja pasar las solicitudes y registra su resultado en una ventana de
+    `window_seconds`. Si en la ventana hay al menos `min_requests` solicitudes y la proporción
+    de fallos (errores de red y respuestas 5xx) llega a `failure_rate`, se abre. Abierto: rechaza
+    las solicitudes al instante durante `open_seconds`. Semiabierto: deja pasar hasta
+    `half_open_max_calls` sondeos; si aciertan se cierra y si fallan vuelve a abrirse.
+    """
+
+    def __init__(self, name: str, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            name (str): Endpoint protegido (ej. "GET /api/user-preferences/preferences/{id}").
+            config (Optional[Dict[str, Any]]): Sección `circuit_breaker` de `backend`.
+        """
+        config = {**DEFAULT_CIRCUIT_BREAKER_CONFIG, **(config or {})}
+        self.name: str = name
+        self._window_seconds: float = float(config["window_seconds"])
+        self._min_requests: int = int(config["min_requests"])
+        self._failure_rate: float = float(config["failure_rate"])
+        self._open_seconds: float = float(config["open_seconds"])
+        self._half_open_max_calls: int = int(config["half_open_max_calls"])
+
+        self.state: str = CIRCUIT_CLOSED
+        self._opened_at: float = 0.0
+        self._half_open_calls: int = 0
+        # (instante, falló) de las solicitudes recientes, para la tasa de fallos.
+        self._window: Deque[Tuple[float, bool]] = deque()
+        self._window_failures: int = 0
+        self._stats: Dict[str, int] = {"opened": 0, "rejected": 0, "successes": 0, "failures": 0}
+
+    def allow(self) -> bool:
+        """
+        Indica si se puede enviar una solicitud. En semiabierto reserva un sondeo, que se libera
+        con `record_success`, `record_failure` o `release`.
+        """
+        if self.state == CIRCUIT_OPEN:
+            if time.monotonic() - self._opened_at < self._open_seconds:
+                self._stats["rejected"] += 1
+                return False
+            self.state = CIRCUIT_HALF_OPEN
+            self._half_open_calls = 0
+            logger.info(f"Circuito {self.name} semiabierto: probando el backend.")
+        if self.state == CIRCUIT_HALF_OPEN:
+            if self._half_open_calls >= self._half_open_max_calls:
+                self._stats["rejected"] += 1
+                return False
+            self._half_open_calls += 1
+        return True
+
+    def record_success(self) -> None:
+        self._stats["successes"] += 1
+        if self.state == CIRCUIT_HALF_OPEN:
+            self.state = CIRCUIT_CLOSED
+            self._window.clear()
+            self._window_failures = 0
+            logger.info(f"Circuito {self.name} cerrado: el backend vuelve a responder.")
+            return
+        self._record(False)
+
+    def record_failure(self) -> None:
+        self._stats["failures"] += 1
+        if self.state == CIRCUIT_HALF_OPEN:
+            self._open("el sondeo falló")
+            return
+        self._record(True)
+        total = len(self._window)
+        if total >= self._min_requests and self._window_failures / total >= self._failure_rate:
+            self._open(f"{self._window_failures}/{total} fallos en {self._window_seconds:g} s")
+
+    def release(self) -> None:
+        """Libera un sondeo semiabierto que terminó sin resultado (por ejemplo, cancelado)."""
+        if self.state == CIRCUIT_HALF_OPEN and self._half_open_calls > 0:
+            self._half_open_calls -= 1
+
+    def _record(self, failed: bool) -> None:
+        now = time.monotonic()
+        self._window.append((now, failed))
+        self._window_failures += failed
+        while self._window and now - self._window[0][0] > self._window_seconds:
+            _, expired_failed = self._window.popleft()
+            self._window_failures -= expired_failed
+
+    def _open(self, reason: str) -> None:
+        self.state = CIRCUIT_OPEN
+        self._opened_at = time.monotonic()
+        self._window.clear()
+        self._window_failures = 0
+        self._stats["opened"] += 1
+        logger.warning(f"Circuito {self.name} abierto durante {self._open_seconds:g} s: {reason}.")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve el estado del circuito y sus contadores."""
+        return {"state": self.state, **self._stats}
@@ -1,46 +1,325 @@
-import requests
+import asyncio
+import bisect
+import hashlib
+import json
 import logging
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import httpx
+from src.utils.backend_client import BackendClient, get_backend_client
+from src.utils.destination_search import DestinationSearchIndex
+from src.utils.single_flight import SingleFlight
 
 logger = logging.getLogger(__name__)
 
-DESTINATIONS_API_URL = "http://localhost:3001/api/destinations"
+DESTINATIONS_API_PATH = "/api/destinations"
+DEFAULT_CATALOG_CONFIG: Dict[str, Any] = {
+    "path": DESTINATIONS_API_PATH,
+    "ttl_seconds": 300,
+    "refresh_interval_seconds": 240,
+    "search": {},
+}
 
-def get_all_destinations():
-    """
-    Fetches all destinations from the destinations API.
-    """
-    logger.info(f"Utilizando endpoint: {DESTINATIONS_API_URL}")
-    try:
-        response = requests.get(DESTINATIONS_API_URL)
-        response.raise_for_status()
-        return response.json()
-    except requests.exceptions.RequestException as e:
-        logger.error(f"Error fetching destinations from API: {e}")
-        return None
-
-def get_destinations_by_budget(max_budget: float):
+_destination_catalog: Optional["DestinationCatalog"] = None
+
+
+def _project_destination(d: dict) -> dict:
+    """Proyecta un destino de la API a los campos que usa el asistente."""
+    return {
+        "id": d.get("id"),
+        "name": d.get("name"),
+        "description": d.get("description"),
+        "location": d.get("location"),
+        "latitude": d.get("latitude"),
+        "longitude": d.get("longitude"),
+        "precio": d.get("precio"),
+        "category": d.get("category"),
+        "status": d.get("status"),
+        "createdAt": d.get("createdAt"),
+        "updatedAt": d.get("updatedAt"),
+        "status_code": d.get("status_code")
+    }
+
+
+class DestinationCatalog:
     """
-    Fetches destinations and filters them by a maximum budget.
+    Catálogo de destinos en memoria con caché TTL y refresco en segundo plano.
+
+    Los destinos activos se proyectan una sola vez por refresco y se guardan ordenados
+    por precio, de modo que las consultas por presupuesto se resuelven con una búsqueda
+    binaria. Un índice BM25 (ver `DestinationSearchIndex`) permite buscar por texto libre
+    y se actualiza de forma incremental en cada refresco. La proyección y los índices se
+    construyen en un hilo aparte y se sustituyen de una vez al terminar, sin bloquear el bucle
+    de eventos; lo mismo ocurre con las características derivadas que registren otros módulos
+    (`register_features`), que quedan así ligadas a la versión del catálogo. Las listas
+    devueltas comparten los diccionarios del catálogo y no deben modificarse.
     """
-    logger.info(f"Utilizando endpoint de destinos por presupuesto: {DESTINATIONS_API_URL}")
-    all_destinations = get_all_destinations()
-    if all_destinations:
-        filtered_destinations = []
-        for d in all_destinations:
-            if d.get("status") and d.get("precio") is not None and d.get("precio") <= max_budget:
-                filtered_destinations.append({
-                    "id": d.get("id"),
-                    "name": d.get("name"),
-                    "description": d.get("description"),
-                    "location": d.get("location"),
-                    "latitude": d.get("latitude"),
-                    "longitude": d.get("longitude"),
-                    "precio": d.get("precio"),
-                    "category": d.get("category"),
-                    "status": d.get("status"),
-                    "createdAt": d.get("createdAt"),
-                    "updatedAt": d.get("updatedAt"),
-                    "status_code": d.get("status_code")
-                })
-        return filtered_destinations
-    return []
\ No newline at end of file
+
+    def __init__(self, backend_client: Optional[BackendClient] = None, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            backend_client (Optional[BackendClient]): Cliente compartido del backend.
+            config (Optional[Dict[str, Any]]): Sección `destinations` de la configuración
+                (`path`, `ttl_seconds`, `refresh_interval_seconds`, `search`).
+        """
+        config = {**DEFAULT_CATALOG_CONFIG, **(config or {})}
+        self._backend = backend_client or get_backend_client()
+        self._path: str = config["path"]
+        self._ttl: float = float(config["ttl_seconds"])
+        self._refresh_interval: float = float(config["refresh_interval_seconds"])
+
+        self._destinations: List[dict] = []
+        self._prices: List[float] = []
+        self._by_name: Dict[str, dict] = {}
+        self._by_id: Dict[str, dict] = {}
+        self._search_index = DestinationSearchIndex(config.get("search"))
+        self._feature_builders: Dict[str, Callable[[List[dict]], Any]] = {}
+        self._features: Dict[str, Any] = {}
+        self._fingerprint: Optional[str] = None
+        self._version: int = 0
+        self._loaded_at: Optional[float] = None
+
+        self._refresh_lock = asyncio.Lock()
+        self._refresh_flight = SingleFlight("destination_catalog")
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._background_task: Optional[asyncio.Task] = None
+        self._stats: Dict[str, int] = {"refreshes": 0, "refresh_errors": 0, "stale_reads": 0, "queries": 0}
+
+    @property
+    def version(self) -> int:
+        """Versión del catálogo; se incrementa cada vez que su contenido cambia."""
+        return self._version
+
+    async def get_all(self) -> List[dict]:
+        """Devuelve todos los destinos activos con precio, ordenados por precio."""
+        await self._ensure_loaded()
+        self._stats["queries"] += 1
+        return list(self._destinations)
+
+    async def get_by_budget(self, max_budget: float) -> List[dict]:
+        """
+        Devuelve los destinos activos cuyo precio no supera el presupuesto, ordenados por precio.
+
+        Args:
+            max_budget (float): Presupuesto máximo.
+
+        Returns:
+            List[dict]: Destinos dentro del presupuesto.
+        """
+        await self._ensure_loaded()
+        self._stats["queries"] += 1
+        cut = bisect.bisect_right(self._prices, max_budget)
+        return self._destinations[:cut]
+
+    async def find_by_name(self, name: str) -> Optional[dict]:
+        """Busca un destino activo por su nombre exacto."""
+        await self._ensure_loaded()
+        self._stats["queries"] += 1
+        return self._by_name.get(name)
+
+    async def find_by_id(self, destination_id: str) -> Optional[dict]:
+        """Busca un destino activo por su ID."""
+        await self._ensure_loaded()
+        self._stats["queries"] += 1
+        return self._by_id.get(destination_id)
+
+    async def search(self, query: str, limit: int = 10, max_budget: Optional[float] = None) -> List[Tuple[dict, float]]:
+        """
+        Busca destinos activos por texto libre ("museos en Bogotá") con puntuación BM25.
+
+        Args:
+            query (str): Consulta del usuario.
+            limit (int): Número máximo de resultados.
+            max_budget (Optional[float]): Presupuesto máximo, si se quiere filtrar por precio.
+
+        Returns:
+            List[Tuple[dict, float]]: Pares (destino, puntuación) de mayor a menor relevancia.
+        """
+        await self._ensure_loaded()
+        self._stats["queries"] += 1
+        return self._search_index.search(query, limit, max_budget)
+
+    async def score_query(self, query: str) -> Dict[str, float]:
+        """Puntuación BM25 por ID de los destinos relevantes para la consulta (vacío si ninguno lo es)."""
+        await self._ensure_loaded()
+        self._stats["queries"] += 1
+        return self._search_index.score(query)
+
+    def register_features(self, name: str, builder: Callable[[List[dict]], Any]) -> None:
+        """
+        Registra unas características derivadas del catálogo (por ejemplo, las del ranking).
+
+        Args:
+            name (str): Nombre con el que se piden en `get_features`.
+            builder (Callable[[List[dict]], Any]): Función pura que las construye a partir de los
+                destinos activos. Se ejecuta en un hilo aparte una vez por versión del catálogo.
+        """
+        self._feature_builders[name] = builder
+
+    async def get_features(self, name: str) -> Any:
+        """
+        Devuelve las características registradas como `name` para la versión actual del catálogo.
+        Si se registraron después de la última carga, se construyen ahora en un hilo aparte.
+        """
+        await self._ensure_loaded()
+        features = self._features.get(name)
+        if features is None:
+            features = await self._refresh_flight.do(("features", name, self._version), lambda: self._build_features(name))
+        return features
+
+    async def _build_features(self, name: str) -> Any:
+        """Construye unas características que faltan en la versión actual (ver `get_features`)."""
+        version = self._version
+        destinations = self._destinations
+        features = await asyncio.to_thread(self._feature_builders[name], destinations)
+        if version == self._version:
+            self._features = {**self._features, name: features}
+        return features
+
+    async def _ensure_loaded(self) -> None:
+        """
+        Garantiza que haya datos: la primera vez espera la carga; si están caducados
+        devuelve los actuales y lanza un refresco en segundo plano.
+        """
+        self._start_background_refresh()
+        if self._loaded_at is None:
+            await self.refresh()
+            return
+        if time.monotonic() - self._loaded_at > self._ttl:
+            self._stats["stale_reads"] += 1
+            self._schedule_refresh()
+
+    def _schedule_refresh(self) -> None:
+        """Lanza un refresco en segundo plano si no hay otro en curso."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self.refresh())
+
+    def _start_background_refresh(self) -> None:
+        """Arranca la tarea periódica de refresco la primera vez que se usa el catálogo."""
+        if self._refresh_interval <= 0:
+            return
+        if self._background_task is None or self._background_task.done():
+            self._background_task = asyncio.create_task(self._background_refresh_loop())
+
+    async def _background_refresh_loop(self) -> None:
+        """Refresca el catálogo periódicamente."""
+        while True:
+            await asyncio.sleep(self._refresh_interval)
+            await self.refresh()
+
+    async def refresh(self) -> bool:
+        """
+        Descarga el catálogo completo y reconstruye los índices.
+        Si la descarga falla se conservan los datos anteriores. Las llamadas concurrentes
+        (por ejemplo, varias solicitudes con el catálogo aún vacío) comparten una sola descarga.
+
+        Returns:
+            bool: True si el catálogo se actualizó correctamente.
+        """
+        return await self._refresh_flight.do("refresh", self._refresh)
+
+    async def _refresh(self) -> bool:
+        """Descarga el catálogo y reconstruye los índices (ver `refresh`)."""
+        async with self._refresh_lock:
+            logger.info(f"Actualizando catálogo de destinos desde: {self._backend.base_url}{self._path}")
+            try:
+                response = await self._backend.get(self._path)
+                response.raise_for_status()
+                raw_destinations = response.json()
+            except (httpx.RequestError, httpx.HTTPStatusError, json.JSONDecodeError) as e:
+                self._stats["refresh_errors"] += 1
+                logger.error(f"Error fetching destinations from API: {e}")
+                return False
+
+            snapshot = await asyncio.to_thread(self._build_snapshot, raw_destinations or [])
+            self._loaded_at = time.monotonic()
+            self._stats["refreshes"] += 1
+            if snapshot is None:
+                logger.debug("Catálogo de destinos sin cambios.")
+                return True
+
+            self._destinations = snapshot["destinations"]
+            self._prices = snapshot["prices"]
+            self._by_name = snapshot["by_name"]
+            self._by_id = snapshot["by_id"]
+            self._search_index = snapshot["search_index"]
+            self._features = snapshot["features"]
+            self._fingerprint = snapshot["fingerprint"]
+            self._version += 1
+            logger.info(f"Catálogo de destinos actualizado: {len(self._destinations)} destinos activos (versión {self._version}).")
+            return True
+
+    def _build_snapshot(self, raw_destinations: List[dict]) -> Optional[Dict[str, Any]]:
+        """
+        Proyecta los destinos activos y construye los índices por precio, nombre, ID y texto,
+        además de las características registradas con `register_features`. Se ejecuta en un
+        hilo aparte y no modifica el catálogo actual.
+
+        Returns:
+            Optional[Dict[str, Any]]: Los datos del catálogo nuevo, o None si no ha cambiado.
+        """
+        fingerprint = hashlib.sha1(
+            json.dumps(raw_destinations, sort_keys=True, ensure_ascii=False, default=str).encode("utf-8")
+        ).hexdigest()
+        if fingerprint == self._fingerprint:
+            return None
+
+        destinations = [
+            _project_destination(d)
+            for d in raw_destinations
+            if d.get("status") and d.get("precio") is not None
+        ]
+        destinations.sort(key=lambda d: d["precio"])
+        return {
+            "fingerprint": fingerprint,
+            "destinations": destinations,
+            "prices": [d["precio"] for d in destinations],
+            "by_name": {d["name"]: d for d in destinations if d.get("name")},
+            "by_id": {d["id"]: d for d in destinations if d.get("id")},
+            "search_index": self._search_index.update(destinations),
+            "features": {name: builder(destinations) for name, builder in self._feature_builders.items()},
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve el estado del catálogo para monitorización."""
+        age = time.monotonic() - self._loaded_at if self._loaded_at is not None else None
+        return {
+            **self._stats,
+            "version": self._version,
+            "destinations": len(self._destinations),
+            "age_seconds": round(age, 1) if age is not None else None,
+            "single_flight": self._refresh_flight.get_stats(),
+            "search": self._search_index.get_stats(),
+        }
+
+    async def aclose(self) -> None:
+        """Detiene las tareas de refresco en segundo plano."""
+        for task in (self._background_task, self._refresh_task):
+            if task and not task.done():
+                task.cancel()
+        self._background_task = None
+        self._refresh_task = None
+
+
+def init_destination_catalog(
+    backend_client: Optional[BackendClient] = None,
+    config: Optional[Dict[str, Any]] = None,
+) -> DestinationCatalog:
+    """Crea el catálogo compartido de la aplicación, si aún no existe."""
+    global _destination_catalog
+    if _destination_catalog is None:
+        _destination_catalog = DestinationCatalog(backend_client, config)
+    return _destination_catalog
+
+
+def get_destination_catalog() -> DestinationCatalog:
+    """Devuelve el catálogo compartido, creándolo con la configuración por defecto si es necesario."""
+    return init_destination_catalog()
+
+
+async def close_destination_catalog() -> None:
+    """Detiene el catálogo compartido, si existe."""
+    global _destination_catalog
+    if _destination_catalog is not None:
+        await _destination_catalog.aclose()
+        _destination_catalog = None
@@ -0,0 +1,227 @@
+import heapq
+import logging
+import math
+import re
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+logger = logging.getLogger("DestinationSearch")
+
+DEFAULT_SEARCH_CONFIG: Dict[str, Any] = {
+    "k1": 1.5,
+    "b": 0.75,
+    "field_weights": {"name": 3.0, "category": 2.0, "location": 2.0, "description": 1.0},
+}
+
+SPANISH_STOPWORDS = frozenset("""
+a al algo algun alguna algunas alguno algunos ante antes aqui asi aun bajo bien cada como con contra
+cual cuales cuando de del desde donde dos el ella ellas ello ellos en entre era eran es esa esas ese eso
+esos esta estan estas este esto estos fue fueron ha hacia hay la las le les lo los mas me mi mis mucho
+muy nada ni no nos nosotros o otra otras otro otros para pero poco por porque que quien se sea ser si
+sin sobre solo son su sus tambien te tengo tiene tienen todo todos tu tus un una unas uno unos y ya yo
+quiero busco buscar dame muestrame recomienda recomiendame cerca lugar lugares destino destinos
+""".split())
+
+_TOKEN_REGEX = re.compile(r"\w+")
+# Plurales en -es cuyo singular termina en consonante: "ciudades" -> "ciudad", "volcanes" -> "volcan".
+_PLURAL_ES_REGEX = re.compile(r"(?<=[dlrnzj])es$")
+
+
+def fold_accents(text: str) -> str:
+    """Pasa a minúsculas y quita las tildes ("Bogotá" -> "bogota")."""
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(char for char in text if not unicodedata.combining(char))
+
+
+def _stem(token: str) -> str:
+    """Reduce los plurales más comunes al singular para que "playas" encuentre "playa"."""
+    if len(token) > 4 and _PLURAL_ES_REGEX.search(token):
+        return token[:-2]
+    if len(token) > 3 and token.endswith("s"):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    """Divide un texto en términos de búsqueda: sin tildes, sin palabras vacías y en singular."""
+    if not text:
+        return []
+    return [
+        _stem(token)
+        for token in _TOKEN_REGEX.findall(fold_accents(str(text)))
+        if token not in SPANISH_STOPWORDS and not token.isdigit()
+    ]
+
+
+class DestinationSearchIndex:
+    """
+    Índice invertido en memoria sobre el nombre, la categoría, la ubicación y la descripción
+    de los destinos, con puntuación BM25.
+
+    Las actualizaciones no modifican el índice: `update` devuelve uno nuevo, de modo que puede
+    construirse en un hilo aparte mientras el actual sigue respondiendo consultas. Solo se vuelven
+    a tokenizar los destinos nuevos o modificados; el resto reutiliza sus términos.
+    """
+
+    def __init__(self, config: Optional[Dict[str, Any]] = None):
+        """
+        Args:
+            config (Optional[Dict[str, Any]]): Sección `search` de `destinations`
+                (`k1`, `b` y los pesos `field_weights` de cada campo).
+        """
+        config = config or {}
+        self._config = config
+        self._k1: float = float(config.get("k1", DEFAULT_SEARCH_CONFIG["k1"]))
+        self._b: float = float(config.get("b", DEFAULT_SEARCH_CONFIG["b"]))
+        self._field_weights: Dict[str, float] = {
+            **DEFAULT_SEARCH_CONFIG["field_weights"], **config.get("field_weights", {})
+        }
+
+        # id -> {"destination", "fingerprint", "terms": Counter ponderado, "length"}
+        self._docs: Dict[str, Dict[str, Any]] = {}
+        # término -> {id: frecuencia ponderada}
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._total_length: float = 0.0
+        # id -> k1 * (1 - b + b * longitud / longitud media), recalculado en cada actualización.
+        self._length_norms: Dict[str, float] = {}
+        self._stats: Dict[str, Any] = {
+            "updates": 0,
+            "docs_added": 0,
+            "docs_updated": 0,
+            "docs_removed": 0,
+            "last_update_ms": 0.0,
+            "queries": 0,
+            "query_ms_total": 0.0,
+        }
+
+    def update(self, destinations: Iterable[dict]) -> "DestinationSearchIndex":
+        """
+        Construye el índice del catálogo actual a partir de este, sin modificarlo.
+
+        Args:
+            destinations (Iterable[dict]): Destinos proyectados del catálogo (con `id`).
+
+        Returns:
+            DestinationSearchIndex: Índice nuevo, que comparte las estadísticas con este.
+        """
+        start = time.perf_counter()
+        index = DestinationSearchIndex(self._config)
+        index._stats = self._stats
+        added = updated = 0
+        for destination in destinations:
+            destination_id = destination.get("id")
+            if not destination_id or destination_id in index._docs:
+                continue
+            fingerprint = self._fingerprint(destination)
+            previous = self._docs.get(destination_id)
+            if previous is not None and previous["fingerprint"] == fingerprint:
+                index._insert(destination_id, {**previous, "destination": destination})
+                continue
+            if previous is not None:
+                updated += 1
+            else:
+                added += 1
+            index._insert(destination_id, index._tokenize_doc(destination, fingerprint))
+
+        removed = sum(1 for destination_id in self._docs if destination_id not in index._docs)
+        index._update_length_norms()
+
+        update_ms = (time.perf_counter() - start) * 1000
+        self._stats["updates"] += 1
+        self._stats["docs_added"] += added
+        self._stats["docs_updated"] += updated
+        self._stats["docs_removed"] += removed
+        self._stats["last_update_ms"] = round(update_ms, 2)
+        logger.info(
+            f"Índice de búsqueda actualizado en {update_ms:.1f} ms: {added} nuevos, {updated} modificados, "
+            f"{removed} eliminados ({len(index._docs)} destinos, {len(index._postings)} términos)."
+        )
+        return index
+
+    def search(self, query: str, limit: int = 10, max_price: Optional[float] = None) -> List[Tuple[dict, float]]:
+        """
+        Busca los destinos más relevantes para la consulta.
+
+        Args:
+            query (str): Texto libre ("playas cerca de Cartagena").
+            limit (int): Número máximo de resultados.
+            max_price (Optional[float]): Si se indica, descarta los destinos más caros.
+
+        Returns:
+            List[Tuple[dict, float]]: Pares (destino, puntuación BM25) de mayor a menor puntuación.
+        """
+        start = time.perf_counter()
+        scores = self.score(query)
+        if max_price is not None:
+            scores = {
+                destination_id: score for destination_id, score in scores.items()
+                if (self._docs[destination_id]["destination"].get("precio") or 0) <= max_price
+            }
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        self._stats["queries"] += 1
+        self._stats["query_ms_total"] += (time.perf_counter() - start) * 1000
+        return [(self._docs[destination_id]["destination"], score) for destination_id, score in best]
+
+    def score(self, query: str) -> Dict[str, float]:
+        """Puntuación BM25 de cada destino que contiene algún término de la consulta."""
+        terms = set(tokenize(query))
+        doc_count = len(self._docs)
+        if not terms or not doc_count:
+            return {}
+        norms = self._length_norms
+        scores: Dict[str, float] = {}
+        for term in terms:
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (doc_count - len(postings) + 0.5) / (len(postings) + 0.5))
+            boost = idf * (self._k1 + 1)
+            for destination_id, frequency in postings.items():
+                scores[destination_id] = scores.get(destination_id, 0.0) + boost * frequency / (frequency + norms[destination_id])
+        return scores
+
+    def _update_length_norms(self) -> None:
+        """Precalcula la normalización por longitud de BM25 de cada destino."""
+        if not self._docs:
+            self._length_norms = {}
+            return
+        avg_length = self._total_length / len(self._docs) or 1.0
+        k1, b = self._k1, self._b
+        self._length_norms = {
+            destination_id: k1 * (1 - b + b * doc["length"] / avg_length)
+            for destination_id, doc in self._docs.items()
+        }
+
+    def _tokenize_doc(self, destination: dict, fingerprint: tuple) -> Dict[str, Any]:
+        terms: Counter = Counter()
+        for field, weight in self._field_weights.items():
+            for term in tokenize(destination.get(field)):
+                terms[term] += weight
+        return {
+            "destination": destination,
+            "fingerprint": fingerprint,
+            "terms": terms,
+            "length": sum(terms.values()),
+        }
+
+    def _insert(self, destination_id: str, doc: Dict[str, Any]) -> None:
+        self._docs[destination_id] = doc
+        for term, frequency in doc["terms"].items():
+            self._postings.setdefault(term, {})[destination_id] = frequency
+        self._total_length += doc["length"]
+
+    def _fingerprint(self, destination: dict) -> tuple:
+        """Valores de los campos indexados; si no cambian, el destino no se vuelve a tokenizar."""
+        return tuple(destination.get(field) for field in self._field_weights)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve el tamaño del índice, las actualizaciones y el tiempo medio por consulta."""
+        queries = self._stats["queries"]
+        return {
+            **{key: value for key, value in self._stats.items() if key != "query_ms_total"},
+            "docs": len(self._docs),
+            "terms": len(self._postings),
+            "query_ms_avg": round(self._stats["query_ms_total"] / queries, 3) if queries else 0.0,
+        }
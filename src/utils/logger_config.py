@@ -31,6 +31,18 @@ class ColoredFormatter(logging.Formatter):
         'UserManager': '\033[38;5;160m',           # Rojo brillante para UserManager
         'PromptCreator': '\033[38;5;226m',         # Amarillo brillante para PromptCreator
         'PromptLoader': '\033[38;5;198m',          # Rosa vibrante para PromptLoader
+        'MarkerParser': '\033[38;5;51m',           # Cian para el filtro de marcadores
+        'BackendClient': '\033[38;5;39m',          # Azul cielo para el cliente del backend
+        'ResponseCache': '\033[38;5;141m',         # Lila para la caché de respuestas
+        'HistoryStore': '\033[38;5;173m',          # Ocre para el historial de conversación
+        'SingleFlight': '\033[38;5;244m',          # Gris para la agrupación de llamadas
+        'LLMScheduler': '\033[38;5;208m',          # Naranja para el planificador del LLM
+        'IntentRouter': '\033[38;5;117m',          # Azul claro para el enrutador de intenciones
+        'DestinationRanker': '\033[38;5;70m',      # Verde oliva para el ranking de destinos
+        'DestinationSearch': '\033[38;5;72m',      # Verde mar para la búsqueda de destinos
+        'ContextBudget': '\033[38;5;180m',         # Arena para el presupuesto de contexto
+        'ConversationSummarizer': '\033[38;5;139m', # Malva para los resúmenes de conversación
+        'CircuitBreaker': '\033[38;5;196m',        # Rojo para los circuitos del backend
         'root': '\033[38;5;240m',                  # Gris oscuro
     }
 
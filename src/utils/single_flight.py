@@ -0,0 +1,64 @@
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+
+logger = logging.getLogger("SingleFlight")
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes idénticas en una sola ejecución.
+
+    Mientras una llamada con una clave está en curso, las siguientes con la misma clave
+    no vuelven a ejecutarla: esperan el mismo resultado (o la misma excepción). Cuando
+    termina, la clave se libera y la siguiente llamada ejecuta de nuevo la operación.
+    """
+
+    def __init__(self, name: str):
+        """
+        Args:
+            name (str): Nombre para los logs y las métricas.
+        """
+        self.name = name
+        self._in_flight: Dict[Hashable, asyncio.Future] = {}
+        self._stats: Dict[str, int] = {"calls": 0, "executions": 0, "coalesced": 0, "errors": 0}
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """
+        Ejecuta `func` o se une a la ejecución en curso con la misma clave.
+
+        La ejecución compartida está protegida frente a cancelaciones: si un llamador se
+        cancela, los demás siguen esperando el resultado.
+
+        Args:
+            key (Hashable): Clave que identifica la operación.
+            func (Callable[[], Awaitable[T]]): Función que lanza la operación.
+
+        Returns:
+            T: Resultado de la operación, compartido por todos los llamadores.
+        """
+        self._stats["calls"] += 1
+        future = self._in_flight.get(key)
+        if future is not None:
+            self._stats["coalesced"] += 1
+            logger.debug(f"[{self.name}] Llamada agrupada con otra en curso: {key}")
+            return await asyncio.shield(future)
+
+        self._stats["executions"] += 1
+        future = asyncio.ensure_future(func())
+        self._in_flight[key] = future
+        future.add_done_callback(lambda done: self._release(key, done))
+        return await asyncio.shield(future)
+
+    def _release(self, key: Hashable, future: asyncio.Future) -> None:
+        """Libera la clave al terminar la ejecución y cuenta los errores."""
+        if self._in_flight.get(key) is future:
+            del self._in_flight[key]
+        if not future.cancelled() and future.exception() is not None:
+            self._stats["errors"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores de llamadas, ejecuciones reales y llamadas agrupadas."""
+        return {**self._stats, "in_flight": len(self._in_flight)}